@@ -1,21 +1,22 @@
+import logging
 import os
-import re
-from flask import Flask, request, jsonify, send_from_directory, render_template
+import time
+from stat import S_ISREG
+from flask import Flask, request, jsonify, send_file, render_template, g
+from werkzeug.security import safe_join
 from flask_cors import CORS
 from rank_bm25 import BM25Okapi
 import requests
 # IMPORT NOTE: thêm class mới vào src và import nó
-from src import RetrievalSystemSiglipNoCap, OCRRetrievalES, SpeechRetrievalES
+from src import OCRRetrievalES, SpeechRetrievalES, EmbeddingCache, ModelRegistry, ModelSpec, FusionSearcher, sequence_search, EfSelector, ResultCursorStore
+from src import is_valid_pack, is_valid_video, ScopeError, KeyframeManifest, TranslatorModule, build_translation_backend
+from src import reconnect_milvus, set_encode_workers
+from src import ResponseEncoder, SampledLogger, not_modified, ThumbnailCache, WarmupRunner
+from src import stage, start_request, current_timings, observe_request, render_prometheus
+from src import build_search_response, build_compact_response, video_frames_blueprint
+from src import HybridSearcher, HYBRID_SOURCES, default_hybrid_weights, ocr_ranked, asr_ranked
 import config
-from googletrans import Translator
-
-class TranslatorModule:
-    def __init__(self):
-        self.translator = Translator()
-    def translate(self, text):
-        translated = self.translator.translate(text,src='vi',dest='en')
-        return translated.text
-    
+
 
 # --- HELPER FUNCTION ---
 def normalize_scores(scores):
@@ -27,39 +28,157 @@ def normalize_scores(scores):
     return [(score - min_score) / (max_score - min_score) for score in scores]
 
 print("--- Starting Application ---")
+if not logging.getLogger().handlers:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+IMPORT_PID = os.getpid()  # process đã import app (process cha khi gunicorn preload_app)
 
-# --- Khởi tạo retrievers ---
-# retrieval_service_openclip = RetrievalSystem(
-#     model_name=config.MODEL_NAME_OPENCLIP,
-#     pretrained=config.PRETRAINED_OPENCLIP,
-#     milvus_host=config.MILVUS_HOST,
-#     milvus_port=config.MILVUS_PORT,
-#     collection_name_hnsw=config.COLLECTION_HNSW_OPENCLIP
-# )
-
-# retrieval_service_siglip = RetrievalSystem(
-#     model_name=config.MODEL_NAME_SIGLIP,
-#     pretrained=config.PRETRAINED_SIGLIP,
-#     milvus_host=config.MILVUS_HOST,
-#     milvus_port=config.MILVUS_PORT,
-#     collection_name_hnsw=config.COLLECTION_HNSW_SIGLIP
-# )
 OCR_JSON_DIR = r"D:\Workplace\AIC_2025\Data\AUDIO_RECOGNIZATION"
-translator_module = TranslatorModule()
+# Dịch vi -> en: có cache, bỏ qua query tiếng Anh, quá timeout thì dùng nguyên văn
+translator_module = TranslatorModule(
+    build_translation_backend(config.TRANSLATION_BACKEND),
+    cache_size=config.TRANSLATION_CACHE_SIZE,
+    cache_path=config.TRANSLATION_CACHE_PATH,
+    timeout_sec=config.TRANSLATION_TIMEOUT_SEC
+)
 
-# --- new: SigLip no-caption retriever (class bạn đã viết) ---
-retrieval_service_siglip_nocap = RetrievalSystemSiglipNoCap(
-    model_name=config.MODEL_NAME_SIGLIP,
-    pretrained=config.PRETRAINED_SIGLIP,
+# Cache embedding dùng chung cho mọi retriever (key đã gồm tên model)
+embedding_cache = EmbeddingCache(
+    max_size=config.EMBEDDING_CACHE_SIZE,
+    store_path=config.EMBEDDING_CACHE_PATH
+)
+
+# --- Khởi tạo retrievers (lazy: model chỉ load khi mode được query lần đầu) ---
+def numpy_source(sub_dir, dim, features_pattern, mapping_pattern):
+    """Tham số NumpyCollection cho 1 model (chỉ dùng khi VECTOR_BACKEND = "numpy")."""
+    return {
+        "features_dir": os.path.join(config.FEATURES_BASE_DIR, sub_dir),
+        "packs": config.PACKS,
+        "dim": dim,
+        "keyframes_base_dir": config.KEYFRAMES_BASE_DIR,
+        "features_pattern": features_pattern,
+        "mapping_pattern": mapping_pattern,
+        "ivf_nlist": config.NUMPY_IVF_NLIST,
+        "ivf_cache_path": f"cache/ivf_{sub_dir}.npz" if config.NUMPY_IVF_NLIST else None,
+    }
+
+MODEL_SPECS = {
+    "OPENCLIP_COLLECTION": ModelSpec(
+        kind="openclip",
+        model_name=config.MODEL_NAME_OPENCLIP,
+        pretrained=config.PRETRAINED_OPENCLIP,
+        collection_name=config.COLLECTION_HNSW_OPENCLIP,
+        numpy_source=numpy_source("OpenCLIP_L14", 768, "{pack}_features.npy", "{pack}_mapping.json")
+    ),
+    "SIGLIP_COLLECTION": ModelSpec(
+        kind="siglip_nocap",
+        model_name=config.MODEL_NAME_SIGLIP,
+        pretrained=config.PRETRAINED_SIGLIP,
+        collection_name=config.COLLECTION_HNSW_FINAL_FIRST_G,
+        numpy_source=numpy_source("SigLip", 1152,
+                                  "{pack}_ViT-SO400M-14-SigLIP-384_features.npy",
+                                  "{pack}_ViT-SO400M-14-SigLIP-384_mapping.json"),
+        extra={"text_encoder_mode": config.TEXT_ENCODER_MODE,
+               "onnx_path": config.TEXT_ENCODER_ONNX_PATH}
+    ),
+    "APPLE_COLLECTION": ModelSpec(
+        kind="apple",
+        model_name=config.MODEL_NAME_APPLE,
+        collection_name=config.COLLECTION_HNSW_APPLE,
+        numpy_source=numpy_source("Apple_Feature", 1024, "{pack}.npy", "{pack}_Apple_mapping.json")
+    ),
+}
+model_registry = ModelRegistry(
+    MODEL_SPECS,
     milvus_host=config.MILVUS_HOST,
     milvus_port=config.MILVUS_PORT,
-    collection_name_hnsw=config.COLLECTION_HNSW_FINAL_FIRST_G  # cần có trong config
+    embedding_cache=embedding_cache,
+    idle_unload_sec=config.MODEL_IDLE_UNLOAD_SEC,
+    vector_backend=config.VECTOR_BACKEND
+)
+model_registry.preload(config.PRELOAD_MODELS)
+
+# mode="FUSION": chạy song song nhiều model rồi gộp ranking
+FUSION_MODE = "FUSION"
+fusion_searcher = FusionSearcher(
+    model_registry,
+    max_workers=config.FUSION_WORKERS or len(MODEL_SPECS) * config.SERVER_THREADS,
+    rrf_k=config.RRF_K
+)
+
+# ef nhỏ nhất đạt recall mục tiêu theo bảng đã tune (fallback ef = k * 3)
+ef_selector = EfSelector(config.HNSW_EF_TABLE_PATH, recall_target=config.HNSW_RECALL_TARGET)
+
+
+# Hybrid text + OCR + ASR: chạy song song rồi fusion có trọng số (mặc định theo ALPHA)
+HYBRID_WEIGHTS = config.HYBRID_WEIGHTS or default_hybrid_weights(config.ALPHA)
+hybrid_searcher = HybridSearcher()
+
+
+# Encode response: orjson + gzip/brotli, log 1 dòng tóm tắt (lấy mẫu) thay vì print kết quả
+response_encoder = ResponseEncoder(
+    min_compress_bytes=config.RESPONSE_COMPRESS_MIN_BYTES,
+    gzip_level=config.RESPONSE_GZIP_LEVEL,
+    brotli_quality=config.RESPONSE_BROTLI_QUALITY,
+    enabled=config.RESPONSE_COMPRESS,
+    logger=SampledLogger("aic.search", sample_rate=config.RESPONSE_LOG_SAMPLE_RATE)
 )
+
+
+# Ranked list "sâu" theo query để trả trang / k nhỏ hơn mà không search lại
+result_cursors = ResultCursorStore(max_entries=config.CURSOR_MAX_ENTRIES, ttl_sec=config.CURSOR_TTL_SEC,
+                                   min_depth=config.CURSOR_MIN_DEPTH, overfetch=config.CURSOR_OVERFETCH)
+
+
+def cursor_info(entry, offset, k):
+    """Thông tin cursor trả kèm response để frontend phân trang."""
+    return {
+        "cursor": entry.cursor_id,
+        "offset": offset,
+        "k": k,
+        "has_more": (not entry.exhausted) or len(entry.ranked) > offset + k
+    }
+
+
+def hybrid_weights(args):
+    """Trọng số hybrid: mặc định theo config.ALPHA, ghi đè bằng w_text / w_ocr / w_asr."""
+    weights = dict(HYBRID_WEIGHTS)
+    for name in HYBRID_SOURCES:
+        if args.get(f"w_{name}") is not None:
+            weights[name] = float(args.get(f"w_{name}"))
+            if weights[name] < 0:
+                raise ValueError(f"w_{name} phải >= 0")
+    return weights
+
+
+def parse_scope_args(args):
+    """
+    packs=L21,L22 & videos=L21_V001 -> (packs, videos) để search chỉ trong các partition đó.
+    Giá trị sai định dạng -> ValueError.
+    """
+    packs = [p for p in args.get("packs", "").split(",") if p]
+    videos = [v for v in args.get("videos", "").split(",") if v]
+    bad = [p for p in packs if not is_valid_pack(p)] + [v for v in videos if not is_valid_video(v)]
+    if bad:
+        raise ValueError(f"packs / videos không hợp lệ: {bad}")
+    return packs, videos
+
+
+def hnsw_search_params(k, modes):
+    """search_params cho Milvus; nhiều model (fusion) thì lấy ef lớn nhất."""
+    ef = max(ef_selector.select(k, MODEL_SPECS[m].collection_name) for m in modes)
+    return {"params": {"ef": ef}}
+
 ocr_retriever = OCRRetrievalES(
         ocr_json_dir=OCR_JSON_DIR,
         host="http://localhost:9200",
         index_name="ocr_index_main",
         load_data=False)
+# Danh sách keyframe theo video trong RAM (thay os.listdir mỗi request)
+keyframe_manifest = KeyframeManifest(config.KEYFRAMES_BASE_DIR, cache_path=config.KEYFRAME_MANIFEST_PATH)
+# Thumbnail WebP cho gallery, tạo khi truy cập lần đầu (hoặc trước bằng utils/generate_thumbnails.py)
+thumbnail_cache = ThumbnailCache(config.IMAGE_BASE_PATH, config.THUMBNAIL_CACHE_DIR,
+                                 sizes=config.THUMBNAIL_SIZES, quality=config.THUMBNAIL_QUALITY)
+
 AUDIO_DIR = r"D:\Workplace\AIC_2025\Data\AUDIO_RECOGNIZATION"
 KEYFRAME_DIR = r"D:\Workplace\AIC_2025\Data\Keyframes"
 audio_retriever = SpeechRetrievalES(
@@ -68,271 +187,283 @@ audio_retriever = SpeechRetrievalES(
         host="http://localhost:9200",
         index_name="speech_index",
         use_semantic=False,
-        load_data=False
+        load_data=False,
+        keyframe_manifest=keyframe_manifest
     )
-# retrieval_service_apple = RetrievalSystemApple(
-#     model_name=config.MODEL_NAME_APPLE,
-#     milvus_host=config.MILVUS_HOST,
-#     milvus_port=config.MILVUS_PORT,
-#     collection_name_hnsw=config.COLLECTION_HNSW_APPLE
-# )
+
+
+def init_worker():
+    """
+    Khởi tạo phần KHÔNG được chia sẻ qua fork, gọi 1 lần trong mỗi process phục vụ request
+    (python app.py, hoặc lifespan startup của từng worker trong asgi.py):
+    - thread nền (unload model idle, refresh keyframe manifest)
+    - executor encode giới hạn số lần encode đồng thời
+    - connection Milvus / Elasticsearch mở ở process cha (preload_app) thì mở lại
+      (SQLite của translation / embedding cache tự mở lại theo pid, xem LRUCache)
+    """
+    if config.TORCH_NUM_THREADS:
+        import torch
+        torch.set_num_threads(config.TORCH_NUM_THREADS)
+    set_encode_workers(config.ENCODE_WORKERS)
+    if os.getpid() != IMPORT_PID:
+        # Process con sau fork: connection của process cha không dùng chung được
+        if config.VECTOR_BACKEND == "milvus" and \
+                any(model_registry.is_loaded(name) for name in model_registry.names()):
+            reconnect_milvus(config.MILVUS_HOST, config.MILVUS_PORT)
+        ocr_retriever.reconnect()
+        audio_retriever.reconnect()
+    model_registry.start_idle_reaper()
+    keyframe_manifest.start_auto_refresh(config.KEYFRAME_MANIFEST_REFRESH_SEC)
+    # Warmup sau fork (executor encode / connection là của từng worker), chạy nền, xem /readyz
+    register_warmup()
+    if config.WARMUP_ENABLED:
+        warmup_runner.start()
+    else:
+        warmup_runner.skip()
+    print(f"✅ Worker {os.getpid()} started.")
+
+
+# Trạng thái warmup / readiness của process (/healthz, /readyz)
+warmup_runner = WarmupRunner()
+START_TIME = time.time()
+
+
+def warm_model(name):
+    """Forward pass thật của text encoder (bỏ qua embedding cache) + search Milvus với query mẫu."""
+    retriever = model_registry.get(name)
+    retriever._forward_texts(config.WARMUP_QUERIES)
+    search_params = hnsw_search_params(config.WARMUP_K, [name])
+    for query in config.WARMUP_QUERIES:
+        retriever.search(query=query, k=config.WARMUP_K, search_params=search_params)
+
+
+def register_warmup():
+    """
+    Model mặc định (PRELOAD_MODELS, rỗng thì DEFAULT_MODE) + model đã load là bắt buộc:
+    warmup load luôn model chưa load => request /search đầu tiên không phải chờ load model / collection.
+    ES và dịch lỗi thì chỉ degraded.
+    """
+    query = config.WARMUP_QUERIES[0]
+    required_models = list(config.PRELOAD_MODELS or [config.DEFAULT_MODE])
+    required_models += [name for name in model_registry.names()
+                        if model_registry.is_loaded(name) and name not in required_models]
+    for name in required_models:
+        warmup_runner.add(f"model:{name}", lambda name=name: warm_model(name))
+    warmup_runner.add("ocr_es", lambda: ocr_retriever.search(query, top_k=10, use_fuzzy=True), required=False)
+    warmup_runner.add("asr_es", lambda: audio_retriever.search(query, k=10, use_fuzzy=True), required=False)
+    warmup_runner.add("translation", lambda: translator_module.translate(query), required=False)
+
 
 print("--- Application Started ---")
 
 app = Flask(__name__)
+app.config["USE_X_SENDFILE"] = config.USE_X_SENDFILE
+
+
+@app.before_request
+def _mark_request_start():
+    g.start_time = time.perf_counter()
+    start_request()   # bảng thời gian từng stage của request (trả về khi debug=1)
+
+
+@app.after_request
+def _observe_request(response):
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    observe_request(endpoint, response.status_code, time.perf_counter() - g.start_time)
+    return response
+
+
 CORS(app)
-def get_video_id_from_path(path: str):
-    """
-    Trích xuất 'Lxx_Vyyy' (hoặc Kxx_Vyyy) ở bất kỳ đâu trong path.
-    Ví dụ: 'L21/L21_V001/000000.webp' -> 'L21_V001'
-    """
-    safe = path.replace("\\", "/")
-    # Mở rộng để bắt cả Lxx_Vyyy và Kxx_Vyyy
-    m = re.search(r"([LK]\d+_V\d+)", safe)
-    return m.group(1) if m else None
+def to_keyframe_rel_path(path: str) -> str:
+    """Path tuyệt đối từ OCR / ASR -> 'Lxx/Lxx_Vyyy/000123.webp' (giống path trong Milvus)."""
+    return path.replace("\\", "/").split("Keyframes/", 1)[-1].rsplit(".", 1)[0] + ".webp"
+
+
+def render_results(ranked, compact):
+    """Body JSON của /search: đầy đủ (mặc định) hoặc gọn (compact=1)."""
+    with stage("render"):
+        if compact:
+            return build_compact_response(ranked)
+        frame_results, video_results_list = build_search_response(ranked, keyframe_manifest.all_frames)
+        return {"frame_results": frame_results, "video_results": video_results_list}
+
+
+def json_response(obj, status=200, headers=None, log_fields=None):
+    """JSON (orjson) + nén theo Accept-Encoding; log_fields != None => ghi 1 dòng log (lấy mẫu)."""
+    if log_fields is not None:
+        log_fields = {
+            "path": request.path,
+            "elapsed_ms": round((time.perf_counter() - g.start_time) * 1000, 1),
+            **log_fields
+        }
+    with stage("response_encode"):
+        return response_encoder.json(obj, status=status, headers=headers,
+                                     accept_encoding=request.headers.get("Accept-Encoding"),
+                                     log_fields=log_fields)
+
+
+def search_response(branch, k, offset, body):
+    """Response /search + log tóm tắt (nhánh, k, số kết quả) thay vì print toàn bộ kết quả."""
+    n_results = len(body.get("frame_order", body.get("frame_results", [])))
+    if request.args.get("debug", "0") in ("1", "true"):
+        # Chưa gồm response_encode (chạy sau khi body đã chốt), xem /metrics cho stage đó
+        body["debug"] = {
+            "timings": current_timings().as_dict(),
+            "elapsed_ms": round((time.perf_counter() - g.start_time) * 1000, 1),
+        }
+    return json_response(body, log_fields={
+        "branch": branch, "k": k, "offset": offset, "results": n_results,
+        "compact": bool(body.get("compact")), "query": request.args.get("query"),
+    })
+
+
+def page_of(entry, offset, k, normalize):
+    """Cắt 1 trang [offset, offset+k) từ ranked list của cursor."""
+    ranked = entry.ranked[:offset + k]
+    if normalize and ranked:
+        # Chuẩn hóa trên [0, offset+k) => trang đầu giống hệt khi search thẳng với k
+        norm_scores = normalize_scores([score for _, score in ranked])
+        ranked = [(path, norm_scores[i]) for i, (path, _) in enumerate(ranked)]
+    return ranked[offset:]
+
 
 @app.route("/search", methods=["GET"])
 def search_endpoint():
     try:
         # --- A. Params ---
-        query = request.args.get("query")
-        query = translator_module.translate(query)
+        raw_query = request.args.get("query")
         ocr = request.args.get("ocr")
         audio = request.args.get("colors")
         
-        if not query:
+        if not raw_query:
             return jsonify({"error": "Thiếu tham số 'query'."}), 400
 
         k_value = int(request.args.get("k", 500))
-        ef_value = k_value*3
-        search_params = {"params": {"ef": ef_value}}
+        # Phân trang: trang = ranked[offset : offset + k], cursor = id ranked list đã lưu phía server
+        offset = max(0, int(request.args.get("offset", 0)))
+        cursor_id = request.args.get("cursor")
+        # compact=1: chỉ trả frame number theo video, all_frames lấy qua /video/<video_id>/frames
+        compact = request.args.get("compact", "0") in ("1", "true")
 
         # --- B. Chọn retriever theo mode ---
-        mode = request.args.get("mode", "SIGLIP_COLLECTION")  # default = apple
-
-
-        # --- C. Vector search ---
-        if query != 'a':
-            initial_results = retrieval_service_siglip_nocap.search(
-                query=query,
-                k=k_value,
-                search_params=search_params
-            )
-            paths = [res[0] for res in initial_results] 
-            clip_scores = [res[1] for res in initial_results]
-
-            reranked_results = []
-
-            if mode == "SIGLIP_COLLECTION":
-                # Không có caption => bỏ qua BM25, chỉ dùng normalized clip score
-                norm_clip_scores = normalize_scores(clip_scores)
-                for i, p in enumerate(paths):
-                    reranked_results.append({"path": p, "score": norm_clip_scores[i]})
-
-            reranked_results.sort(key=lambda x: x["score"], reverse=True)
-            # --- E. Chuẩn bị dữ liệu trả về ---
-            path_to_score_map = {item["path"]: item["score"] for item in reranked_results}
-            final_paths = [item["path"] for item in reranked_results]
-            # 1) frame_results
-            frame_results = []
-            for path in final_paths:
-                score = path_to_score_map.get(path, 0)
-                frame_results.append({
-                    "path": f"/images/Keyframes/{path}",
-                    "score": score
-                })
-
-            # 2) group theo video
-            videos_data = {}
-            for rank, path in enumerate(final_paths):
-                video_id = get_video_id_from_path(path)
-                if not video_id:
-                    continue
-                if video_id not in videos_data:
-                    videos_data[video_id] = {
-                        "frames": [],
-                        "best_rank": rank,
-                        "video_score": path_to_score_map.get(path, 0)
-                    }
-                videos_data[video_id]["frames"].append(path)
-
-            # 3) build video_results + all_frames
-            video_results_list = []
-            for video_id, data in videos_data.items():
-                video_frames = []
-                for p in data["frames"]:
-                    score = path_to_score_map.get(p, 0)
-                    video_frames.append({
-                        "path": f"/images/Keyframes/{p}",
-                        "score": score
-                    })
-
-                level_dir = video_id.split("_")[0]
-                video_dir = os.path.join(config.IMAGE_BASE_PATH, "Keyframes", level_dir, video_id)
-                all_frames = []
-                if os.path.exists(video_dir):
-                    for fname in sorted(os.listdir(video_dir)):
-                        if fname.lower().endswith((".jpg", ".jpeg", ".png", ".webp")):
-                            rel_path = f"/images/Keyframes/{level_dir}/{video_id}/{fname}"
-                            all_frames.append(rel_path)
-
-                video_results_list.append({
-                    "video_id": video_id,
-                    "video_score": data["video_score"],
-                    "best_rank": data["best_rank"],
-                    "frames": video_frames,
-                    "all_frames": all_frames
-                })
-
-            video_results_list.sort(key=lambda x: x["best_rank"])
-            print(frame_results,"Frame_RESULT_FINAL")
-            print(video_results_list,"video_results_list_FINAL")
+        mode = request.args.get("mode", config.DEFAULT_MODE)
+        if mode not in MODEL_SPECS and mode != FUSION_MODE:
+            return jsonify({"error": f"Mode '{mode}' không hợp lệ."}), 400
+
+        # Fusion: models=SIGLIP_COLLECTION,APPLE_COLLECTION & fusion=rrf|weighted
+        fusion_models = [m for m in request.args.get("models", ",".join(config.FUSION_MODELS)).split(",") if m]
+        fusion_method = request.args.get("fusion", config.FUSION_METHOD)
+        if mode == FUSION_MODE and any(m not in MODEL_SPECS for m in fusion_models):
+            return jsonify({"error": f"models không hợp lệ: {fusion_models}"}), 400
+
+        # Phạm vi: packs=L21,L22 & videos=L21_V001 (chỉ áp dụng cho vector search)
+        try:
+            packs, videos = parse_scope_args(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        # Dịch trước khi tra cursor (có cache => trang sau / đổi k gần như không tốn gì).
+        # Signature dùng câu đã dịch: dịch lỗi / quá timeout thì trả nguyên văn => signature khác,
+        # kết quả search bằng câu chưa dịch không bị dùng lại cho query khi dịch được.
+        query = translator_module.translate(raw_query) if raw_query != "a" else raw_query
+
+        # --- C. Các nguồn search (mỗi hàm nhận depth = số kết quả cần) ---
+        def vector_search(depth):
+            search_params = hnsw_search_params(depth, fusion_models if mode == FUSION_MODE else [mode])
+            if mode == FUSION_MODE:
+                initial_results = fusion_searcher.search(
+                    query=query,
+                    model_names=fusion_models,
+                    k=depth,
+                    search_params=search_params,
+                    method=fusion_method,
+                    weights=config.FUSION_WEIGHTS,
+                    packs=packs,
+                    videos=videos
+                )
+            else:
+                retriever = model_registry.get(mode)
+                initial_results = retriever.search(
+                    query=query,
+                    k=depth,
+                    search_params=search_params,
+                    packs=packs,
+                    videos=videos
+                )
+            # Chưa dùng caption => bỏ qua BM25, sort theo clip score (chuẩn hóa khi cắt trang)
+            return sorted(((res[0], res[1]) for res in initial_results), key=lambda x: x[1], reverse=True)
+
+        def ocr_scored(depth):
+            return ocr_ranked(ocr_retriever, ocr, depth, to_keyframe_rel_path)
+
+        def asr_scored(depth):
+            # depth là số frame, mỗi đoạn thoại trải ra nhiều frame => depth đoạn là đủ; HYBRID_ASR_K là mức tối thiểu
+            return asr_ranked(audio_retriever, audio, max(depth, config.HYBRID_ASR_K), to_keyframe_rel_path)
+
+        # --- D. Hybrid: >= 2 trong query / ocr / colors(audio) => chạy song song + fusion ---
+        active = [name for name, q in (("text", raw_query), ("ocr", ocr), ("asr", audio)) if q and q != "a"]
+        if len(active) >= 2:
+            try:
+                weights = hybrid_weights(request.args)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            source_fns = {"text": vector_search, "ocr": ocr_scored, "asr": asr_scored}
+
+            def hybrid_search(depth):
+                return hybrid_searcher.search(
+                    {name: (lambda fn=source_fns[name]: fn(depth)) for name in active},
+                    weights, k=depth
+                )
+
+            signature = ("hybrid", mode, tuple(fusion_models), fusion_method, query, ocr, audio,
+                         tuple(sorted(weights.items())), tuple(sorted(packs)), tuple(sorted(videos)))
+            entry = result_cursors.get_ranked(signature, offset + k_value, hybrid_search, cursor_id)
+            ranked = page_of(entry, offset, k_value, normalize=True)
+
+            return search_response(branch="hybrid", k=k_value, offset=offset, body={
+                **render_results(ranked, compact),
+                **cursor_info(entry, offset, k_value),
+                "hybrid": {"sources": active, "weights": weights}
+            })
 
-            
-            return jsonify({
-                "frame_results": frame_results,
-                "video_results": video_results_list
+        # --- E. 1 nguồn ---
+        if raw_query != 'a':
+            signature = ("vector", mode, tuple(fusion_models), fusion_method, query,
+                         tuple(sorted(packs)), tuple(sorted(videos)))
+            entry = result_cursors.get_ranked(signature, offset + k_value, vector_search, cursor_id)
+            ranked = page_of(entry, offset, k_value, normalize=True)
+
+            return search_response(branch="text", k=k_value, offset=offset, body={
+                **render_results(ranked, compact),
+                **cursor_info(entry, offset, k_value)
             })
         elif ocr!="a":
-            ocr_results = ocr_retriever.search(ocr, top_k=k_value, use_fuzzy=True)
-            initial_results = ocr_retriever.display_results(ocr_results, k_value)
-            final_paths = [path.replace("\\", "/").split("Keyframes/", 1)[-1].rsplit(".", 1)[0] + ".webp"
- for path in initial_results]
-            # 1) frame_results
-            frame_results = []
-            for path in final_paths:
-                frame_results.append({
-                    "path": f"/images/Keyframes/{path}",
-                    "score": None
-                })
-
-            # 2) group theo video
-            videos_data = {}
-            for rank, path in enumerate(final_paths):
-                video_id = get_video_id_from_path(path)
-                if not video_id:
-                    continue
-                if video_id not in videos_data:
-                    videos_data[video_id] = {
-                        "frames": [],
-                        "best_rank": rank,
-                        "video_score": None
-                    }
-                videos_data[video_id]["frames"].append(path)
-
-            # 3) build video_results + all_frames
-            video_results_list = []
-            for video_id, data in videos_data.items():
-                video_frames = []
-                for p in data["frames"]:
-                    score = None
-                    video_frames.append({
-                        "path": f"/images/Keyframes/{p}",
-                        "score": score
-                    })
-
-                level_dir = video_id.split("_")[0]
-                video_dir = os.path.join(config.IMAGE_BASE_PATH, "Keyframes", level_dir, video_id)
-                all_frames = []
-                if os.path.exists(video_dir):
-                    for fname in sorted(os.listdir(video_dir)):
-                        if fname.lower().endswith((".jpg", ".jpeg", ".png", ".webp")):
-                            rel_path = f"/images/Keyframes/{level_dir}/{video_id}/{fname}"
-                            all_frames.append(rel_path)
-
-                video_results_list.append({
-                    "video_id": video_id,
-                    "video_score": data["video_score"],
-                    "best_rank": data["best_rank"],
-                    "frames": video_frames,
-                    "all_frames": all_frames
-                })
-
-            video_results_list.sort(key=lambda x: x["best_rank"])
-            print(frame_results[:2],"Frame_RESULT_FINAL")
-            
+            def ocr_search(depth):
+                ocr_results = ocr_retriever.search(ocr, top_k=depth, use_fuzzy=True)
+                initial_results = ocr_retriever.display_results(ocr_results, depth)
+                return [(to_keyframe_rel_path(path), None) for path in initial_results]
 
-            
-            return jsonify({
-                "frame_results": frame_results,
-                "video_results": video_results_list
+            entry = result_cursors.get_ranked(("ocr", ocr), offset + k_value, ocr_search, cursor_id)
+            ranked = page_of(entry, offset, k_value, normalize=False)
+
+            return search_response(branch="ocr", k=k_value, offset=offset, body={
+                **render_results(ranked, compact),
+                **cursor_info(entry, offset, k_value)
             })
         elif audio!="a":
+            # Mỗi hit ASR là 1 đoạn nhiều frame nên k = số đoạn, không cắt trang theo frame được
             results = audio_retriever.search_with_frames(audio, k=k_value, use_fuzzy=True)
         
         # Get paths
             initial_results = audio_retriever.get_keyframe_paths(results, mode="keyword", top_k=k_value)
             
-            final_paths = [path.replace("\\", "/").split("Keyframes/", 1)[-1].rsplit(".", 1)[0] + ".webp"
- for path in initial_results]
-            # 1) frame_results
-            frame_results = []
-            for path in final_paths:
-                frame_results.append({
-                    "path": f"/images/Keyframes/{path}",
-                    "score": None
-                })
-
-            # 2) group theo video
-            videos_data = {}
-            for rank, path in enumerate(final_paths):
-                video_id = get_video_id_from_path(path)
-                if not video_id:
-                    continue
-                if video_id not in videos_data:
-                    videos_data[video_id] = {
-                        "frames": [],
-                        "best_rank": rank,
-                        "video_score": None
-                    }
-                videos_data[video_id]["frames"].append(path)
-
-            # 3) build video_results + all_frames
-            video_results_list = []
-            for video_id, data in videos_data.items():
-                video_frames = []
-                for p in data["frames"]:
-                    score = None
-                    video_frames.append({
-                        "path": f"/images/Keyframes/{p}",
-                        "score": score
-                    })
-
-                level_dir = video_id.split("_")[0]
-                video_dir = os.path.join(config.IMAGE_BASE_PATH, "Keyframes", level_dir, video_id)
-                all_frames = []
-                if os.path.exists(video_dir):
-                    for fname in sorted(os.listdir(video_dir)):
-                        if fname.lower().endswith((".jpg", ".jpeg", ".png", ".webp")):
-                            rel_path = f"/images/Keyframes/{level_dir}/{video_id}/{fname}"
-                            all_frames.append(rel_path)
-
-                video_results_list.append({
-                    "video_id": video_id,
-                    "video_score": data["video_score"],
-                    "best_rank": data["best_rank"],
-                    "frames": video_frames,
-                    "all_frames": all_frames
-                })
-
-            video_results_list.sort(key=lambda x: x["best_rank"])
-            print(frame_results,"Frame_RESULT_FINAL")
-            print(video_results_list,"video_results_list_FINAL")
-
-            
-            return jsonify({
-                "frame_results": frame_results,
-                "video_results": video_results_list
-            })
+            ranked = [(to_keyframe_rel_path(path), None) for path in initial_results]
+            return search_response(branch="asr", k=k_value, offset=0, body=render_results(ranked, compact))
         else:
             return jsonify({"frame_results": [], "video_results": []})
 
-        # --- D. Rerank ---
-        # NOTE: initial_results format:
-        #  - for no-cap collection (siglip_nocap): (path, score)
-        #  - for caption collections: (path, score, caption)
-        
-
+    except ScopeError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         print(f"An error occurred in /search endpoint: {e}")
         import traceback
@@ -340,10 +471,142 @@ def search_endpoint():
         return jsonify({"error": "Đã có lỗi xảy ra trên server."}), 500
 
 
+@app.route("/sequence-search", methods=["GET"])
+def sequence_search_endpoint():
+    """
+    Truy vấn nhiều sự kiện theo thứ tự thời gian trong cùng 1 video.
+    Ví dụ: /sequence-search?events=người đàn ông mở cửa&events=chiếc xe chạy đi&k=500&max_gap=3000
+    Có thể giới hạn phạm vi bằng packs=L21,L22 / videos=L21_V001 giống /search.
+    Trả về các chuỗi (video, frame_A, frame_B, ...) xếp theo điểm.
+    """
+    try:
+        events = [e for e in request.args.getlist("events") if e.strip()]
+        if len(events) < 1:
+            return jsonify({"error": "Thiếu tham số 'events'."}), 400
+        events = [translator_module.translate(e) for e in events]
+
+        mode = request.args.get("mode", config.DEFAULT_MODE)
+        if mode not in MODEL_SPECS:
+            return jsonify({"error": f"Mode '{mode}' không hợp lệ."}), 400
+
+        k_value = int(request.args.get("k", 500))
+        max_gap = int(request.args.get("max_gap", config.SEQUENCE_MAX_GAP))
+        top_n = int(request.args.get("top_n", config.SEQUENCE_TOP_N))
+        search_params = hnsw_search_params(k_value, [mode])
+        try:
+            packs, videos = parse_scope_args(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        sequences = sequence_search(
+            model_registry.get(mode), events, k=k_value, search_params=search_params,
+            max_gap=max_gap, top_n=top_n, packs=packs, videos=videos
+        )
+        for seq in sequences:
+            for frame in seq["frames"]:
+                frame["path"] = f"/images/Keyframes/{frame['path']}"
+
+        return json_response({"events": events, "sequence_results": sequences},
+                             log_fields={"events": len(events), "results": len(sequences)})
+    except ScopeError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"An error occurred in /sequence-search endpoint: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": "Đã có lỗi xảy ra trên server."}), 500
+
+
+@app.route("/cache-stats", methods=["GET"])
+def cache_stats():
+    """Bộ đếm hit/miss của các cache (embedding, cursor kết quả, bản dịch...)."""
+    return jsonify({
+        "embedding_cache": embedding_cache.stats(),
+        "result_cursors": result_cursors.stats(),
+        "translation": translator_module.stats(),
+        "keyframe_manifest": keyframe_manifest.stats(),
+        "thumbnails": thumbnail_cache.stats()
+    })
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """Histogram thời gian từng stage + từng endpoint (Prometheus text format, số liệu của process này)."""
+    return render_prometheus(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    """Liveness: process còn sống (luôn 200), kèm trạng thái warmup và model."""
+    return jsonify({
+        "status": "alive",
+        "pid": os.getpid(),
+        "uptime_sec": round(time.time() - START_TIME, 1),
+        "warmup": warmup_runner.status(),
+        "models": model_registry.status(),
+        "keyframe_manifest": keyframe_manifest.stats()
+    })
+
+
+@app.route("/readyz", methods=["GET"])
+def readyz():
+    """Readiness: 200 khi warmup xong và mọi thành phần bắt buộc ready, ngược lại 503."""
+    return jsonify(warmup_runner.status()), (200 if warmup_runner.ready() else 503)
+
+
+@app.route("/models", methods=["GET"])
+def models_status():
+    """Trạng thái các model trong registry (đã load chưa, idle bao lâu)."""
+    return jsonify(model_registry.status())
+
+
+# /video/<video_id>/frames (src/video_frames.py)
+app.register_blueprint(video_frames_blueprint(keyframe_manifest, response_encoder, config.VIDEO_FRAMES_MAX_AGE))
+
+
+def send_cached_file(path, mimetype=None):
+    """
+    Gửi file ảnh với ETag mạnh (size + mtime) và Cache-Control dài hạn (immutable).
+    If-None-Match khớp => 304 ngay, không mở file. Range / If-Modified-Since do send_file xử lý.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        st = None
+    if st is None or not S_ISREG(st.st_mode):
+        return jsonify({"error": "Không tìm thấy ảnh."}), 404
+    etag = f"{st.st_size:x}-{st.st_mtime_ns:x}"
+    cache_control = f"public, max-age={config.IMAGE_MAX_AGE}" + (", immutable" if config.IMAGE_IMMUTABLE else "")
+    cached = not_modified(etag, request.if_none_match, {"Cache-Control": cache_control})
+    if cached is not None:
+        return cached
+    response = send_file(path, mimetype=mimetype, etag=etag, last_modified=st.st_mtime,
+                         max_age=config.IMAGE_MAX_AGE)
+    response.headers["Cache-Control"] = cache_control
+    return response
+
 
 @app.route("/images/<path:filename>")
 def serve_image(filename):
-    return send_from_directory(config.IMAGE_BASE_PATH, filename)
+    path = safe_join(config.IMAGE_BASE_PATH, filename)
+    if path is None:
+        return jsonify({"error": "Path không hợp lệ."}), 404
+    return send_cached_file(path)
+
+
+@app.route("/thumbs/<int:size>/<path:filename>")
+def serve_thumbnail(size, filename):
+    """Thumbnail WebP của /images/<filename> (cạnh dài <= size), tạo và cache trên đĩa ở lần đầu."""
+    try:
+        with stage("thumbnail"):
+            thumb = thumbnail_cache.get(size, filename)
+    except (OSError, ValueError) as e:
+        # Ảnh gốc hỏng / cắt cụt (PIL UnidentifiedImageError là OSError) => 404 cho ô đó, không phải 500
+        print(f"⚠️  Không tạo được thumbnail {size}/{filename}: {e}")
+        return jsonify({"error": f"Không tạo được thumbnail {size}/{filename}"}), 404
+    if thumb is None:
+        return jsonify({"error": f"Không có thumbnail {size}/{filename}"}), 404
+    return send_cached_file(thumb, mimetype="image/webp")
 
 # ====== 3. Submit kết quả ======
 @app.route("/submit-data", methods=["POST"])
@@ -374,4 +637,6 @@ def submit_answer():
         return jsonify({"error": "Failed to submit"}), response.status_code
 
 if __name__ == "__main__":
-    app.run(host=config.HOST, port=config.PORT, debug=False)
+    init_worker()
+    # Dev server (1 process). Nhiều operator cùng lúc: chạy qua asgi.py (uvicorn / gunicorn)
+    app.run(host=config.HOST, port=config.PORT, debug=False, threaded=True)
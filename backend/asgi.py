@@ -0,0 +1,49 @@
+"""
+ASGI entrypoint cho backend search (nhiều operator dùng cùng lúc).
+
+Flask app được bọc bằng a2wsgi: mỗi request chạy trên thread pool (config.SERVER_THREADS),
+nên request đang chờ dịch / Milvus / Elasticsearch không chặn request khác;
+phần encode text (CPU-bound) đi qua executor giới hạn config.ENCODE_WORKERS.
+
+Chạy (trong thư mục backend):
+    # 1 process (Windows / Linux)
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+
+    # Nhiều worker dùng chung model đã preload (Linux, fork + copy-on-write)
+    gunicorn -c gunicorn.conf.py asgi:app
+"""
+import asyncio
+
+from a2wsgi import WSGIMiddleware
+
+import config
+from app import app as flask_app, init_worker
+
+
+class LifespanApp:
+    """Bọc ASGI app: lifespan startup (chạy trong từng worker, sau fork) gọi init_worker()."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "lifespan":
+            await self.app(scope, receive, send)
+            return
+
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    await asyncio.get_running_loop().run_in_executor(None, init_worker)
+                except Exception as e:
+                    print(f"❌ init_worker lỗi: {e}")
+                    await send({"type": "lifespan.startup.failed", "message": str(e)})
+                    return
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+app = LifespanApp(WSGIMiddleware(flask_app, workers=config.SERVER_THREADS))
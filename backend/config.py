@@ -5,6 +5,16 @@ HOST = "0.0.0.0"
 PORT = 5000
 DEBUG = True
 
+# --- Serving nhiều operator cùng lúc (backend/asgi.py, backend/gunicorn.conf.py) ---
+# Số request xử lý đồng thời trong 1 worker (thread pool của a2wsgi)
+SERVER_THREADS = 16
+# Số process gunicorn (chỉ Linux). Model preload ở process cha, các worker dùng chung qua copy-on-write.
+SERVER_WORKERS = 2
+# Số lần encode text chạy đồng thời trong 1 worker (phần còn lại của request - dịch, Milvus, ES - vẫn chạy song song)
+ENCODE_WORKERS = 2
+# Số thread torch mỗi worker (None = mặc định của torch). Nên ~ số core / SERVER_WORKERS.
+TORCH_NUM_THREADS = None
+
 # --- Cấu hình Model & Dữ liệu ---
 IMAGE_BASE_PATH = "D:/Workplace/AIC_2025/Data" # Thư mục gốc chứa thư mục Keyframes
 
@@ -22,12 +32,127 @@ MODEL_NAME_APPLE = 'hf-hub:apple/DFN5B-CLIP-ViT-H-14-384'
 MILVUS_HOST = '127.0.0.1'
 MILVUS_PORT = '19530'
 # Tên 3 collection chúng ta đã tạo
-
+COLLECTION_HNSW_OPENCLIP = "video_retrieval_final"      # OpenCLIP ViT-L-14 (có caption)
 COLLECTION_HNSW_FINAL_FIRST_G = "SIGLIP_COLLECTION" 
+COLLECTION_HNSW_APPLE = "APPLE_COLLECTION"              # Apple DFN5B (chỉnh theo DB thực tế)
+
+# --- Text encoder cho máy chỉ có CPU ---
+# "fp32" (mặc định), "int8" (dynamic quantization) hoặc "onnx" (onnxruntime).
+# Encoder nhanh phải đạt cosine >= 0.99 so với fp32 (kiểm tra lúc load), nếu không sẽ tự dùng lại fp32.
+TEXT_ENCODER_MODE = "fp32"
+TEXT_ENCODER_ONNX_PATH = "cache/siglip_text_tower.onnx"
+
+# --- Vector backend ---
+# "milvus": search trên Milvus (HNSW).
+# "numpy": search thẳng trên các file *_features.npy (memmap, exact) - không cần container Milvus.
+VECTOR_BACKEND = "milvus"
+FEATURES_BASE_DIR = "D:/Workplace/AIC_2025/Data/All_Features"
+KEYFRAMES_BASE_DIR = IMAGE_BASE_PATH + "/Keyframes"
+PACKS = [f"K{i:02d}" for i in range(1, 21)] + [f"L{i}" for i in range(21, 31)]
+# Số cụm IVF cho backend numpy (vd 1024). None = chỉ exact search.
+NUMPY_IVF_NLIST = None
+
+# --- Model registry ---
+# Mode mặc định khi request không gửi "mode"
+DEFAULT_MODE = "SIGLIP_COLLECTION"
+# Model load ngay lúc khởi động. Rỗng = chỉ load khi có request đầu tiên dùng tới.
+PRELOAD_MODELS = []
+# Unload model không được dùng sau N giây để trả RAM. None = không bao giờ unload.
+MODEL_IDLE_UNLOAD_SEC = 1800
+
+# --- Warmup lúc khởi động (/readyz trả 503 tới khi xong) ---
+# Chạy query mẫu qua từng model đã load, ES OCR / ASR và bước dịch trong mỗi worker.
+WARMUP_ENABLED = True
+WARMUP_QUERIES = [
+    "người đàn ông mặc áo đỏ đang đi trên đường",
+    "a news anchor in a studio",
+    "bản đồ thời tiết",
+]
+WARMUP_K = 100
+
+# --- Fusion nhiều model (mode="FUSION") ---
+FUSION_MODELS = ["SIGLIP_COLLECTION", "OPENCLIP_COLLECTION", "APPLE_COLLECTION"]
+FUSION_METHOD = "rrf"          # "rrf" hoặc "weighted"
+RRF_K = 60
+# Trọng số theo model, model không có trong dict = 1.0
+FUSION_WEIGHTS = {"SIGLIP_COLLECTION": 1.0, "OPENCLIP_COLLECTION": 1.0, "APPLE_COLLECTION": 1.0}
+# Số thread fan-out của fusion (dùng chung mọi request). None = số model x SERVER_THREADS
+# => mọi request fusion đồng thời đều chạy song song các model, không xếp hàng chờ nhau
+FUSION_WORKERS = None
+
+# --- Cache embedding của câu truy vấn ---
+# Số vector giữ trong RAM (LRU). Mỗi vector SigLIP ~4.6KB.
+EMBEDDING_CACHE_SIZE = 4096
+# File SQLite để cache sống sót qua lần restart backend. None = chỉ cache trong RAM.
+EMBEDDING_CACHE_PATH = "cache/text_embeddings.sqlite"
+
+# --- Dịch query (vi -> en) ---
+# "googletrans" (cần mạng) hoặc "offline" (không dịch, chạy không có internet / test)
+TRANSLATION_BACKEND = "googletrans"
+# Quá thời gian này thì dùng nguyên văn query (kết quả dịch về muộn vẫn được cache cho lần sau)
+TRANSLATION_TIMEOUT_SEC = 1.5
+TRANSLATION_CACHE_SIZE = 4096
+TRANSLATION_CACHE_PATH = "cache/translations.sqlite"
+
+# --- HNSW ef theo recall ---
+# Bảng k -> ef -> recall đo bằng utils/tune_hnsw_ef.py. Không có file => ef = k * 3 như cũ.
+HNSW_EF_TABLE_PATH = "cache/hnsw_ef_table.json"
+HNSW_RECALL_TARGET = 0.95
+
+# --- Encode response /search ---
+# False = không nén response (frontend chạy trên localhost: nén chỉ thêm latency)
+RESPONSE_COMPRESS = True
+# Body nhỏ hơn ngưỡng này thì không nén
+RESPONSE_COMPRESS_MIN_BYTES = 1024
+# Mức nén thấp: /search k=500 (~4.9MB JSON) gzip 1 ~20ms / brotli 1 ~8ms, còn gzip 5 / brotli 4 ~35-45ms
+# mà chỉ nhỏ thêm ~1.5 lần (utils/benchmark_response_encoding.py)
+RESPONSE_GZIP_LEVEL = 1
+RESPONSE_BROTLI_QUALITY = 1
+# Tỉ lệ request được ghi 1 dòng log tóm tắt (0 = tắt, 1 = mọi request). Lỗi 5xx luôn được log.
+RESPONSE_LOG_SAMPLE_RATE = 0.1
+
+# --- Cursor kết quả /search (phân trang, đổi k không search lại) ---
+CURSOR_MAX_ENTRIES = 256
+CURSOR_TTL_SEC = 1800
+# Search sâu hơn số kết quả cần: độ sâu = max(cần * CURSOR_OVERFETCH, CURSOR_MIN_DEPTH)
+# => bấm Next / tăng k được trả bằng cách cắt ranked list đã có, không dịch + encode + search lại
+CURSOR_MIN_DEPTH = 500
+CURSOR_OVERFETCH = 2
+
+# --- Keyframe manifest (danh sách frame theo video, thay os.listdir mỗi request) ---
+KEYFRAME_MANIFEST_PATH = "cache/keyframe_manifest.json"
+# Quét lại thư mục có mtime thay đổi sau mỗi N giây. None = chỉ quét lúc khởi động.
+KEYFRAME_MANIFEST_REFRESH_SEC = 300
+# Cache-Control max-age (giây) cho /video/<video_id>/frames
+VIDEO_FRAMES_MAX_AGE = 300
+
+# --- HTTP cache cho ảnh (/images, /thumbs) ---
+# Keyframe không đổi sau khi trích xuất => trình duyệt giữ 1 năm, không cần hỏi lại server
+IMAGE_MAX_AGE = 31536000
+IMAGE_IMMUTABLE = True
+# True khi chạy sau Apache / lighttpd có X-Sendfile: web server tự gửi file, Python chỉ trả header
+USE_X_SENDFILE = False
+
+# --- Thumbnail keyframe cho gallery (/thumbs/<size>/<path>) ---
+THUMBNAIL_CACHE_DIR = "cache/thumbnails"
+# Các size (cạnh dài, px) được phép. Gallery dùng size đầu tiên trong frontend (THUMB_SIZE).
+THUMBNAIL_SIZES = (160, 320)
+THUMBNAIL_QUALITY = 75
+
+# --- Sequence query (event A rồi event B trong cùng video) ---
+# Khoảng cách tối đa (tính theo frame number trong tên file keyframe) giữa 2 event liên tiếp
+SEQUENCE_MAX_GAP = 3000
+SEQUENCE_TOP_N = 100
 
 # --- Cấu hình Tìm kiếm & Rerank MỚI ---
 # Top K kết quả lấy từ Milvus để đưa vào rerank
 
 # Trọng số cho điểm CLIP trong công thức Hybrid Score. 
 # 0.6 nghĩa là 60% tin vào CLIP, 40% tin vào BM25.
-ALPHA = 0.6
\ No newline at end of file
+ALPHA = 0.6
+
+# --- Hybrid text + OCR + ASR (/search có >= 2 trong query / ocr / colors) ---
+# None = theo ALPHA: text = ALPHA, OCR = ASR = (1 - ALPHA) / 2. Request ghi đè bằng w_text / w_ocr / w_asr.
+HYBRID_WEIGHTS = None
+# Số đoạn thoại ASR tối thiểu lấy về (mỗi đoạn trải ra nhiều frame); trang sâu hơn lấy theo độ sâu của trang
+HYBRID_ASR_K = 50
\ No newline at end of file
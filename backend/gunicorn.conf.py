@@ -0,0 +1,33 @@
+"""
+Gunicorn cho backend search (chỉ Linux):
+    gunicorn -c gunicorn.conf.py asgi:app
+
+- preload_app: import app (và preload model) 1 lần ở process cha rồi fork ra các worker
+  => weight của model được chia sẻ copy-on-write thay vì mỗi worker load 1 bản
+- gc.freeze() trước khi fork: GC không quét / ghi vào object của process cha => ít page bị copy
+- Mỗi worker là 1 UvicornWorker chạy asgi.app (thread pool + executor encode riêng)
+"""
+import gc
+import os
+
+import config
+
+bind = f"{config.HOST}:{config.PORT}"
+workers = int(os.environ.get("SEARCH_WORKERS", config.SERVER_WORKERS))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = 120
+graceful_timeout = 30
+keepalive = 5
+
+# Không preload model nào thì mỗi worker sẽ tự load => không còn chia sẻ được gì
+preload = config.PRELOAD_MODELS or [config.DEFAULT_MODE]
+
+
+def when_ready(server):
+    # preload_app => app đã import xong ở process cha; load thêm model còn thiếu trước khi fork
+    from app import model_registry
+    model_registry.preload(preload)
+    gc.collect()
+    gc.freeze()
+    server.log.info(f"Preloaded {preload}, froze {gc.get_freeze_count()} objects before fork")
@@ -7,6 +7,25 @@ từ package `src` thay vì phải chỉ rõ tên file.
 Thay vì viết: from src.retrieval_system import RetrievalSystem
 Ta có thể viết: from src import RetrievalSystem
 """
-from .retrieval_system import RetrievalSystem,RetrievalSystemApple,RetrievalSystemSiglipNoCap
+from .retrieval_system import BaseRetrievalSystem, RetrievalSystem,RetrievalSystemApple,RetrievalSystemSiglipNoCap
+from .retrieval_system import reconnect_milvus, set_encode_workers
+from .model_registry import ModelRegistry, ModelSpec
+from .numpy_search import NumpyCollection
 from .ocr_search_engine_main import OCRRetrievalES
-from .audio_search_engine_list import  SpeechRetrievalES
\ No newline at end of file
+from .audio_search_engine_list import  SpeechRetrievalES
+from .caching import LRUCache, EmbeddingCache
+from .fusion import FusionSearcher
+from .sequence_search import sequence_search
+from .ef_tuning import EfSelector
+from .result_cursor import ResultCursorStore
+from .search_scope import is_valid_pack, is_valid_video, ScopeError
+from .keyframe_manifest import KeyframeManifest
+from .translation import TranslatorModule, build_backend as build_translation_backend
+from .hybrid_search import HybridSearcher, HYBRID_SOURCES, default_hybrid_weights, ocr_ranked, asr_ranked
+from .response_encoding import ResponseEncoder, SampledLogger, not_modified
+from .search_response import build_search_response, build_compact_response
+from .video_frames import video_frames_blueprint
+from .thumbnails import ThumbnailCache
+from .warmup import WarmupRunner
+from .index_tracker import IndexTracker
+from .metrics import stage, start_request, current_timings, observe_request, render_prometheus
@@ -16,21 +16,49 @@ from sentence_transformers import SentenceTransformer
 from tqdm import tqdm
 from typing import List, Dict
 import warnings
-import hashlib
+import queue
+import threading
+import time
+from collections import deque
+from .es_bulk import bulk_load_settings, delete_by_source, parallel_index, stable_doc_id
+from .index_tracker import IndexTracker
+from .keyframe_manifest import KeyframeManifest
+from .metrics import stage
 warnings.filterwarnings('ignore')
 
 
+# Frame number keyframe thuộc đoạn + cách dựng tên file (resolve lúc index, chỉ đọc lại, không search)
+KEYFRAME_FIELDS_MAPPING = {
+    "keyframes": {"type": "integer", "index": False},
+    "keyframe_ext": {"type": "keyword", "index": False},
+    "keyframe_width": {"type": "integer", "index": False},
+}
+
+
 # ========================== HELPER FUNCTIONS ==========================
-def list_keyframes_in_range(entry: Dict, base_keyframe_dir: str) -> List[str]:
-    """Lấy danh sách frame thực tế trong thư mục Keyframes"""
+def list_keyframes_in_range(entry: Dict, base_keyframe_dir: str, keyframe_manifest=None) -> List[str]:
+    """
+    Lấy danh sách frame của đoạn thoại: dùng frame number đã lưu sẵn trong document (lúc index),
+    document cũ thì qua KeyframeManifest (searchsorted trong RAM), không có manifest mới listdir.
+    """
     json_file = os.path.basename(entry["file"])
     video_name = os.path.splitext(json_file)[0]
     k_folder = video_name.split('_')[0]
     keyframe_folder = os.path.join(base_keyframe_dir, k_folder, video_name)
+
+    if entry.get("keyframe_width"):
+        width, ext = entry["keyframe_width"], entry["keyframe_ext"]
+        return [os.path.join(keyframe_folder, f"{n:0{width}d}{ext}") for n in entry.get("keyframes", [])]
     
     start_f, end_f = entry["start_frame"], entry["end_frame"]
     frame_paths = []
 
+    if keyframe_manifest is not None:
+        return [
+            os.path.join(keyframe_folder, fname)
+            for fname in keyframe_manifest.frames_in_range(video_name, start_f, end_f)
+        ]
+
     if os.path.exists(keyframe_folder):
         for fname in sorted(os.listdir(keyframe_folder)):
             if fname.endswith((".webp", ".jpg", ".png")):
@@ -44,18 +72,6 @@ def list_keyframes_in_range(entry: Dict, base_keyframe_dir: str) -> List[str]:
     return frame_paths
 
 
-def get_file_hash(filepath: str) -> str:
-    """Tính hash của file"""
-    hash_md5 = hashlib.md5()
-    try:
-        with open(filepath, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                hash_md5.update(chunk)
-        return hash_md5.hexdigest()
-    except Exception:
-        return ""
-
-
 # ========================== MAIN CLASS ==========================
 class SpeechRetrievalES:
     """Speech Retrieval System using Elasticsearch"""
@@ -70,7 +86,12 @@ class SpeechRetrievalES:
         use_semantic: bool = True,
         load_data: bool = True,
         force_reindex: bool = False,
-        index_tracker_file: str = ".indexed_files.json"
+        index_tracker_file: str = ".indexed_files.json",
+        keyframe_manifest=None,
+        encode_batch_size: int = 256,
+        bulk_chunk_size: int = 500,
+        bulk_threads: int = 4,
+        queue_size: int = 8
     ):
         self.context_json_dir = context_json_dir
         self.base_keyframe_dir = base_keyframe_dir
@@ -78,12 +99,22 @@ class SpeechRetrievalES:
         self.use_semantic = use_semantic
         self.force_reindex = force_reindex
         self.index_tracker_file = index_tracker_file
+        # KeyframeManifest: resolve frame lúc index + fallback cho document cũ (None = tự tạo khi cần)
+        self.keyframe_manifest = keyframe_manifest
+        self._manifest_lock = threading.Lock()
+        # Index: số đoạn encode mỗi batch, số doc mỗi request bulk, số request bulk song song,
+        # số batch đã encode được chờ sẵn trong queue (giới hạn RAM)
+        self.encode_batch_size = encode_batch_size
+        self.bulk_chunk_size = bulk_chunk_size
+        self.bulk_threads = bulk_threads
+        self.queue_size = queue_size
 
         print("="*80)
         print("🚀 KHỞI ĐỘNG SPEECH RETRIEVAL SYSTEM")
         print("="*80)
         
-        self.indexed_files = self._load_indexed_files()
+        self.tracker = IndexTracker(index_tracker_file, force=force_reindex)
+        self.host = host
         self._connect_elasticsearch(host)
         
         if use_semantic:
@@ -94,32 +125,9 @@ class SpeechRetrievalES:
         if load_data:
             self._index_data()
 
-    def _load_indexed_files(self) -> Dict[str, str]:
-        if self.force_reindex:
-            return {}
-        if os.path.exists(self.index_tracker_file):
-            try:
-                with open(self.index_tracker_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except:
-                return {}
-        return {}
-
-    def _save_indexed_files(self):
-        try:
-            with open(self.index_tracker_file, 'w', encoding='utf-8') as f:
-                json.dump(self.indexed_files, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            print(f"⚠️  Lỗi lưu tracker: {e}")
-
-    def _should_index_file(self, filepath: str) -> bool:
-        if self.force_reindex:
-            return True
-        current_hash = get_file_hash(filepath)
-        if filepath in self.indexed_files:
-            if self.indexed_files[filepath] == current_hash:
-                return False
-        return True
+    def reconnect(self):
+        """Tạo lại client Elasticsearch (gọi trong worker sau khi fork)."""
+        self._connect_elasticsearch(self.host)
 
     def _connect_elasticsearch(self, host: str):
         print(f"\n🔌 Đang kết nối tới {host}...")
@@ -143,6 +151,11 @@ class SpeechRetrievalES:
         print(f"\n🔧 Kiểm tra index '{self.index_name}'...")
         if self.es.indices.exists(index=self.index_name):
             print(f"ℹ️  Index đã tồn tại")
+            try:
+                # Index tạo trước khi có field keyframes: thêm mapping (chỉ thêm field, không đụng field cũ)
+                self.es.indices.put_mapping(index=self.index_name, properties=KEYFRAME_FIELDS_MAPPING)
+            except Exception as e:
+                print(f"⚠️  Không thêm được mapping keyframes: {e}")
             return
         
         mapping = {
@@ -156,6 +169,7 @@ class SpeechRetrievalES:
                     "file": {"type": "keyword"},
                     "video_name": {"type": "keyword"},
                     "L": {"type": "integer"},
+                    **KEYFRAME_FIELDS_MAPPING,
                     "embedding": {
                         "type": "dense_vector",
                         "dims": 768,
@@ -170,6 +184,11 @@ class SpeechRetrievalES:
         print("✅ Index đã tạo!")
 
     def _index_data(self):
+        """
+        Pipeline index: thread encode đọc đoạn thoại của nhiều file, encode theo batch lớn
+        (encode_batch_size) rồi đẩy vào queue giới hạn; thread chính lấy từ queue và gửi
+        parallel_bulk => encode (GPU/CPU) chạy chồng lên thời gian chờ Elasticsearch.
+        """
         print("\n📂 BẮT ĐẦU INDEX DỮ LIỆU")
         
         all_files = []
@@ -178,45 +197,165 @@ class SpeechRetrievalES:
                 if file.endswith(".json"):
                     all_files.append(os.path.join(root, file))
         
-        files_to_index = [f for f in all_files if self._should_index_file(f)]
+        files_to_index = self.tracker.changed_files(all_files)
         
         if len(files_to_index) == 0:
             print("✅ Không có file mới")
+            if self.tracker.dirty:   # file chỉ bị touch / tracker cũ => lưu stat mới, lần sau khỏi hash lại
+                self.tracker.save()
             return
-        
-        count = 0
-        for full_path in files_to_index:
-            video_name = os.path.splitext(os.path.basename(full_path))[0]
-            
-            with open(full_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            
-            for idx, item in enumerate(tqdm(data, desc=f"Indexing", leave=False)):
-                text = item.get("text", "").strip()
-                if not text:
+        manifest = self._get_manifest()
+
+        batches = queue.Queue(maxsize=self.queue_size)   # đầy => thread encode chờ ES
+        unreadable = set()
+        producer_error = []
+        encode_seconds = [0.0]
+        deleted = [0]
+        stop = threading.Event()   # phía ES dừng (lỗi) => thread encode không chờ queue đầy mãi
+
+        def put(item) -> bool:
+            """batches.put nhưng bỏ cuộc khi stop được set. Trả về False nếu đã dừng."""
+            while not stop.is_set():
+                try:
+                    batches.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
                     continue
-                
-                doc = {
-                    "text": text,
-                    "start_frame": item.get("start_frame"),
-                    "end_frame": item.get("end_frame"),
-                    "start_sec": item.get("start_sec"),
-                    "end_sec": item.get("end_sec"),
-                    "file": full_path,
-                    "video_name": video_name,
-                    "L": idx,
-                }
+            return False
 
-                if self.use_semantic:
-                    doc["embedding"] = self.model.encode(text).tolist()
+        def produce():
+            try:
+                batch = []
+                for item in self._iter_segments(files_to_index, unreadable, manifest, deleted):
+                    batch.append(item)
+                    if len(batch) >= self.encode_batch_size:
+                        if not put(self._encode_batch(batch, encode_seconds)):
+                            return
+                        batch = []
+                if batch:
+                    put(self._encode_batch(batch, encode_seconds))
+            except Exception as e:
+                producer_error.append(e)
+            finally:
+                put(None)
 
-                self.es.index(index=self.index_name, document=doc)
-                count += 1
-            
-            self.indexed_files[full_path] = get_file_hash(full_path)
-        
-        self._save_indexed_files()
-        print(f"🎉 Đã index {count:,} documents!")
+        def consume():
+            try:
+                while not stop.is_set():
+                    try:
+                        batch = batches.get(timeout=0.5)
+                    except queue.Empty:
+                        continue
+                    if batch is None:
+                        return
+                    for full_path, doc in batch:
+                        source_files.append(full_path)
+                        yield {"_index": self.index_name, "_id": stable_doc_id(full_path, doc["L"]), "_source": doc}
+            finally:
+                # Kết thúc bình thường hoặc parallel_index lỗi giữa chừng: báo producer dừng, xả queue
+                stop.set()
+                while True:
+                    try:
+                        batches.get_nowait()
+                    except queue.Empty:
+                        break
+
+        # Action đi qua parallel_bulk theo đúng thứ tự => source_files[i] là file của action thứ i
+        source_files = deque()
+        failed_files = set()
+
+        def on_result(ok, info):
+            source = source_files.popleft()
+            if not ok:
+                failed_files.add(source)
+                if len(failed_files) <= 5:
+                    print(f"   ⚠️  Lỗi index ({os.path.basename(source)}): {info}")
+
+        producer = threading.Thread(target=produce, name="speech-encode", daemon=True)
+        producer.start()
+        try:
+            with bulk_load_settings(self.es, self.index_name):
+                stats = parallel_index(self.es, consume(), chunk_size=self.bulk_chunk_size,
+                                       thread_count=self.bulk_threads, on_result=on_result)
+        finally:
+            stop.set()   # parallel_index lỗi => generator có thể chưa được đóng, vẫn phải thả producer
+            producer.join()
+        if deleted[0]:
+            print(f"🧹 Đã xóa {deleted[0]:,} document cũ của các file thay đổi")
+        if producer_error:
+            print(f"❌ Lỗi khi đọc / encode: {producer_error[0]} (không cập nhật tracker)")
+            raise producer_error[0]
+
+        # Chỉ đánh dấu file đã index khi mọi đoạn của file đều vào ES
+        for full_path in files_to_index:
+            if full_path not in failed_files and full_path not in unreadable:
+                self.tracker.mark_indexed(full_path)
+        self.tracker.save()
+
+        print(f"🎉 Đã index {stats['indexed']:,} documents trong {stats['seconds']:.1f}s "
+              f"({stats['docs_per_sec']:,.0f} docs/s, encode {encode_seconds[0]:.1f}s)")
+        if stats["failed"]:
+            print(f"⚠️  {stats['failed']:,} documents lỗi trong {len(failed_files)} file (sẽ index lại lần sau)")
+        return stats
+
+    def _iter_segments(self, files_to_index: List[str], unreadable: set, manifest: KeyframeManifest,
+                       deleted: List[int]):
+        """
+        (file, doc chưa có embedding) cho từng đoạn thoại có text, kèm frame number keyframe của đoạn.
+        Mỗi file được đọc + kiểm tra xong mới xóa doc cũ của file đó => file lỗi vẫn giữ nguyên doc cũ.
+        """
+        for full_path in tqdm(files_to_index, desc="📄 ASR files"):
+            try:
+                docs = self._file_segments(full_path, manifest)
+            except Exception as e:
+                print(f"   ⚠️  Không đọc được {os.path.basename(full_path)}: {e}")
+                unreadable.add(full_path)
+                continue
+
+            # Doc cũ của file (kể cả doc _id tự sinh từ bản cũ) => xóa ngay trước khi ghi bản mới
+            deleted[0] += delete_by_source(self.es, self.index_name, "file", [full_path], refresh=False)
+            for doc in docs:
+                yield full_path, doc
+
+    def _file_segments(self, full_path: str, manifest: KeyframeManifest) -> List[Dict]:
+        """Doc (chưa có embedding) cho mọi đoạn thoại có text của 1 file ASR. Raise nếu file sai format."""
+        video_name = os.path.splitext(os.path.basename(full_path))[0]
+        with open(full_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if not isinstance(data, list):
+            raise ValueError("file phải là list các đoạn thoại")
+
+        docs = []
+        for idx, item in enumerate(data):
+            text = item.get("text") if isinstance(item, dict) else None
+            if not isinstance(text, str) or not text.strip():
+                continue
+
+            doc = {
+                "text": text.strip(),
+                "start_frame": item.get("start_frame"),
+                "end_frame": item.get("end_frame"),
+                "start_sec": item.get("start_sec"),
+                "end_sec": item.get("end_sec"),
+                "file": full_path,
+                "video_name": video_name,
+                "L": idx,
+            }
+            if doc["start_frame"] is not None and doc["end_frame"] is not None:
+                doc.update(manifest.resolve_range(video_name, doc["start_frame"], doc["end_frame"]) or {})
+            docs.append(doc)
+        return docs
+
+    def _encode_batch(self, batch: List, encode_seconds: List[float]) -> List:
+        """Gắn embedding cho cả batch bằng 1 lần SentenceTransformer.encode."""
+        if self.use_semantic:
+            start = time.perf_counter()
+            embeddings = self.model.encode([doc["text"] for _, doc in batch],
+                                           batch_size=self.encode_batch_size, convert_to_numpy=True)
+            encode_seconds[0] += time.perf_counter() - start
+            for (_, doc), embedding in zip(batch, embeddings):
+                doc["embedding"] = embedding.tolist()
+        return batch
 
     def search(self, query: str, k: int = 3, use_fuzzy: bool = False) -> Dict:
         """Tìm kiếm keyword và semantic"""
@@ -243,12 +382,15 @@ class SpeechRetrievalES:
                 "query": {"match": {"text": query}}
             }
         
-        resp = self.es.search(index=self.index_name, body=keyword_query)
-        results["keyword"] = [hit["_source"] for hit in resp["hits"]["hits"]]
+        with stage("es_asr"):
+            resp = self.es.search(index=self.index_name, body=keyword_query)
+        # Giữ kèm điểm BM25 (_score) để fusion với các nguồn khác (hybrid search)
+        results["keyword"] = [{**hit["_source"], "_score": hit["_score"]} for hit in resp["hits"]["hits"]]
 
         # Semantic Search
         if self.use_semantic:
-            query_vec = self.model.encode(query).tolist()
+            with stage("asr_semantic_encode"):
+                query_vec = self.model.encode(query).tolist()
             
             semantic_query = {
                 "size": k,
@@ -261,7 +403,8 @@ class SpeechRetrievalES:
             }
             
             try:
-                resp = self.es.search(index=self.index_name, **semantic_query)
+                with stage("es_asr_semantic"):
+                    resp = self.es.search(index=self.index_name, **semantic_query)
                 results["semantic"] = [hit["_source"] for hit in resp["hits"]["hits"]]
             except Exception as e:
                 print(f"⚠️  Lỗi semantic: {e}")
@@ -269,15 +412,26 @@ class SpeechRetrievalES:
 
         return results
 
+    def _get_manifest(self) -> KeyframeManifest:
+        """KeyframeManifest dùng chung, tạo (quét cây Keyframes 1 lần) ở lần đầu cần tới."""
+        if self.keyframe_manifest is None:
+            with self._manifest_lock:
+                if self.keyframe_manifest is None:
+                    self.keyframe_manifest = KeyframeManifest(self.base_keyframe_dir)
+        return self.keyframe_manifest
+
     def search_with_frames(self, query: str, k: int = 3, use_fuzzy: bool = False) -> Dict:
-        """Search và lấy keyframes"""
+        """Search và lấy keyframes (frame lưu sẵn trong document, không đụng tới filesystem)"""
         results = self.search(query, k, use_fuzzy)
         output = {}
 
         for mode in ["semantic", "keyword"]:
             output[mode] = []
             for r in results.get(mode, []):
-                frames = list_keyframes_in_range(r, self.base_keyframe_dir)
+                # Document index trước khi có "keyframes" => fallback manifest trong RAM
+                manifest = None if r.get("keyframe_width") else self._get_manifest()
+                with stage("asr_frame_lookup"):
+                    frames = list_keyframes_in_range(r, self.base_keyframe_dir, manifest)
                 r["frames"] = frames
                 r["num_frames"] = len(frames)
                 output[mode].append(r)
@@ -358,6 +512,7 @@ def audio_search(query: str, top_k: int, audio_dir: str, keyframe_dir: str,
 # ========================== MAIN PROGRAM ==========================
 
 if __name__ == "__main__":
+    # Chạy trong thư mục backend: python -m src.audio_search_engine_list
     # Cấu hình
     AUDIO_DIR = r"D:\Workplace\AIC_2025\Data\AUDIO_RECOGNIZATION"
     KEYFRAME_DIR = r"D:\Workplace\AIC_2025\Data\Keyframes"
@@ -0,0 +1,206 @@
+"""
+Cache dùng chung cho backend.
+
+- LRUCache: cache LRU thread-safe trong RAM, tùy chọn ghi xuống SQLite để
+  backend khởi động lại vẫn "ấm" (không phải tính lại từ đầu).
+- EmbeddingCache: cache vector text embedding, key = (tên model, query đã chuẩn hóa).
+"""
+import os
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+
+def normalize_query_text(text: str) -> str:
+    """
+    Chuẩn hóa query để làm key cache: NFC, gộp khoảng trắng, lowercase.
+    (Tokenizer của OpenCLIP / SigLIP / Apple đều lowercase nên không mất thông tin.)
+    """
+    text = unicodedata.normalize("NFC", text or "")
+    return " ".join(text.split()).lower()
+
+
+class LRUCache:
+    """
+    Cache LRU thread-safe, có bộ đếm hit/miss.
+
+    Nếu truyền store_path thì mỗi lần put sẽ ghi thêm xuống SQLite (write-through),
+    và get bị miss trong RAM sẽ thử đọc từ đĩa trước khi coi là miss.
+    Connection SQLite mở riêng cho từng process (theo pid): worker fork từ process cha
+    (gunicorn preload_app) tự mở connection mới thay vì dùng chung connection của cha.
+    """
+
+    def __init__(self, max_size: int = 4096, store_path: Optional[str] = None,
+                 namespace: str = "default"):
+        self.max_size = max_size
+        self.namespace = namespace
+        self._data: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self.store_path = store_path
+        self._db = None
+        self._db_pid = None
+        if store_path:
+            os.makedirs(os.path.dirname(os.path.abspath(store_path)), exist_ok=True)
+            db = self._connection()
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "namespace TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, "
+                "PRIMARY KEY (namespace, key))"
+            )
+            db.commit()
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        """Connection SQLite của process hiện tại (mở lại sau fork). None nếu không có store_path."""
+        if not self.store_path:
+            return None
+        if self._db_pid != os.getpid():
+            # Không close connection của process cha: đóng ở đây sẽ đụng vào file handle cha đang dùng
+            self._db = sqlite3.connect(self.store_path, check_same_thread=False)
+            self._db_pid = os.getpid()
+        return self._db
+
+    # --- (de)serialize: lớp con override nếu value không phải bytes/str ---
+    def _serialize(self, value: Any) -> Any:
+        return value
+
+    def _deserialize(self, raw: Any) -> Any:
+        return raw
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+
+            db = self._connection()
+            if db is not None:
+                row = db.execute(
+                    "SELECT value FROM cache WHERE namespace = ? AND key = ?",
+                    (self.namespace, key)
+                ).fetchone()
+                if row is not None:
+                    value = self._deserialize(row[0])
+                    self._insert(key, value)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return value
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, value: Any):
+        with self._lock:
+            self._insert(key, value)
+            db = self._connection()
+            if db is not None:
+                try:
+                    db.execute(
+                        "INSERT OR REPLACE INTO cache (namespace, key, value) VALUES (?, ?, ?)",
+                        (self.namespace, key, self._serialize(value))
+                    )
+                    db.commit()
+                except sqlite3.Error as e:
+                    print(f"⚠️  Không ghi được cache xuống đĩa: {e}")
+
+    def _insert(self, key: str, value: Any):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def clear(self, disk: bool = False):
+        with self._lock:
+            self._data.clear()
+            db = self._connection()
+            if disk and db is not None:
+                db.execute("DELETE FROM cache WHERE namespace = ?", (self.namespace,))
+                db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "namespace": self.namespace,
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0,
+                "persistent": bool(self.store_path),
+            }
+
+    def __len__(self):
+        return len(self._data)
+
+
+class EmbeddingCache(LRUCache):
+    """Cache text embedding (float32) theo (model, query đã chuẩn hóa)."""
+
+    def __init__(self, max_size: int = 4096, store_path: Optional[str] = None):
+        super().__init__(max_size=max_size, store_path=store_path, namespace="text_embedding")
+
+    def _serialize(self, value: np.ndarray) -> bytes:
+        return np.asarray(value, dtype=np.float32).tobytes()
+
+    def _deserialize(self, raw: bytes) -> np.ndarray:
+        return np.frombuffer(raw, dtype=np.float32)
+
+    @staticmethod
+    def make_key(model_key: str, query: str) -> str:
+        return f"{model_key}\x00{normalize_query_text(query)}"
+
+    def get_embedding(self, model_key: str, query: str) -> Optional[List[float]]:
+        vector = self.get(self.make_key(model_key, query))
+        return None if vector is None else vector.tolist()
+
+    def put_embedding(self, model_key: str, query: str, vector: List[float]):
+        self.put(self.make_key(model_key, query), np.asarray(vector, dtype=np.float32))
+
+
+def cached_encode(cache: Optional[EmbeddingCache], model_key: str, query: str,
+                  encode_fn: Callable[[str], List[float]]) -> List[float]:
+    """Tra cache trước, miss thì gọi encode_fn rồi lưu lại."""
+    if cache is None:
+        return encode_fn(query)
+    vector = cache.get_embedding(model_key, query)
+    if vector is None:
+        vector = encode_fn(query)
+        cache.put_embedding(model_key, query, vector)
+    return vector
+
+
+def cached_encode_batch(cache: Optional[EmbeddingCache], model_key: str, queries: List[str],
+                        encode_batch_fn: Callable[[List[str]], List[List[float]]]) -> List[List[float]]:
+    """
+    Bản batch của cached_encode: chỉ các query bị miss (đã bỏ trùng) mới được
+    đưa vào encode_batch_fn trong MỘT lần forward.
+    """
+    vectors: List[Optional[List[float]]] = [None] * len(queries)
+    missing: Dict[str, List[int]] = {}
+    for i, query in enumerate(queries):
+        vector = cache.get_embedding(model_key, query) if cache is not None else None
+        if vector is not None:
+            vectors[i] = vector
+        else:
+            key = normalize_query_text(query) if cache is not None else query
+            missing.setdefault(key, []).append(i)
+
+    if missing:
+        to_encode = [queries[idxs[0]] for idxs in missing.values()]
+        encoded = encode_batch_fn(to_encode)
+        for query, idxs, vector in zip(to_encode, missing.values(), encoded):
+            if cache is not None:
+                cache.put_embedding(model_key, query, vector)
+            for i in idxs:
+                vectors[i] = vector
+    return vectors
@@ -0,0 +1,96 @@
+"""
+Chọn HNSW `ef` theo recall mục tiêu.
+
+Bảng k -> ef được đo offline bằng utils/tune_hnsw_ef.py (so HNSW với exact search
+trên chính các embedding đã lưu) và lưu dạng JSON:
+
+    {
+      "SIGLIP_COLLECTION": {
+        "100": {"100": 0.93, "150": 0.97, "200": 0.99},
+        "500": {"500": 0.95, "750": 0.98, ...}
+      }
+    }
+
+(collection -> k -> ef -> recall@k). Backend chọn ef NHỎ NHẤT đạt recall mục tiêu,
+thay vì luôn dùng ef = k * 3.
+"""
+import json
+import os
+from typing import Dict, Iterable, List, Optional
+
+
+def recall_at_k(approx: Iterable[str], exact: Iterable[str]) -> float:
+    """Tỉ lệ phần tử của exact top-k có mặt trong approx top-k."""
+    exact = set(exact)
+    if not exact:
+        return 1.0
+    return len(exact & set(approx)) / len(exact)
+
+
+class EfSelector:
+    """
+    Args:
+        table_path: file JSON bảng recall (không có file => luôn dùng fallback)
+        recall_target: recall@k mục tiêu, vd 0.95
+        fallback_factor: ef = k * fallback_factor khi bảng không có dữ liệu phù hợp
+    """
+
+    def __init__(self, table_path: Optional[str], recall_target: float = 0.95, fallback_factor: int = 3):
+        self.table_path = table_path
+        self.recall_target = recall_target
+        self.fallback_factor = fallback_factor
+        self.table: Dict[str, Dict[int, Dict[int, float]]] = {}
+        self.reload()
+
+    def reload(self):
+        if not self.table_path or not os.path.isfile(self.table_path):
+            print(f"ℹ️  Chưa có bảng HNSW ef - dùng ef = k * {self.fallback_factor}")
+            self.table = {}
+            return
+        with open(self.table_path, "r", encoding="utf-8") as f:
+            raw = json.load(f)
+        self.table = {
+            collection: {int(k): {int(ef): float(r) for ef, r in efs.items()} for k, efs in rows.items()}
+            for collection, rows in raw.items()
+        }
+        print(f"✅ Loaded HNSW ef table: {self.table_path} ({', '.join(self.table)})")
+
+    def select(self, k: int, collection: Optional[str] = None) -> int:
+        """
+        Lấy dòng có k_bảng >= k nhỏ nhất (an toàn hơn dòng nhỏ hơn), rồi chọn ef nhỏ nhất
+        có recall >= recall_target. ef luôn >= k (Milvus yêu cầu).
+        """
+        fallback = k * self.fallback_factor
+        rows = self.table.get(collection) if collection else None
+        if not rows:
+            return fallback
+
+        larger = [row_k for row_k in rows if row_k >= k]
+        if not larger:
+            return fallback
+        row_k = min(larger)
+        passing = sorted(ef for ef, recall in rows[row_k].items() if recall >= self.recall_target)
+        if not passing:
+            return max(fallback, max(rows[row_k]))
+        # ef đạt mục tiêu ở row_k >= k thì với k nhỏ hơn recall chỉ cao hơn
+        return max(k, passing[0])
+
+    @staticmethod
+    def save_table(path: str, collection: str, results: Dict[int, Dict[int, float]]):
+        """Ghi (merge) kết quả đo của 1 collection vào file bảng."""
+        table = {}
+        if os.path.isfile(path):
+            with open(path, "r", encoding="utf-8") as f:
+                table = json.load(f)
+        table[collection] = {
+            str(k): {str(ef): round(r, 4) for ef, r in sorted(efs.items())}
+            for k, efs in sorted(results.items())
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(table, f, ensure_ascii=False, indent=2)
+
+
+def default_ef_grid(k: int, factors: List[float]) -> List[int]:
+    """ef thử cho 1 giá trị k: k * factor, bỏ trùng, luôn >= k."""
+    return sorted({max(k, int(k * f)) for f in factors})
@@ -0,0 +1,85 @@
+"""
+Nạp dữ liệu lớn vào Elasticsearch (dùng chung cho index OCR và speech).
+
+- bulk_load_settings: tắt refresh + replica trong lúc nạp (ES không phải refresh segment
+  và ghi sang replica sau mỗi request), xong thì trả lại setting cũ và refresh 1 lần
+- parallel_index: stream action qua helpers.parallel_bulk (nhiều thread, mỗi request 1 chunk),
+  báo lại từng kết quả theo thứ tự action và đo docs/s
+- stable_doc_id + delete_by_source: _id cố định theo (file nguồn, entry) => index lại là ghi đè;
+  doc cũ của file đã đổi bị xóa ngay trước khi ghi bản mới của file đó (chỉ khi file đọc được)
+  => số doc không tăng sau mỗi lần chạy, file lỗi vẫn giữ doc cũ
+"""
+import hashlib
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional
+
+from elasticsearch import helpers
+
+
+@contextmanager
+def bulk_load_settings(es, index: str):
+    """Trong khối with: refresh_interval = -1, number_of_replicas = 0. Ra khỏi khối: khôi phục."""
+    current = es.indices.get_settings(index=index)[index]["settings"]["index"]
+    previous = {
+        "refresh_interval": current.get("refresh_interval"),   # None = mặc định của ES (1s)
+        "number_of_replicas": current.get("number_of_replicas"),
+    }
+    es.indices.put_settings(index=index, settings={"index": {"refresh_interval": "-1", "number_of_replicas": 0}})
+    try:
+        yield
+    finally:
+        es.indices.put_settings(index=index, settings={"index": previous})
+        es.indices.refresh(index=index)
+        print(f"🔁 Đã khôi phục setting index '{index}': {previous}")
+
+
+def stable_doc_id(source_file: str, entry_key) -> str:
+    """_id cố định của 1 entry: sha1(file nguồn + key của entry trong file)."""
+    return hashlib.sha1(f"{source_file}\x00{entry_key}".encode("utf-8")).hexdigest()
+
+
+def delete_by_source(es, index: str, field: str, sources: List[str], batch_size: int = 1000,
+                     refresh: bool = True) -> int:
+    """
+    Xóa mọi doc có field (keyword) thuộc sources, theo từng batch. Trả về số doc đã xóa.
+    delete_by_query chỉ thấy doc đã refresh: doc của các lần chạy trước đã được refresh lúc
+    bulk_load_settings kết thúc => gọi trong khối bulk_load_settings được, với refresh=False
+    (không ép refresh giữa lúc đang nạp).
+    """
+    deleted = 0
+    for i in range(0, len(sources), batch_size):
+        resp = es.delete_by_query(
+            index=index,
+            query={"terms": {field: sources[i:i + batch_size]}},
+            conflicts="proceed",
+            refresh=refresh,
+            slices="auto",
+        )
+        deleted += resp.get("deleted", 0)
+    return deleted
+
+
+def parallel_index(es, actions: Iterable[Dict], chunk_size: int = 1000, thread_count: int = 4,
+                   on_result: Optional[Callable[[bool, Dict], None]] = None) -> Dict:
+    """
+    Gửi actions bằng parallel_bulk. on_result(ok, info) được gọi cho từng action, đúng thứ tự.
+    Trả về {"indexed", "failed", "seconds", "docs_per_sec"}.
+    """
+    indexed = failed = 0
+    start = time.perf_counter()
+    for ok, info in helpers.parallel_bulk(es, actions, chunk_size=chunk_size, thread_count=thread_count,
+                                          raise_on_error=False, raise_on_exception=False):
+        if ok:
+            indexed += 1
+        else:
+            failed += 1
+        if on_result is not None:
+            on_result(ok, info)
+    seconds = time.perf_counter() - start
+    return {
+        "indexed": indexed,
+        "failed": failed,
+        "seconds": round(seconds, 2),
+        "docs_per_sec": round(indexed / seconds, 1) if seconds > 0 else 0.0,
+    }
@@ -0,0 +1,130 @@
+"""
+Fusion search: encode + search cùng 1 query trên nhiều model SONG SONG
+(mỗi model 1 worker thread), rồi gộp ranking theo keyframe.
+
+- reciprocal_rank_fusion: RRF, score = Σ w_m / (rrf_k + rank_m)
+- weighted_score_fusion: chuẩn hóa min-max điểm của từng model rồi cộng có trọng số
+
+Tổng latency ~ model chậm nhất thay vì tổng các model
+(torch / gRPC Milvus đều nhả GIL nên thread chạy song song thật).
+"""
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .metrics import propagate_context, stage
+
+_KEYFRAME_RE = re.compile(r"([LK]\d+)/([LK]\d+_V\d+)/([^/]+?)(\.\w+)?$")
+
+FUSION_METHODS = ("rrf", "weighted")
+
+
+def keyframe_key(path: str) -> Tuple[str, str]:
+    """
+    Key để so khớp cùng 1 keyframe giữa các collection (path có thể tương đối / tuyệt đối,
+    khác đuôi file). Trả về (key, path tương đối chuẩn hóa).
+
+    Ví dụ: 'D:/Data/Keyframes/L21/L21_V001/000123.webp' -> ('L21/L21_V001/000123', 'L21/L21_V001/000123.webp')
+    """
+    safe = path.replace("\\", "/")
+    m = _KEYFRAME_RE.search(safe)
+    if not m:
+        return safe.rsplit(".", 1)[0], safe
+    pack, video, frame, ext = m.groups()
+    key = f"{pack}/{video}/{frame}"
+    return key, key + (ext or "")
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[Tuple]], weights: Optional[Sequence[float]] = None,
+                           rrf_k: int = 60) -> List[Tuple[str, float]]:
+    """
+    Gộp nhiều ranking (list (path, score, ...) đã sort giảm dần) bằng RRF.
+    Trả về list (path, fused_score) sort giảm dần.
+    """
+    weights = weights or [1.0] * len(rankings)
+    fused: Dict[str, float] = {}
+    paths: Dict[str, str] = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, item in enumerate(ranking):
+            key, path = keyframe_key(item[0])
+            fused[key] = fused.get(key, 0.0) + weight / (rrf_k + rank + 1)
+            paths.setdefault(key, path)
+    return sorted(((paths[key], score) for key, score in fused.items()), key=lambda x: x[1], reverse=True)
+
+
+def weighted_score_fusion(rankings: Sequence[Sequence[Tuple]],
+                          weights: Optional[Sequence[float]] = None) -> List[Tuple[str, float]]:
+    """
+    Chuẩn hóa min-max điểm của từng ranking về 0-1 rồi cộng có trọng số.
+    Keyframe không xuất hiện trong 1 ranking thì được 0 điểm ở ranking đó.
+    """
+    weights = weights or [1.0] * len(rankings)
+    fused: Dict[str, float] = {}
+    paths: Dict[str, str] = {}
+    for ranking, weight in zip(rankings, weights):
+        if not ranking:
+            continue
+        scores = [item[1] for item in ranking]
+        lo, hi = min(scores), max(scores)
+        for item in ranking:
+            key, path = keyframe_key(item[0])
+            norm = 1.0 if hi == lo else (item[1] - lo) / (hi - lo)
+            fused[key] = fused.get(key, 0.0) + weight * norm
+            paths.setdefault(key, path)
+    return sorted(((paths[key], score) for key, score in fused.items()), key=lambda x: x[1], reverse=True)
+
+
+class FusionSearcher:
+    """
+    Chạy search trên nhiều model của ModelRegistry cùng lúc rồi fusion.
+
+    Args:
+        registry: ModelRegistry
+        max_workers: số thread, dùng chung cho mọi request (mặc định = số model trong registry,
+            chỉ đủ cho 1 request fusion 1 lúc; server nhiều thread nên truyền số model x số thread)
+        rrf_k: hằng số k của RRF
+    """
+
+    def __init__(self, registry, max_workers: Optional[int] = None, rrf_k: int = 60):
+        self.registry = registry
+        self.rrf_k = rrf_k
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers or len(registry.names()), thread_name_prefix="fusion"
+        )
+
+    def _search_one(self, name: str, query: str, k: int, search_params: dict, **scope):
+        return self.registry.get(name).search(query=query, k=k, search_params=search_params, **scope)
+
+    def search(self, query: str, model_names: List[str], k: int, search_params: dict,
+               method: str = "rrf", weights: Optional[Dict[str, float]] = None,
+               packs: Optional[List[str]] = None, videos: Optional[List[str]] = None) -> List[Tuple[str, float]]:
+        """
+        Trả về top-k (path, fused_score). Model lỗi sẽ bị bỏ qua (in cảnh báo),
+        chỉ raise nếu tất cả model đều lỗi.
+        packs / videos: giới hạn phạm vi search của mọi model.
+        """
+        if method not in FUSION_METHODS:
+            raise ValueError(f"Fusion method không hợp lệ: {method} (chọn {FUSION_METHODS})")
+
+        futures = {
+            name: self.executor.submit(propagate_context(self._search_one), name, query, k, search_params,
+                                       packs=packs, videos=videos)
+            for name in model_names
+        }
+        rankings, used_weights, errors = [], [], []
+        for name, future in futures.items():
+            try:
+                rankings.append(future.result())
+                used_weights.append((weights or {}).get(name, 1.0))
+            except Exception as e:
+                print(f"⚠️  Fusion: model '{name}' lỗi: {e}")
+                errors.append(e)
+        if not rankings and errors:
+            raise errors[0]
+
+        with stage("fusion"):
+            if method == "rrf":
+                fused = reciprocal_rank_fusion(rankings, used_weights, rrf_k=self.rrf_k)
+            else:
+                fused = weighted_score_fusion(rankings, used_weights)
+        return fused[:k]
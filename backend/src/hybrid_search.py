@@ -0,0 +1,87 @@
+"""
+HYBRID SEARCH: text (CLIP / SigLIP) + OCR + ASR trong 1 request.
+
+1. Các sub-query chạy SONG SONG (mỗi nguồn 1 thread: encode + Milvus, ES OCR, ES speech)
+2. Hit của mọi nguồn được so khớp theo keyframe (video, frame) - fusion.keyframe_key
+3. Điểm mỗi nguồn chuẩn hóa min-max rồi cộng theo trọng số (fusion.weighted_score_fusion)
+   => keyframe khớp nhiều nguồn cùng lúc được đẩy lên đầu
+
+Trọng số mặc định lấy từ config.ALPHA: text = ALPHA, OCR / ASR chia đều phần còn lại.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .fusion import weighted_score_fusion
+from .metrics import propagate_context, stage
+
+HYBRID_SOURCES = ("text", "ocr", "asr")
+
+
+def default_hybrid_weights(alpha: float) -> Dict[str, float]:
+    """ALPHA = phần tin vào text, OCR và ASR chia đều (1 - ALPHA)."""
+    rest = (1.0 - alpha) / 2
+    return {"text": alpha, "ocr": rest, "asr": rest}
+
+
+def ocr_ranked(ocr_retriever, query: str, k: int, to_rel_path: Callable[[str], str]) -> List[Tuple[str, float]]:
+    """Hit OCR -> list (path tương đối, điểm BM25)."""
+    results = ocr_retriever.search(query, top_k=k, use_fuzzy=True)
+    return [
+        (to_rel_path(r["image_path"]), r.get("_score", 0.0))
+        for r in results.get("keyword", []) if r.get("image_path")
+    ]
+
+
+def asr_ranked(speech_retriever, query: str, k: int, to_rel_path: Callable[[str], str]) -> List[Tuple[str, float]]:
+    """
+    Hit ASR (mỗi hit là 1 đoạn thoại nhiều frame) -> list (path tương đối, điểm BM25 của đoạn).
+    Frame thuộc nhiều đoạn chỉ giữ điểm cao nhất.
+    """
+    results = speech_retriever.search_with_frames(query, k=k, use_fuzzy=True)
+    best: Dict[str, float] = {}
+    for segment in results.get("keyword", []):
+        score = segment.get("_score", 0.0)
+        for frame_path in segment.get("frames", []):
+            path = to_rel_path(frame_path)
+            if score > best.get(path, float("-inf")):
+                best[path] = score
+    return sorted(best.items(), key=lambda x: x[1], reverse=True)
+
+
+class HybridSearcher:
+    """
+    Chạy nhiều nguồn search song song rồi fusion có trọng số.
+
+    Args:
+        max_workers: số thread (mặc định = số nguồn)
+    """
+
+    def __init__(self, max_workers: int = len(HYBRID_SOURCES)):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hybrid")
+
+    def search(self, sources: Dict[str, Callable[[], List[Tuple]]], weights: Dict[str, float],
+               k: Optional[int] = None) -> List[Tuple[str, float]]:
+        """
+        sources: {tên nguồn: hàm không tham số trả về list (path, score, ...) đã sort}
+        weights: {tên nguồn: trọng số}, nguồn không có trong dict = 0 (bỏ qua)
+        Nguồn lỗi bị bỏ qua (in cảnh báo), chỉ raise khi mọi nguồn đều lỗi.
+        Trả về list (path, fused_score) sort giảm dần (tối đa k phần tử nếu có k).
+        """
+        futures = {
+            name: self.executor.submit(propagate_context(fn))
+            for name, fn in sources.items() if weights.get(name, 0) > 0
+        }
+        rankings, used_weights, errors = [], [], []
+        for name, future in futures.items():
+            try:
+                rankings.append(future.result())
+                used_weights.append(weights[name])
+            except Exception as e:
+                print(f"⚠️  Hybrid: nguồn '{name}' lỗi: {e}")
+                errors.append(e)
+        if not rankings and errors:
+            raise errors[0]
+
+        with stage("fusion"):
+            fused = weighted_score_fusion(rankings, used_weights)
+        return fused[:k] if k else fused
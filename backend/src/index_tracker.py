@@ -0,0 +1,132 @@
+"""
+Tracker cho index incremental (OCR / speech): file JSON nào đã index, nội dung còn như cũ không.
+
+- Kiểm tra size + mtime trước: khớp => coi như không đổi, không đọc file
+- Chỉ hash MD5 các file trông như đã đổi (size / mtime lệch, hoặc tracker cũ chỉ có hash),
+  đọc block 1MB, nhiều file song song trên thread pool (hashlib nhả GIL khi hash block lớn)
+- Hash tính lúc kiểm tra được giữ lại cho mark_indexed => không hash file lần 2 sau khi index
+- Ghi tracker: file tạm + os.replace => không bao giờ để lại tracker ghi dở
+
+Format tracker: {path: {"size", "mtime_ns", "md5"}}. Tracker cũ dạng {path: md5} vẫn đọc được
+(lần chạy đầu sẽ hash lại để lấy size / mtime).
+"""
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+HASH_CHUNK_SIZE = 1 << 20
+
+
+def file_hash(filepath: str) -> str:
+    """MD5 của file (đọc block lớn). Lỗi đọc => chuỗi rỗng."""
+    md5 = hashlib.md5()
+    try:
+        with open(filepath, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                md5.update(chunk)
+        return md5.hexdigest()
+    except OSError:
+        return ""
+
+
+def _file_stat(filepath: str) -> Optional[Dict]:
+    try:
+        st = os.stat(filepath)
+    except OSError:
+        return None
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+class IndexTracker:
+    """
+    Args:
+        path: file JSON lưu tracker
+        force: True = coi mọi file là đã đổi (index lại tất cả), bỏ qua tracker cũ
+        hash_workers: số thread hash song song
+    """
+
+    def __init__(self, path: str, force: bool = False, hash_workers: int = 8):
+        self.path = path
+        self.force = force
+        self.hash_workers = hash_workers
+        self.entries: Dict[str, Dict] = {} if force else self._load()
+        self._checked: Dict[str, Dict] = {}   # file đã đổi: stat + md5 tính lúc changed_files
+        self.dirty = False                    # entries đã đổi so với file tracker => cần save()
+
+    def _load(self) -> Dict[str, Dict]:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"⚠️  Không thể đọc tracker {self.path}: {e}")
+            return {}
+        # Tracker cũ: {path: md5}
+        return {p: (v if isinstance(v, dict) else {"md5": v}) for p, v in data.items()}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def changed_files(self, files: List[str]) -> List[str]:
+        """File cần index lại (mới / đã đổi), giữ thứ tự đầu vào. force => entries rỗng => mọi file."""
+        stats = {f: _file_stat(f) for f in files}
+        suspects = []
+        for f in files:
+            entry, st = self.entries.get(f), stats[f]
+            if entry is None or st is None:
+                suspects.append(f)
+            elif entry.get("size") != st["size"] or entry.get("mtime_ns") != st["mtime_ns"]:
+                suspects.append(f)
+
+        with ThreadPoolExecutor(max_workers=self.hash_workers) as pool:
+            hashes = dict(zip(suspects, pool.map(file_hash, suspects)))
+
+        changed = set()
+        for f in suspects:
+            entry, st, md5 = self.entries.get(f), stats[f], hashes[f]
+            if entry is not None and st is not None and md5 and entry.get("md5") == md5:
+                # Chỉ bị touch / copy lại, nội dung không đổi => cập nhật stat, không index lại
+                self.entries[f] = {**st, "md5": md5}
+                self.dirty = True
+            else:
+                changed.add(f)
+                if st is not None:
+                    self._checked[f] = {**st, "md5": md5}
+        return [f for f in files if f in changed]
+
+    def mark_indexed(self, filepath: str):
+        """
+        Ghi nhận file đã index xong, dùng lại stat + hash lúc changed_files (đúng nội dung đã đọc để index:
+        file bị sửa trong lúc index thì lần sau size / mtime lệch và được index lại).
+        """
+        checked = self._checked.pop(filepath, None)
+        if checked is None:
+            st = _file_stat(filepath)
+            if st is None:
+                return
+            checked = {**st, "md5": file_hash(filepath)}
+        self.entries[filepath] = checked
+        self.dirty = True
+
+    def save(self):
+        """Ghi tracker nguyên tử (file tạm rồi os.replace)."""
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, ensure_ascii=False, indent=2)
+            os.replace(tmp, self.path)
+            self.dirty = False
+            print(f"💾 Đã lưu tracker {len(self.entries)} file -> {self.path}")
+        except Exception as e:
+            print(f"⚠️  Không thể lưu tracker: {e}")
+
+    def reset(self):
+        """Xóa tracker (lần index sau sẽ index lại từ đầu)."""
+        self.entries = {}
+        self._checked = {}
+        if os.path.exists(self.path):
+            os.remove(self.path)
+            print(f"🗑️  Đã xóa {self.path}")
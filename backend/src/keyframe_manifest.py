@@ -0,0 +1,269 @@
+"""
+KEYFRAME MANIFEST
+Danh sách keyframe của mọi video, giữ trong RAM thay cho os.listdir mỗi request.
+
+- Mỗi video: mảng frame number đã sort + đuôi file + độ dài số (vd "000123.webp" -> 123, ".webp", 6)
+  => tên file dựng lại được, không cần giữ list string cho từng frame.
+  Video có tên file "lạ" (không phải số / khác đuôi / khác độ dài) thì giữ thêm list tên file.
+- Build 1 lần lúc khởi động, lưu ra file cache (JSON) để lần sau chỉ load.
+- refresh(): chỉ quét lại thư mục pack / video có mtime thay đổi (thêm / xóa file đều đổi mtime thư mục).
+"""
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+_CACHE_VERSION = 1
+
+
+class VideoFrames:
+    __slots__ = ("frames", "ext", "width", "names", "frame_names", "mtime")
+
+    def __init__(self, frames: np.ndarray, ext: str, width: int, mtime: float,
+                 names: Optional[List[str]] = None, frame_names: Optional[List[str]] = None):
+        self.frames = frames            # (N,) int64, đã sort
+        self.ext = ext
+        self.width = width
+        self.mtime = mtime
+        self.names = names              # None nếu mọi file đều dạng f"{frame:0{width}d}{ext}"
+        self.frame_names = frame_names  # tên file song song với frames (chỉ khi names != None)
+
+    @classmethod
+    def from_filenames(cls, filenames: List[str], mtime: float) -> "VideoFrames":
+        names = sorted(f for f in filenames if f.lower().endswith(IMAGE_EXTENSIONS))
+        numbered = []
+        for fname in names:
+            stem, ext = os.path.splitext(fname)
+            if stem.isdigit():
+                numbered.append((int(stem), fname, ext, len(stem)))
+        numbered.sort(key=lambda x: x[0])
+
+        frames = np.array([n[0] for n in numbered], dtype=np.int64)
+        exts = {n[2] for n in numbered}
+        widths = {n[3] for n in numbered}
+        regular = len(numbered) == len(names) and len(exts) <= 1 and len(widths) <= 1
+        if regular:
+            return cls(frames, exts.pop() if exts else ".webp", widths.pop() if widths else 6, mtime)
+        return cls(frames, numbered[0][2] if numbered else ".webp", 0, mtime,
+                   names=names, frame_names=[n[1] for n in numbered])
+
+    def all_names(self) -> List[str]:
+        if self.names is not None:
+            return self.names
+        return [f"{f:0{self.width}d}{self.ext}" for f in self.frames]
+
+    def _range(self, start_frame: int, end_frame: int):
+        lo = int(np.searchsorted(self.frames, start_frame, side="left"))
+        hi = int(np.searchsorted(self.frames, end_frame, side="right"))
+        return lo, hi
+
+    def names_in_range(self, start_frame: int, end_frame: int) -> List[str]:
+        lo, hi = self._range(start_frame, end_frame)
+        if self.frame_names is not None:
+            return self.frame_names[lo:hi]
+        return [f"{f:0{self.width}d}{self.ext}" for f in self.frames[lo:hi]]
+
+    def to_json(self) -> dict:
+        data = {"mtime": self.mtime, "ext": self.ext, "width": self.width, "frames": self.frames.tolist()}
+        if self.names is not None:
+            data["names"] = self.names
+            data["frame_names"] = self.frame_names
+        return data
+
+    @classmethod
+    def from_json(cls, data: dict) -> "VideoFrames":
+        return cls(np.asarray(data["frames"], dtype=np.int64), data["ext"], data["width"], data["mtime"],
+                   names=data.get("names"), frame_names=data.get("frame_names"))
+
+
+class KeyframeManifest:
+    """
+    Args:
+        keyframes_dir: thư mục Keyframes (Keyframes/<pack>/<video>/<frame>.webp)
+        cache_path: file JSON lưu manifest. None = luôn quét lúc khởi động.
+    """
+
+    def __init__(self, keyframes_dir: str, cache_path: Optional[str] = None):
+        self.keyframes_dir = keyframes_dir
+        self.cache_path = cache_path
+        self._videos: Dict[str, VideoFrames] = {}
+        self._pack_mtimes: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._refresher = None
+        self.last_refresh_sec = None
+
+        start = time.perf_counter()
+        if not self._load_cache():
+            self.refresh()
+        else:
+            print(f"✅ Loaded keyframe manifest ({len(self._videos)} videos) from {cache_path} "
+                  f"in {time.perf_counter() - start:.1f}s")
+
+    # ------------------------------------------------------------------ cache file
+    def _load_cache(self) -> bool:
+        if not self.cache_path or not os.path.isfile(self.cache_path):
+            return False
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") != _CACHE_VERSION or data.get("keyframes_dir") != self.keyframes_dir:
+                print("⚠️  Keyframe manifest cache không khớp - quét lại")
+                return False
+            self._pack_mtimes = data["packs"]
+            self._videos = {v: VideoFrames.from_json(d) for v, d in data["videos"].items()}
+            return True
+        except Exception as e:
+            print(f"⚠️  Không đọc được keyframe manifest cache: {e}")
+            return False
+
+    def _save_cache(self):
+        if not self.cache_path:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.cache_path)), exist_ok=True)
+        data = {
+            "version": _CACHE_VERSION,
+            "keyframes_dir": self.keyframes_dir,
+            "packs": self._pack_mtimes,
+            "videos": {v: vf.to_json() for v, vf in self._videos.items()},
+        }
+        tmp_path = self.cache_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.cache_path)
+
+    # ------------------------------------------------------------------ scan
+    def _video_dir(self, video_id: str) -> str:
+        return os.path.join(self.keyframes_dir, video_id.split("_")[0], video_id)
+
+    def _scan_video(self, video_id: str, mtime: Optional[float] = None) -> Optional[VideoFrames]:
+        video_dir = self._video_dir(video_id)
+        try:
+            if mtime is None:
+                mtime = os.stat(video_dir).st_mtime
+            return VideoFrames.from_filenames(os.listdir(video_dir), mtime)
+        except OSError:
+            return None
+
+    def refresh(self) -> Dict[str, int]:
+        """
+        Quét lại phần thay đổi: pack mới / pack có mtime đổi => listdir pack;
+        video mới / video có mtime đổi => listdir video. Video / pack đã bị xóa thì bỏ khỏi manifest.
+        """
+        with self._lock:
+            start = time.perf_counter()
+            scanned = removed = 0
+            if not os.path.isdir(self.keyframes_dir):
+                print(f"⚠️  Không thấy thư mục Keyframes: {self.keyframes_dir}")
+                return {"scanned": 0, "removed": 0}
+
+            packs = {e.name: e.stat().st_mtime for e in os.scandir(self.keyframes_dir) if e.is_dir()}
+            videos = dict(self._videos)
+            for pack in set(self._pack_mtimes) - set(packs):
+                for video_id in [v for v in videos if v.split("_")[0] == pack]:
+                    del videos[video_id]
+                    removed += 1
+
+            for pack, pack_mtime in packs.items():
+                old_ids = {v for v in videos if v.split("_")[0] == pack}
+                if self._pack_mtimes.get(pack) == pack_mtime:
+                    video_mtimes = {}
+                    for video_id in old_ids:
+                        try:
+                            video_mtimes[video_id] = os.stat(self._video_dir(video_id)).st_mtime
+                        except OSError:
+                            pass
+                else:
+                    video_mtimes = {
+                        e.name: e.stat().st_mtime
+                        for e in os.scandir(os.path.join(self.keyframes_dir, pack)) if e.is_dir()
+                    }
+
+                for video_id in old_ids - set(video_mtimes):
+                    del videos[video_id]
+                    removed += 1
+                for video_id, mtime in video_mtimes.items():
+                    current = videos.get(video_id)
+                    if current is not None and current.mtime == mtime:
+                        continue
+                    entry = self._scan_video(video_id, mtime)
+                    if entry is not None:
+                        videos[video_id] = entry
+                        scanned += 1
+
+            self._videos = videos
+            self._pack_mtimes = packs
+            self.last_refresh_sec = time.perf_counter() - start
+            if scanned or removed:
+                self._save_cache()
+            print(f"✅ Keyframe manifest: {len(videos)} videos "
+                  f"({scanned} quét lại, {removed} bị xóa) in {self.last_refresh_sec:.1f}s")
+            return {"scanned": scanned, "removed": removed}
+
+    def start_auto_refresh(self, interval_sec: float = 300.0):
+        """Thread nền gọi refresh() định kỳ."""
+        if self._refresher is not None or not interval_sec:
+            return
+
+        def _loop():
+            while True:
+                time.sleep(interval_sec)
+                try:
+                    self.refresh()
+                except Exception as e:
+                    print(f"⚠️  Lỗi khi refresh keyframe manifest: {e}")
+
+        self._refresher = threading.Thread(target=_loop, name="keyframe-manifest-refresh", daemon=True)
+        self._refresher.start()
+
+    # ------------------------------------------------------------------ lookup
+    def _get(self, video_id: str) -> Optional[VideoFrames]:
+        entry = self._videos.get(video_id)
+        if entry is None:
+            # Video chưa có trong manifest (vừa thêm, chưa tới lượt refresh) => quét riêng video đó
+            entry = self._scan_video(video_id)
+            if entry is not None:
+                self._videos[video_id] = entry
+        return entry
+
+    def has_video(self, video_id: str) -> bool:
+        return self._get(video_id) is not None
+
+    def etag(self, video_id: str) -> Optional[str]:
+        """ETag (không có dấu ngoặc kép) cho danh sách frame của video, đổi khi thư mục video đổi. None nếu không có video."""
+        entry = self._get(video_id)
+        if entry is None:
+            return None
+        return f"{video_id}-{entry.mtime:.0f}-{len(entry.frames)}-{len(entry.names or ())}"
+
+    def all_frames(self, video_id: str) -> List[str]:
+        """Tên file mọi keyframe của video (đã sort), vd ["000000.webp", "000025.webp", ...]."""
+        entry = self._get(video_id)
+        return entry.all_names() if entry is not None else []
+
+    def frames_in_range(self, video_id: str, start_frame: int, end_frame: int) -> List[str]:
+        """Tên file keyframe có frame number trong [start_frame, end_frame] (searchsorted)."""
+        entry = self._get(video_id)
+        return entry.names_in_range(start_frame, end_frame) if entry is not None else []
+
+    def resolve_range(self, video_id: str, start_frame: int, end_frame: int) -> Optional[Dict]:
+        """
+        Frame number trong [start_frame, end_frame] + cách dựng tên file (f"{n:0{width}d}{ext}"),
+        để lưu sẵn vào document ASR lúc index. None nếu không có video hoặc tên file không theo
+        mẫu số (khi đó lúc query dùng frames_in_range).
+        """
+        entry = self._get(video_id)
+        if entry is None or entry.names is not None:
+            return None
+        lo, hi = entry._range(start_frame, end_frame)
+        return {"keyframes": entry.frames[lo:hi].tolist(), "keyframe_ext": entry.ext, "keyframe_width": entry.width}
+
+    def stats(self):
+        return {
+            "videos": len(self._videos),
+            "frames": int(sum(len(v.frames) for v in self._videos.values())),
+            "last_refresh_sec": self.last_refresh_sec,
+        }
@@ -0,0 +1,137 @@
+"""
+Đo thời gian từng stage trên hot path (/search, /sequence-search...) và xuất ra Prometheus.
+
+- stage("text_encode"): context manager đo 1 stage => ghi vào histogram aic_stage_duration_seconds
+  (label stage) và vào bảng thời gian của request hiện tại (trả về khi /search?debug=1)
+- Bảng thời gian của request nằm trong ContextVar: thread con (hybrid / fusion executor) chỉ thấy
+  nếu hàm được submit qua propagate_context(fn)
+- render_prometheus(): text format 0.0.4 cho endpoint /metrics
+
+Số liệu là của từng process: chạy gunicorn nhiều worker thì mỗi lần scrape chỉ thấy 1 worker.
+"""
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+# Từ 1ms (cache hit) tới 10s (dịch / ES bị treo)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Histogram Prometheus có label (bucket tích lũy, _sum, _count), thread-safe."""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], list] = {}   # labels -> [counts theo bucket (+Inf cuối), sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues: str):
+        idx = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][idx] += 1
+            series[1] += value
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((labels, list(counts), total) for labels, (counts, total) in self._series.items())
+        for labelvalues, counts, total in series:
+            labels = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(self.labelnames, labelvalues))
+            sep = "," if labels else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{self.name}_bucket{{{labels}{sep}le="{le}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{labels}}} {total}")
+            lines.append(f"{self.name}_count{{{labels}}} {cumulative}")
+        return "\n".join(lines)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+STAGE_SECONDS = Histogram(
+    "aic_stage_duration_seconds",
+    "Thời gian từng stage của request (dịch, encode, Milvus, Elasticsearch, quét frame, encode JSON...)",
+    labelnames=("stage",)
+)
+REQUEST_SECONDS = Histogram(
+    "aic_request_duration_seconds",
+    "Tổng thời gian xử lý request theo endpoint và status",
+    labelnames=("endpoint", "status")
+)
+_HISTOGRAMS = [STAGE_SECONDS, REQUEST_SECONDS]
+
+
+class RequestTimings:
+    """Tổng ms + số lần gọi của từng stage trong 1 request (các thread con cộng dồn chung)."""
+
+    def __init__(self):
+        self._stages: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, seconds: float):
+        with self._lock:
+            entry = self._stages.setdefault(name, [0.0, 0])
+            entry[0] += seconds * 1000
+            entry[1] += 1
+
+    def as_dict(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {name: {"ms": round(ms, 2), "calls": calls} for name, (ms, calls) in self._stages.items()}
+
+
+_current_timings: contextvars.ContextVar[Optional[RequestTimings]] = contextvars.ContextVar(
+    "aic_request_timings", default=None
+)
+
+
+def start_request() -> RequestTimings:
+    """Gọi đầu mỗi request: tạo bảng thời gian mới cho context hiện tại."""
+    timings = RequestTimings()
+    _current_timings.set(timings)
+    return timings
+
+
+def current_timings() -> Optional[RequestTimings]:
+    return _current_timings.get()
+
+
+@contextmanager
+def stage(name: str):
+    """with stage("milvus_search"): ... => histogram + bảng thời gian của request (nếu có)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, name)
+        timings = _current_timings.get()
+        if timings is not None:
+            timings.add(name, elapsed)
+
+
+def observe_request(endpoint: str, status: int, seconds: float):
+    REQUEST_SECONDS.observe(seconds, endpoint, str(status))
+
+
+def propagate_context(fn: Callable) -> Callable:
+    """Bọc fn để chạy trong bản copy context hiện tại (dùng khi submit vào ThreadPoolExecutor)."""
+    ctx = contextvars.copy_context()
+    return lambda *args, **kwargs: ctx.run(fn, *args, **kwargs)
+
+
+def render_prometheus() -> str:
+    return "\n".join(h.render() for h in _HISTOGRAMS) + "\n"
@@ -0,0 +1,186 @@
+"""
+Model registry: biết mọi model embedding + collection tương ứng,
+chỉ load model khi có request đầu tiên dùng tới (lazy), dùng chung 1 connection Milvus,
+và có thể unload model không dùng lâu để trả lại RAM/VRAM.
+
+Ví dụ:
+    registry = ModelRegistry(specs, milvus_host, milvus_port, embedding_cache=cache)
+    retriever = registry.get("SIGLIP_COLLECTION")   # lần đầu mới load
+    retriever.search(query, k, search_params)
+"""
+import gc
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set
+
+import torch
+
+from .caching import EmbeddingCache
+from .numpy_search import NumpyCollection
+from .retrieval_system import (
+    BaseRetrievalSystem, RetrievalSystem, RetrievalSystemApple, RetrievalSystemSiglipNoCap
+)
+
+# Tên loại retriever dùng trong ModelSpec -> class
+RETRIEVER_CLASSES = {
+    "openclip": RetrievalSystem,
+    "siglip_nocap": RetrievalSystemSiglipNoCap,
+    "apple": RetrievalSystemApple,
+}
+
+
+@dataclass
+class ModelSpec:
+    """
+    Mô tả 1 model: loại retriever, tên model, pretrained và collection Milvus.
+    numpy_source: tham số cho NumpyCollection (features_dir, dim, patterns...) khi chạy không có Milvus.
+    """
+    kind: str
+    model_name: str
+    collection_name: str
+    pretrained: Optional[str] = None
+    numpy_source: Optional[Dict[str, Any]] = None
+    extra: Dict[str, Any] = field(default_factory=dict)
+
+
+class ModelRegistry:
+    """
+    Quản lý các retriever theo tên mode (vd "SIGLIP_COLLECTION").
+
+    - get(name): trả về retriever, load lazily lần đầu (có lock theo từng model
+      để 2 request đồng thời không load trùng).
+    - unload(name) / unload_idle(): bỏ tham chiếu tới model để GC thu hồi bộ nhớ.
+      Request đang chạy vẫn giữ tham chiếu riêng nên không bị hỏng giữa chừng.
+      Model đã preload() không bị unload_idle() bỏ: bản preload được chia sẻ copy-on-write
+      giữa các worker, unload rồi load lại thì mỗi worker giữ 1 bản riêng.
+    """
+
+    def __init__(self, specs: Dict[str, ModelSpec], milvus_host: str, milvus_port: str,
+                 embedding_cache: Optional[EmbeddingCache] = None,
+                 idle_unload_sec: Optional[float] = None,
+                 vector_backend: str = "milvus"):
+        """vector_backend: "milvus" hoặc "numpy" (search thẳng trên *_features.npy)."""
+        if vector_backend not in ("milvus", "numpy"):
+            raise ValueError(f"vector_backend không hợp lệ: {vector_backend}")
+        self.specs = dict(specs)
+        self.vector_backend = vector_backend
+        self.milvus_host = milvus_host
+        self.milvus_port = milvus_port
+        self.embedding_cache = embedding_cache
+        self.idle_unload_sec = idle_unload_sec
+
+        self._retrievers: Dict[str, BaseRetrievalSystem] = {}
+        self._last_used: Dict[str, float] = {}
+        self._load_seconds: Dict[str, float] = {}
+        self._preloaded: Set[str] = set()   # model load qua preload(), không unload khi idle
+        self._locks = {name: threading.Lock() for name in self.specs}
+        self._lock = threading.Lock()
+        self._reaper: Optional[threading.Thread] = None
+
+    def names(self) -> List[str]:
+        return list(self.specs)
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._retrievers
+
+    def get(self, name: str) -> BaseRetrievalSystem:
+        if name not in self.specs:
+            raise KeyError(f"Model '{name}' không có trong registry (có: {', '.join(self.specs)})")
+
+        retriever = self._retrievers.get(name)
+        if retriever is None:
+            with self._locks[name]:
+                retriever = self._retrievers.get(name)
+                if retriever is None:
+                    retriever = self._build(name)
+                    with self._lock:
+                        self._retrievers[name] = retriever
+        self._last_used[name] = time.monotonic()
+        return retriever
+
+    def _build(self, name: str) -> BaseRetrievalSystem:
+        spec = self.specs[name]
+        cls = RETRIEVER_CLASSES[spec.kind]
+        kwargs = dict(
+            model_name=spec.model_name,
+            milvus_host=self.milvus_host,
+            milvus_port=self.milvus_port,
+            collection_name_hnsw=spec.collection_name,
+            embedding_cache=self.embedding_cache,
+            **spec.extra
+        )
+        if spec.pretrained is not None:
+            kwargs["pretrained"] = spec.pretrained
+        if self.vector_backend == "numpy":
+            if not spec.numpy_source:
+                raise ValueError(f"Model '{name}' chưa cấu hình numpy_source")
+            kwargs["collection"] = NumpyCollection(name=spec.collection_name, **spec.numpy_source)
+
+        print(f"📦 Lazy loading model '{name}'...")
+        start = time.perf_counter()
+        retriever = cls(**kwargs)
+        self._load_seconds[name] = time.perf_counter() - start
+        print(f"✅ Model '{name}' sẵn sàng sau {self._load_seconds[name]:.1f}s")
+        return retriever
+
+    def preload(self, names: List[str]):
+        """Load trước 1 số model (vd khi muốn chia sẻ copy-on-write giữa các worker)."""
+        for name in names:
+            self.get(name)
+            self._preloaded.add(name)
+
+    def unload(self, name: str) -> bool:
+        with self._lock:
+            retriever = self._retrievers.pop(name, None)
+            self._last_used.pop(name, None)
+            self._preloaded.discard(name)
+        if retriever is None:
+            return False
+        del retriever
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        print(f"🗑️  Đã unload model '{name}'")
+        return True
+
+    def unload_idle(self, max_idle_sec: Optional[float] = None) -> List[str]:
+        """Unload các model không được dùng trong max_idle_sec giây (trừ model đã preload)."""
+        max_idle_sec = self.idle_unload_sec if max_idle_sec is None else max_idle_sec
+        if max_idle_sec is None:
+            return []
+        now = time.monotonic()
+        idle = [name for name, last in list(self._last_used.items())
+                if now - last > max_idle_sec and name not in self._preloaded]
+        return [name for name in idle if self.unload(name)]
+
+    def start_idle_reaper(self, interval_sec: float = 60.0):
+        """Chạy thread nền định kỳ gọi unload_idle()."""
+        if self.idle_unload_sec is None or self._reaper is not None:
+            return
+
+        def _loop():
+            while True:
+                time.sleep(interval_sec)
+                try:
+                    self.unload_idle()
+                except Exception as e:
+                    print(f"⚠️  Lỗi khi unload model idle: {e}")
+
+        self._reaper = threading.Thread(target=_loop, name="model-idle-reaper", daemon=True)
+        self._reaper.start()
+
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        now = time.monotonic()
+        return {
+            name: {
+                "loaded": name in self._retrievers,
+                "preloaded": name in self._preloaded,
+                "collection": spec.collection_name,
+                "backend": self.vector_backend,
+                "model": spec.model_name,
+                "idle_sec": (now - self._last_used[name]) if name in self._last_used else None,
+                "load_sec": self._load_seconds.get(name),
+            }
+            for name, spec in self.specs.items()
+        }
@@ -0,0 +1,354 @@
+"""
+NUMPY VECTOR SEARCH BACKEND
+Drop-in cho pymilvus.Collection (phần search) đọc thẳng các file *_features.npy
+theo từng pack bằng memmap - không cần container Milvus.
+
+Tính năng:
+✅ Exact search: nhân ma trận theo block + top-k (argpartition), recall tuyệt đối
+✅ IVF (tùy chọn): coarse index k-means, chỉ quét nprobe cụm gần nhất
+✅ Lọc theo pack qua partition_names (mỗi pack ~ 1 partition)
+✅ Lọc theo video qua expr tiền tố path (dạng search_scope.prefix_expr)
+
+Dùng làm:
+- backend cho laptop / deployment nhỏ (không tốn thời gian load collection Milvus)
+- ground truth exact để đo recall khi tune HNSW
+"""
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from .search_scope import parse_prefix_expr
+
+
+def _to_rel_path(abs_path: str, keyframes_base_dir: str) -> str:
+    """Chuyển path trong mapping sang dạng lưu trong Milvus (giống utils/database_saving_new.py)."""
+    if os.path.splitdrive(abs_path)[0] != os.path.splitdrive(keyframes_base_dir)[0]:
+        return abs_path
+    return os.path.relpath(abs_path, keyframes_base_dir).replace("\\", "/")
+
+
+def _open_features(features_path: str, num_rows: int, dim: int) -> np.ndarray:
+    """Mở features bằng memmap: file .npy chuẩn thì đọc header, file raw thì tự đặt shape."""
+    try:
+        features = np.load(features_path, mmap_mode="r")
+        return features.reshape(-1, dim)
+    except ValueError:
+        return np.memmap(features_path, dtype=np.float32, mode="r", shape=(num_rows, dim))
+
+
+def _merge_topk(best_scores, best_rows, scores, rows, k):
+    """Gộp top-k hiện tại với ứng viên mới (theo từng query, axis=1)."""
+    all_scores = np.concatenate([best_scores, scores], axis=1)
+    all_rows = np.concatenate([best_rows, rows], axis=1)
+    if all_scores.shape[1] > k:
+        idx = np.argpartition(-all_scores, k - 1, axis=1)[:, :k]
+        all_scores = np.take_along_axis(all_scores, idx, axis=1)
+        all_rows = np.take_along_axis(all_rows, idx, axis=1)
+    return all_scores, all_rows
+
+
+class NumpyHit:
+    """Giống pymilvus Hit: có .id, .score, .distance và .entity.get(field)."""
+    __slots__ = ("id", "score", "distance", "entity")
+
+    def __init__(self, hit_id: int, score: float, entity: Dict[str, Any]):
+        self.id = hit_id
+        self.score = score
+        self.distance = score
+        self.entity = entity
+
+
+class _Pack:
+    __slots__ = ("name", "features", "inv_norm", "paths", "start")
+
+    def __init__(self, name, features, inv_norm, paths, start):
+        self.name = name
+        self.features = features    # memmap (N, D)
+        self.inv_norm = inv_norm    # (N,) 1/||v||, 0 nếu vector hỏng hoặc không có trong mapping
+        self.paths = paths          # (N,) object, path theo từng dòng
+        self.start = start          # vị trí dòng đầu tiên trong không gian dòng toàn cục
+
+
+class NumpyCollection:
+    """
+    Collection "giả" phục vụ search() trực tiếp từ các ma trận memmap.
+
+    Args:
+        features_dir: thư mục chứa features + mapping
+        packs: danh sách pack (vd ["K01", ..., "L30"])
+        dim: số chiều vector
+        keyframes_base_dir: gốc Keyframes, để đổi path tuyệt đối trong mapping sang path tương đối
+        features_pattern / mapping_pattern: tên file theo pack, vd "{pack}_ViT-SO400M-14-SigLIP-384_features.npy"
+        block_size: số dòng mỗi block khi nhân ma trận
+        ivf_nlist: số cụm IVF (None = chỉ exact search)
+        ivf_cache_path: file .npz lưu centroid + gán cụm, để lần sau không phải train lại
+    """
+
+    def __init__(self, features_dir: str, packs: List[str], dim: int, keyframes_base_dir: str,
+                 features_pattern: str = "{pack}_features.npy",
+                 mapping_pattern: str = "{pack}_mapping.json",
+                 block_size: int = 65536,
+                 ivf_nlist: Optional[int] = None,
+                 ivf_cache_path: Optional[str] = None,
+                 name: str = "numpy"):
+        self.name = name
+        self.dim = dim
+        self.block_size = block_size
+        self._packs: List[_Pack] = []
+        self._pack_by_name: Dict[str, _Pack] = {}
+        self.num_entities = 0
+
+        print(f"Loading NumPy collection '{name}' from {features_dir}...")
+        for pack_name in packs:
+            features_path = os.path.join(features_dir, features_pattern.format(pack=pack_name))
+            mapping_path = os.path.join(features_dir, mapping_pattern.format(pack=pack_name))
+            if not os.path.isfile(features_path) or not os.path.isfile(mapping_path):
+                print(f"⚠️ Skip {pack_name}, missing features or mapping.")
+                continue
+
+            with open(mapping_path, "r", encoding="utf-8") as f:
+                mapping = json.load(f)
+
+            features = _open_features(features_path, len(mapping), dim)
+            paths = np.empty(features.shape[0], dtype=object)
+            for abs_path, local_id in mapping.items():
+                if 0 <= local_id < len(paths):
+                    paths[local_id] = _to_rel_path(abs_path, keyframes_base_dir)
+
+            inv_norm = self._inverse_norms(features)
+            inv_norm[paths == None] = 0.0  # noqa: E711 - dòng không có trong mapping
+
+            pack = _Pack(pack_name, features, inv_norm, paths, self.num_entities)
+            self._packs.append(pack)
+            self._pack_by_name[pack_name] = pack
+            self.num_entities += features.shape[0]
+
+        print(f"✅ NumPy collection '{name}': {len(self._packs)} packs, {self.num_entities} vectors.")
+
+        self._ivf_centroids: Optional[np.ndarray] = None
+        self._ivf_lists: Optional[List[np.ndarray]] = None
+        if ivf_nlist:
+            self.build_ivf(ivf_nlist, cache_path=ivf_cache_path)
+
+    # ------------------------------------------------------------------ helpers
+    def _inverse_norms(self, features: np.ndarray) -> np.ndarray:
+        inv_norm = np.empty(features.shape[0], dtype=np.float32)
+        for start in range(0, features.shape[0], self.block_size):
+            block = np.asarray(features[start:start + self.block_size], dtype=np.float32)
+            norms = np.linalg.norm(block, axis=1)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                inv = 1.0 / norms
+            inv[~np.isfinite(inv)] = 0.0
+            inv_norm[start:start + len(block)] = inv
+        return inv_norm
+
+    def _select_packs(self, partition_names: Optional[List[str]]) -> List[_Pack]:
+        if not partition_names:
+            return self._packs
+        return [self._pack_by_name[p] for p in partition_names if p in self._pack_by_name]
+
+    def _locate(self, rows: np.ndarray):
+        """Đổi chỉ số dòng toàn cục -> (pack, dòng cục bộ)."""
+        starts = np.array([p.start for p in self._packs])
+        pack_idx = np.searchsorted(starts, rows, side="right") - 1
+        return pack_idx, rows - starts[pack_idx]
+
+    def _prefix_mask(self, pack: _Pack, prefixes: List[str]) -> np.ndarray:
+        """True cho các dòng có path bắt đầu bằng 1 trong các tiền tố."""
+        prefixes = tuple(prefixes)
+        return np.fromiter(
+            (p is not None and p.startswith(prefixes) for p in pack.paths),
+            dtype=bool, count=len(pack.paths)
+        )
+
+    def _make_hits(self, scores: np.ndarray, rows: np.ndarray, output_fields: List[str]) -> List[NumpyHit]:
+        if len(rows) == 0:
+            return []
+        order = np.argsort(-scores, kind="stable")
+        pack_idx, local = self._locate(rows[order])
+        hits = []
+        for i, (p, r) in zip(order, zip(pack_idx, local)):
+            if scores[i] == -np.inf:
+                continue
+            path = self._packs[p].paths[r]
+            entity = {field: (path if field == "path" else None) for field in output_fields}
+            hits.append(NumpyHit(int(rows[i]), float(scores[i]), entity))
+        return hits
+
+    # ------------------------------------------------------------------ exact
+    def _search_exact(self, queries: np.ndarray, k: int, packs: List[_Pack],
+                      prefixes: Optional[List[str]] = None):
+        nq = queries.shape[0]
+        best_scores = np.full((nq, 0), -np.inf, dtype=np.float32)
+        best_rows = np.zeros((nq, 0), dtype=np.int64)
+
+        for pack in packs:
+            n = pack.features.shape[0]
+            keep = self._prefix_mask(pack, prefixes) if prefixes else None
+            if keep is not None and not keep.any():
+                continue
+            for start in range(0, n, self.block_size):
+                if keep is not None and not keep[start:start + self.block_size].any():
+                    continue
+                block = np.asarray(pack.features[start:start + self.block_size], dtype=np.float32)
+                scores = (queries @ block.T) * pack.inv_norm[start:start + len(block)]
+                scores[:, pack.inv_norm[start:start + len(block)] == 0] = -np.inf
+                if keep is not None:
+                    scores[:, ~keep[start:start + len(block)]] = -np.inf
+                rows = np.broadcast_to(
+                    np.arange(pack.start + start, pack.start + start + len(block)), scores.shape
+                )
+                if scores.shape[1] > k:
+                    idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                    scores = np.take_along_axis(scores, idx, axis=1)
+                    rows = np.take_along_axis(rows, idx, axis=1)
+                best_scores, best_rows = _merge_topk(best_scores, best_rows, scores, rows, k)
+
+        return best_scores, best_rows
+
+    # ------------------------------------------------------------------ IVF
+    def _gather(self, rows: np.ndarray) -> np.ndarray:
+        """Lấy vector (đã chuẩn hóa) theo chỉ số dòng toàn cục."""
+        pack_idx, local = self._locate(rows)
+        out = np.empty((len(rows), self.dim), dtype=np.float32)
+        for p in np.unique(pack_idx):
+            mask = pack_idx == p
+            pack = self._packs[p]
+            out[mask] = np.asarray(pack.features[local[mask]], dtype=np.float32) \
+                * pack.inv_norm[local[mask], None]
+        return out
+
+    def build_ivf(self, nlist: int, cache_path: Optional[str] = None, sample_size: int = 100_000,
+                  iters: int = 10, seed: int = 0):
+        """Train k-means (spherical, theo inner product) rồi gán mọi vector vào cụm gần nhất."""
+        if cache_path and os.path.isfile(cache_path):
+            data = np.load(cache_path)
+            if int(data["num_entities"]) == self.num_entities and data["centroids"].shape[0] == nlist:
+                self._ivf_centroids = data["centroids"]
+                self._set_ivf_lists(data["assign"], nlist)
+                print(f"✅ Loaded IVF index ({nlist} lists) from {cache_path}")
+                return
+            print("⚠️  IVF cache không khớp dữ liệu hiện tại - train lại")
+
+        print(f"🔨 Training IVF coarse index ({nlist} lists)...")
+        start_time = time.perf_counter()
+        rng = np.random.default_rng(seed)
+        valid_rows = np.concatenate([
+            pack.start + np.flatnonzero(pack.inv_norm > 0) for pack in self._packs
+        ]) if self._packs else np.zeros(0, dtype=np.int64)
+        sample_rows = np.sort(rng.choice(valid_rows, size=min(sample_size, len(valid_rows)), replace=False))
+        sample = self._gather(sample_rows)
+
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+        for _ in range(iters):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = sample[assign == c]
+                if len(members):
+                    centroids[c] = members.sum(axis=0)
+                else:
+                    centroids[c] = sample[rng.integers(len(sample))]
+            centroids /= np.linalg.norm(centroids, axis=1, keepdims=True) + 1e-12
+
+        assign = np.full(self.num_entities, -1, dtype=np.int32)
+        for pack in self._packs:
+            n = pack.features.shape[0]
+            for s in range(0, n, self.block_size):
+                block = np.asarray(pack.features[s:s + self.block_size], dtype=np.float32)
+                block_assign = np.argmax(block @ centroids.T, axis=1).astype(np.int32)
+                block_assign[pack.inv_norm[s:s + len(block)] == 0] = -1
+                assign[pack.start + s:pack.start + s + len(block)] = block_assign
+
+        self._ivf_centroids = centroids
+        self._set_ivf_lists(assign, nlist)
+        print(f"✅ IVF index built in {time.perf_counter() - start_time:.1f}s")
+
+        if cache_path:
+            os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+            np.savez(cache_path, centroids=centroids, assign=assign,
+                     num_entities=np.int64(self.num_entities))
+
+    def _set_ivf_lists(self, assign: np.ndarray, nlist: int):
+        order = np.argsort(assign, kind="stable")
+        counts = np.bincount(assign[assign >= 0], minlength=nlist)
+        offset = int(np.sum(assign < 0))
+        bounds = np.concatenate([[0], np.cumsum(counts)]) + offset
+        self._ivf_lists = [order[bounds[c]:bounds[c + 1]] for c in range(nlist)]
+
+    def _search_ivf(self, queries: np.ndarray, k: int, nprobe: int, packs: List[_Pack],
+                    prefixes: Optional[List[str]] = None):
+        allowed = None
+        if len(packs) != len(self._packs):
+            allowed = [(p.start, p.start + p.features.shape[0]) for p in packs]
+        keep = None
+        if prefixes:
+            keep = np.zeros(self.num_entities, dtype=bool)
+            for p in packs:
+                keep[p.start:p.start + p.features.shape[0]] = self._prefix_mask(p, prefixes)
+
+        nq = queries.shape[0]
+        out_scores = np.full((nq, k), -np.inf, dtype=np.float32)
+        out_rows = np.zeros((nq, k), dtype=np.int64)
+        probe = np.argsort(-(queries @ self._ivf_centroids.T), axis=1)[:, :nprobe]
+        for qi in range(nq):
+            rows = np.sort(np.concatenate([self._ivf_lists[c] for c in probe[qi]]))
+            if allowed is not None:
+                mask = np.zeros(len(rows), dtype=bool)
+                for lo, hi in allowed:
+                    mask |= (rows >= lo) & (rows < hi)
+                rows = rows[mask]
+            if keep is not None:
+                rows = rows[keep[rows]]
+            if len(rows) == 0:
+                continue
+            scores = self._gather(rows) @ queries[qi]
+            take = min(k, len(rows))
+            idx = np.argpartition(-scores, take - 1)[:take]
+            out_scores[qi, :take] = scores[idx]
+            out_rows[qi, :take] = rows[idx]
+        return out_scores, out_rows
+
+    # ------------------------------------------------------------------ API
+    def load(self):
+        """Cho giống Collection.load() - memmap không cần load trước."""
+        return None
+
+    def release(self):
+        return None
+
+    def search(self, data, anns_field: str = "embedding", param: Optional[dict] = None,
+               limit: int = 10, output_fields: Optional[List[str]] = None,
+               expr: Optional[str] = None, partition_names: Optional[List[str]] = None,
+               **kwargs) -> List[List[NumpyHit]]:
+        """
+        Cùng chữ ký với pymilvus.Collection.search. Metric luôn là IP trên vector đã chuẩn hóa
+        (giống collection Milvus đã tạo với metric_type="IP").
+        param["params"]["nprobe"] được dùng khi đã build IVF; "ef" bị bỏ qua.
+        expr: chỉ hỗ trợ lọc tiền tố path, vd 'path like "L21/L21_V001/%"'.
+        """
+        prefixes = parse_prefix_expr(expr) if expr else None   # expr khác dạng => ScopeError
+        output_fields = output_fields or ["path"]
+        queries = np.asarray(data, dtype=np.float32).reshape(-1, self.dim)
+        packs = self._select_packs(partition_names)
+        k = max(1, int(limit))
+
+        nprobe = ((param or {}).get("params") or {}).get("nprobe")
+        if self._ivf_lists is not None and nprobe:
+            scores, rows = self._search_ivf(queries, k, int(nprobe), packs, prefixes)
+        else:
+            scores, rows = self._search_exact(queries, k, packs, prefixes)
+
+        return [self._make_hits(scores[i], rows[i], output_fields) for i in range(len(queries))]
+
+    def sample_vectors(self, n: int, seed: int = 0) -> np.ndarray:
+        """Lấy ngẫu nhiên n vector (đã chuẩn hóa) trong collection - dùng làm query khi đo recall."""
+        rng = np.random.default_rng(seed)
+        valid_rows = np.concatenate([pack.start + np.flatnonzero(pack.inv_norm > 0) for pack in self._packs])
+        rows = np.sort(rng.choice(valid_rows, size=min(n, len(valid_rows)), replace=False))
+        return self._gather(rows)
+
+    def has_partition(self, partition_name: str) -> bool:
+        return partition_name in self._pack_by_name
@@ -16,24 +16,15 @@ from sentence_transformers import SentenceTransformer
 from tqdm import tqdm
 from typing import List, Dict
 import warnings
-import hashlib
+from collections import deque
+from .es_bulk import bulk_load_settings, delete_by_source, parallel_index, stable_doc_id
+from .index_tracker import IndexTracker
+from .metrics import stage
 warnings.filterwarnings('ignore')
 
 
 # ========================== HELPER FUNCTIONS ==========================
 
-def get_file_hash(filepath: str) -> str:
-    """Tính hash của file để phát hiện thay đổi"""
-    hash_md5 = hashlib.md5()
-    try:
-        with open(filepath, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                hash_md5.update(chunk)
-        return hash_md5.hexdigest()
-    except Exception:
-        return ""
-
-
 def extract_video_and_frame_from_path(image_path: str) -> tuple:
     """
     Extract video name và frame number từ đường dẫn
@@ -76,7 +67,9 @@ class OCRRetrievalES:
         index_name: str = "ocr_index_new",
         load_data: bool = False,
         force_reindex: bool = False,
-        index_tracker_file: str = ".indexed_ocr_files.json"
+        index_tracker_file: str = ".indexed_ocr_files.json",
+        bulk_chunk_size: int = 1000,
+        bulk_threads: int = 4
     ):
         """
         Khởi tạo OCR Retrieval System
@@ -88,8 +81,12 @@ class OCRRetrievalES:
             load_data: Có load dữ liệu vào ES không
             force_reindex: True = index lại tất cả
             index_tracker_file: File JSON lưu danh sách file đã index
+            bulk_chunk_size: Số document mỗi request bulk
+            bulk_threads: Số request bulk gửi song song
         """
         self.ocr_json_dir = ocr_json_dir
+        self.bulk_chunk_size = bulk_chunk_size
+        self.bulk_threads = bulk_threads
         self.index_name = index_name
         self.force_reindex = force_reindex
         self.index_tracker_file = index_tracker_file
@@ -98,10 +95,14 @@ class OCRRetrievalES:
         print("🚀 KHỞI ĐỘNG OCR RETRIEVAL SYSTEM")
         print("="*80)
         
-        # Load danh sách file đã index
-        self.indexed_files = self._load_indexed_files()
+        # Tracker file đã index (size + mtime, MD5 khi cần)
+        if force_reindex:
+            print("\n⚠️  Force reindex enabled - sẽ index lại tất cả file")
+        self.tracker = IndexTracker(index_tracker_file, force=force_reindex)
+        print(f"\n📋 Đã load thông tin {len(self.tracker)} file đã index")
         
         # Kết nối Elasticsearch
+        self.host = host
         self._connect_elasticsearch(host)
         
 
@@ -113,47 +114,9 @@ class OCRRetrievalES:
         if load_data:
             self._index_data()
 
-    def _load_indexed_files(self) -> Dict[str, str]:
-        """Load danh sách file đã index từ file JSON"""
-        if self.force_reindex:
-            print("\n⚠️  Force reindex enabled - sẽ index lại tất cả file")
-            return {}
-        
-        if os.path.exists(self.index_tracker_file):
-            try:
-                with open(self.index_tracker_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                print(f"\n📋 Đã load thông tin {len(data)} file đã index")
-                return data
-            except Exception as e:
-                print(f"\n⚠️  Không thể đọc {self.index_tracker_file}: {e}")
-                return {}
-        else:
-            print(f"\n📋 File tracker chưa tồn tại - sẽ tạo mới")
-            return {}
-
-    def _save_indexed_files(self):
-        """Lưu danh sách file đã index vào file JSON"""
-        try:
-            with open(self.index_tracker_file, 'w', encoding='utf-8') as f:
-                json.dump(self.indexed_files, f, ensure_ascii=False, indent=2)
-            print(f"\n💾 Đã lưu thông tin {len(self.indexed_files)} file")
-        except Exception as e:
-            print(f"\n⚠️  Không thể lưu tracker: {e}")
-
-    def _should_index_file(self, filepath: str) -> bool:
-        """Kiểm tra xem file có cần index không"""
-        if self.force_reindex:
-            return True
-        
-        current_hash = get_file_hash(filepath)
-        
-        if filepath in self.indexed_files:
-            stored_hash = self.indexed_files[filepath]
-            if stored_hash == current_hash:
-                return False
-        
-        return True
+    def reconnect(self):
+        """Tạo lại client Elasticsearch (gọi trong worker sau khi fork)."""
+        self._connect_elasticsearch(self.host)
 
     def _connect_elasticsearch(self, host: str):
         """Kết nối tới Elasticsearch"""
@@ -226,10 +189,10 @@ class OCRRetrievalES:
                     all_files.append(os.path.join(root, file))
         
         print(f"📊 Tổng số file JSON: {len(all_files)}")
-        print(f"📋 Số file đã index trước đó: {len(self.indexed_files)}")
+        print(f"📋 Số file đã index trước đó: {len(self.tracker)}")
         
         # Lọc file cần index
-        files_to_index = [f for f in all_files if self._should_index_file(f)]
+        files_to_index = self.tracker.changed_files(all_files)
         files_skipped = len(all_files) - len(files_to_index)
         
         print(f"🆕 File cần index: {len(files_to_index)}")
@@ -237,57 +200,100 @@ class OCRRetrievalES:
         
         if len(files_to_index) == 0:
             print("\n✅ Không có file mới - Bỏ qua indexing")
+            if self.tracker.dirty:   # file chỉ bị touch / tracker cũ => lưu stat mới, lần sau khỏi hash lại
+                self.tracker.save()
             return
         
         print()
-        
-        count = 0
-        indexed_count = 0
-        
+
+        # Action đi qua parallel_bulk theo đúng thứ tự sinh ra => source_files[i] là file của action thứ i
+        source_files = deque()
+        failed_files = set()
+        unreadable = set()
+
+        def on_result(ok, info):
+            source = source_files.popleft()
+            if not ok:
+                failed_files.add(source)
+                if len(failed_files) <= 5:
+                    print(f"   ⚠️  Lỗi index ({os.path.basename(source)}): {info}")
+
+        deleted = [0]
+        actions = self._iter_actions(files_to_index, source_files, unreadable, deleted)
+        with bulk_load_settings(self.es, self.index_name):
+            stats = parallel_index(self.es, actions, chunk_size=self.bulk_chunk_size,
+                                   thread_count=self.bulk_threads, on_result=on_result)
+        if deleted[0]:
+            print(f"🧹 Đã xóa {deleted[0]:,} document cũ của các file thay đổi")
+
+        # Chỉ đánh dấu file đã index khi mọi entry của file đều vào ES
         for full_path in files_to_index:
-            try:
-                with open(full_path, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                
-                file_display = os.path.basename(full_path)
-                print(f"📄 {file_display} ({len(data)} entries)")
-                
-                # Index từng entry
-                for image_path, ocr_data in tqdm(data.items(), desc=f"  Indexing", leave=False):
-                    # ocr_data format: ["filename.webp", "text content"]
-                    if not isinstance(ocr_data, list) or len(ocr_data) < 2:
-                        continue
-                    
-                    filename = ocr_data[0]
-                    text = ocr_data[1].strip()
-                    
-                    if not text:
-                        continue
-                    
-                    # Extract video name và frame number
-                    video_name, frame_idx = extract_video_and_frame_from_path(image_path)
-                    
-                    doc = {
-                        "text": text,
-                        "image_path": image_path,
-                        "filename": filename,
-                        "video_name": video_name,
-                        "frame_idx": frame_idx,
-                        "source_file": full_path
-                    }
+            if full_path not in failed_files and full_path not in unreadable:
+                self.tracker.mark_indexed(full_path)
+
+        print(f"\n🎉 Đã index {stats['indexed']:,} documents trong {stats['seconds']:.1f}s "
+              f"({stats['docs_per_sec']:,.0f} docs/s, {self.bulk_threads} thread, chunk {self.bulk_chunk_size})")
+        if stats["failed"]:
+            print(f"⚠️  {stats['failed']:,} documents lỗi trong {len(failed_files)} file (sẽ index lại lần sau)")
 
-                self.es.index(index=self.index_name, document=doc)
-                # Cập nhật hash của file vào tracker
-                self.indexed_files[full_path] = get_file_hash(full_path)
-                indexed_count += 1
-                
-                print(f"   ✅ Đã index xong\n")
-                
-            except Exception as e:
-                print(f"   ⚠️  Lỗi: {e}\n")
-        
         # Lưu danh sách file đã index
-        self._save_indexed_files()
+        self.tracker.save()
+        return stats
+
+    def _iter_actions(self, files_to_index: List[str], source_files: deque, unreadable: set, deleted: List[int]):
+        """
+        Stream action bulk từng file (không giữ cả dataset trong RAM). Mỗi file được đọc + kiểm tra xong
+        mới xóa doc cũ của file đó rồi ghi bản mới => file lỗi vào unreadable và vẫn giữ nguyên doc cũ.
+        """
+        for full_path in tqdm(files_to_index, desc="📄 OCR files"):
+            try:
+                actions = self._file_actions(full_path)
+            except Exception as e:
+                print(f"   ⚠️  Không đọc được {os.path.basename(full_path)}: {e}")
+                unreadable.add(full_path)
+                continue
+
+            # Doc cũ của file (kể cả doc _id tự sinh từ bản cũ) => xóa ngay trước khi ghi bản mới
+            deleted[0] += delete_by_source(self.es, self.index_name, "source_file", [full_path], refresh=False)
+            for action in actions:
+                source_files.append(full_path)
+                yield action
+
+    def _file_actions(self, full_path: str) -> List[Dict]:
+        """Action bulk cho mọi entry có text của 1 file OCR. Raise nếu file không đọc được / sai format."""
+        with open(full_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if not isinstance(data, dict):
+            raise ValueError("file phải là dict {image_path: [filename, text]}")
+
+        actions = []
+        for image_path, ocr_data in data.items():
+            # ocr_data format: ["filename.webp", "text content"]
+            if not isinstance(ocr_data, list) or len(ocr_data) < 2 or not isinstance(ocr_data[1], str):
+                continue
+
+            filename = ocr_data[0]
+            text = ocr_data[1].strip()
+
+            if not text:
+                continue
+
+            # Extract video name và frame number
+            video_name, frame_idx = extract_video_and_frame_from_path(image_path)
+
+            actions.append({
+                "_index": self.index_name,
+                "_id": stable_doc_id(full_path, image_path),
+                "_source": {
+                    "text": text,
+                    "image_path": image_path,
+                    "filename": filename,
+                    "video_name": video_name,
+                    "frame_idx": frame_idx,
+                    "source_file": full_path
+                }
+            })
+        return actions
 
     def search(self, query: str, top_k, use_fuzzy: bool = False) -> Dict:
         results = {}
@@ -313,8 +319,10 @@ class OCRRetrievalES:
                 "query": {"match": {"text": query}}
             }
         
-        resp = self.es.search(index=self.index_name, body=keyword_query)
-        results["keyword"] = [hit["_source"] for hit in resp["hits"]["hits"]]
+        with stage("es_ocr"):
+            resp = self.es.search(index=self.index_name, body=keyword_query)
+        # Giữ kèm điểm BM25 (_score) để fusion với các nguồn khác (hybrid search)
+        results["keyword"] = [{**hit["_source"], "_score": hit["_score"]} for hit in resp["hits"]["hits"]]
 
         return results
 
@@ -334,12 +342,7 @@ class OCRRetrievalES:
 
     def reset_index_tracker(self):
         """Xóa file tracker - dùng khi muốn index lại từ đầu"""
-        if os.path.exists(self.index_tracker_file):
-            os.remove(self.index_tracker_file)
-            print(f"🗑️  Đã xóa {self.index_tracker_file}")
-            self.indexed_files = {}
-        else:
-            print(f"ℹ️  File {self.index_tracker_file} không tồn tại")
+        self.tracker.reset()
 
 
 # ========================== INTERACTIVE SEARCH ==========================
@@ -358,6 +361,7 @@ def interactive_ocr_search(query, top_k, OCR_JSON_DIR, index_name,retrieval):
 # ========================== MAIN PROGRAM ==========================
 
 if __name__ == "__main__":
+    # Chạy trong thư mục backend: python -m src.ocr_search_engine_main
     # Cấu hình đường dẫn
     OCR_JSON_DIR = r"D:\Workplace\OCR\Output"  # ⚠️ THAY ĐỔI ĐƯỜNG DẪN NÀY
     
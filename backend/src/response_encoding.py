@@ -0,0 +1,157 @@
+"""
+Encode response JSON cho các endpoint trả nhiều kết quả (/search, /sequence-search, ...).
+
+- JSON nhanh: orjson nếu đã cài (nhanh hơn json stdlib ~5-10 lần), không có thì fallback json stdlib
+- Nén theo Accept-Encoding: brotli (nếu đã cài brotli / brotlicffi) > gzip > không nén
+- Log có cấu trúc + lấy mẫu: 1 dòng JSON tóm tắt (số frame, bytes, thời gian encode...)
+  thay vì print toàn bộ kết quả
+"""
+import gzip
+import json
+import logging
+import random
+import time
+from typing import Any, Dict, Optional
+
+from flask import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+
+def dumps(obj: Any) -> bytes:
+    """JSON -> bytes UTF-8 (orjson nếu có). Chấp nhận cả số numpy trong kết quả search."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=_json_default).encode("utf-8")
+
+
+def _json_default(value):
+    if hasattr(value, "tolist"):   # numpy scalar / array
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Chọn "br" / "gzip" / None theo header Accept-Encoding (có tính q=0)."""
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    for encoding in ("br", "gzip"):
+        if encoding == "br" and brotli is None:
+            continue
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def compress(body: bytes, encoding: Optional[str], gzip_level: int = 1, brotli_quality: int = 1) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=brotli_quality)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=gzip_level, mtime=0)
+    return body
+
+
+def not_modified(etag: str, if_none_match, headers: Optional[Dict[str, str]] = None,
+                 weak: bool = False) -> Optional[Response]:
+    """
+    Response 304 nếu If-None-Match (request.if_none_match của werkzeug) khớp etag, ngược lại None.
+    etag truyền vào không có dấu ngoặc kép (werkzeug so sánh tag đã bỏ ngoặc), header ETag được thêm ngoặc.
+    If-None-Match luôn so sánh weak (RFC 9110), weak=True => header ETag dạng W/"...".
+    """
+    if not if_none_match.contains_weak(etag):
+        return None
+    response = Response(status=304)
+    for key, value in (headers or {}).items():
+        response.headers[key] = value
+    response.set_etag(etag, weak=weak)
+    return response
+
+
+class SampledLogger:
+    """Log 1 dòng JSON cho mỗi request được lấy mẫu (sample_rate = 0..1)."""
+
+    def __init__(self, name: str = "aic.search", sample_rate: float = 0.1):
+        self.logger = logging.getLogger(name)
+        self.sample_rate = sample_rate
+
+    def log(self, fields: Dict[str, Any], force: bool = False):
+        if force or (self.sample_rate > 0 and random.random() < self.sample_rate):
+            self.logger.info(dumps(fields).decode("utf-8"))
+
+
+class ResponseEncoder:
+    """
+    Args:
+        min_compress_bytes: body nhỏ hơn thì không nén (nén tốn CPU hơn lợi ích)
+        gzip_level / brotli_quality: mức nén. Mặc định mức thấp nhất: JSON kết quả search lặp nhiều
+            nên mức 1 đã nhỏ đi 10-20 lần, mức cao hơn tốn thêm vài chục ms ở k=500 (xem
+            utils/benchmark_response_encoding.py) - nhiều hơn thời gian tiết kiệm được trên mạng LAN
+        enabled: False = không bao giờ nén (frontend chạy cùng máy, băng thông không đáng kể)
+        logger: SampledLogger (None = không log)
+    """
+
+    def __init__(self, min_compress_bytes: int = 1024, gzip_level: int = 1, brotli_quality: int = 1,
+                 enabled: bool = True,
+                 logger: Optional[SampledLogger] = None):
+        self.min_compress_bytes = min_compress_bytes
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.enabled = enabled
+        self.logger = logger
+
+    def json(self, obj: Any, status: int = 200, headers: Optional[Dict[str, str]] = None,
+             accept_encoding: Optional[str] = None, log_fields: Optional[Dict[str, Any]] = None,
+             etag: Optional[str] = None, weak_etag: bool = False) -> Response:
+        start = time.perf_counter()
+        body = dumps(obj)
+        encode_ms = (time.perf_counter() - start) * 1000
+
+        compressible = self.enabled and len(body) >= self.min_compress_bytes
+        encoding = negotiate_encoding(accept_encoding) if compressible else None
+        start = time.perf_counter()
+        payload = compress(body, encoding, self.gzip_level, self.brotli_quality)
+        compress_ms = (time.perf_counter() - start) * 1000
+
+        response = Response(payload, status=status, mimetype="application/json")
+        response.headers["Vary"] = "Accept-Encoding"
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+        for key, value in (headers or {}).items():
+            response.headers[key] = value
+        if etag is not None:
+            # Body nén / không nén khác nhau từng byte => cùng 1 nội dung thì dùng weak ETag
+            response.set_etag(etag, weak=weak_etag)
+
+        if self.logger is not None and log_fields is not None:
+            self.logger.log({
+                **log_fields,
+                "status": status,
+                "bytes_json": len(body),
+                "bytes_sent": len(payload),
+                "encoding": encoding or "identity",
+                "encode_ms": round(encode_ms, 2),
+                "compress_ms": round(compress_ms, 2),
+            }, force=status >= 500)
+        return response
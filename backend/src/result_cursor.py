@@ -0,0 +1,122 @@
+"""
+Cursor giữ ranked list "sâu" của từng query phía server (LRU + TTL).
+
+Operator hay chạy k=100 rồi k=500 / k=1000 cho cùng 1 query: thay vì dịch + encode +
+search lại từ đầu, /search cắt (slice) ranked list đã có, và chỉ search lại sâu hơn khi
+k yêu cầu vượt quá độ sâu đang giữ. Mỗi lần search lấy dư (overfetch / min_depth) để các trang
+tiếp theo vẫn nằm trong ranked list đã có.
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, Hashable, List, Optional, Tuple
+
+
+@dataclass
+class CursorEntry:
+    cursor_id: str
+    signature: Hashable
+    ranked: List[Tuple] = field(default_factory=list)   # (path, score) đã sort
+    depth: int = 0               # k đã search tới
+    exhausted: bool = False      # search trả ít hơn depth => không còn kết quả sâu hơn
+    expires_at: float = 0.0
+
+    def covers(self, need: int) -> bool:
+        return self.exhausted or self.depth >= need
+
+
+class ResultCursorStore:
+    """
+    Args:
+        max_entries: số query giữ tối đa (LRU)
+        ttl_sec: cursor hết hạn sau ttl_sec giây không được dùng
+        min_depth / overfetch: mỗi lần phải search, lấy max(cần * overfetch, min_depth) kết quả
+    """
+
+    def __init__(self, max_entries: int = 256, ttl_sec: float = 1800, min_depth: int = 0,
+                 overfetch: float = 1.0):
+        self.max_entries = max_entries
+        self.ttl_sec = ttl_sec
+        self.min_depth = min_depth
+        self.overfetch = overfetch
+        self._entries: "OrderedDict[str, CursorEntry]" = OrderedDict()
+        self._by_signature = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.extends = 0
+
+    def _touch(self, entry: CursorEntry):
+        entry.expires_at = time.monotonic() + self.ttl_sec
+        self._entries.move_to_end(entry.cursor_id)
+
+    def _evict(self):
+        now = time.monotonic()
+        for cursor_id in [c for c, e in self._entries.items() if e.expires_at < now]:
+            self._drop(cursor_id)
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)))
+
+    def _drop(self, cursor_id: str):
+        entry = self._entries.pop(cursor_id, None)
+        if entry is not None and self._by_signature.get(entry.signature) == cursor_id:
+            del self._by_signature[entry.signature]
+
+    def lookup(self, signature: Hashable, cursor_id: Optional[str] = None) -> Optional[CursorEntry]:
+        """Tìm theo cursor id (nếu có và khớp signature), không thì theo signature."""
+        with self._lock:
+            self._evict()
+            entry = self._entries.get(cursor_id) if cursor_id else None
+            if entry is None or entry.signature != signature:
+                entry = self._entries.get(self._by_signature.get(signature))
+            if entry is not None:
+                self._touch(entry)
+            return entry
+
+    def store(self, signature: Hashable, ranked: List[Tuple], depth: int,
+              entry: Optional[CursorEntry] = None) -> CursorEntry:
+        """Lưu ranked list mới (hoặc thay ranked list của entry cũ khi search sâu hơn)."""
+        with self._lock:
+            if entry is None or entry.cursor_id not in self._entries:
+                entry = CursorEntry(cursor_id=uuid.uuid4().hex[:16], signature=signature)
+                self._entries[entry.cursor_id] = entry
+                self._by_signature[signature] = entry.cursor_id
+            entry.ranked = list(ranked)
+            entry.depth = depth
+            entry.exhausted = len(ranked) < depth
+            self._touch(entry)
+            self._evict()
+            return entry
+
+    def get_ranked(self, signature: Hashable, need: int, compute: Callable[[int], List[Tuple]],
+                   cursor_id: Optional[str] = None) -> CursorEntry:
+        """
+        Trả về entry có ít nhất `need` kết quả (hoặc đã hết kết quả).
+        compute(depth) chỉ được gọi khi chưa có cursor hoặc cursor chưa đủ sâu, với depth >= need
+        (lấy dư theo overfetch / min_depth).
+        """
+        entry = self.lookup(signature, cursor_id)
+        if entry is not None and entry.covers(need):
+            self.hits += 1
+            return entry
+        if entry is None:
+            self.misses += 1
+        else:
+            self.extends += 1
+        depth = max(need, int(need * self.overfetch), self.min_depth)
+        return self.store(signature, compute(depth), depth, entry)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_sec": self.ttl_sec,
+                "min_depth": self.min_depth,
+                "overfetch": self.overfetch,
+                "hits": self.hits,
+                "misses": self.misses,
+                "extends": self.extends,
+            }
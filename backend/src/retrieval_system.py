@@ -1,222 +1,257 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import torch
 import open_clip
 import torch.nn.functional as F
 from open_clip import create_model_from_pretrained, get_tokenizer
 from pymilvus import Collection, connections
-from typing import List, Tuple
+from typing import List, Optional, Tuple
+from .caching import EmbeddingCache, cached_encode, cached_encode_batch
+from .metrics import stage
+from .search_scope import build_scope
+from .text_encoder import build_fast_encoder
 
-class RetrievalSystem:
+_milvus_lock = threading.Lock()
+# Executor giới hạn số lần encode text (CPU/GPU-bound) chạy đồng thời trong 1 process.
+# None = encode trực tiếp trên thread của request (như chạy Flask dev server).
+_encode_executor = None
+
+
+def connect_milvus(milvus_host: str, milvus_port: str, alias: str = "default"):
     """
-    Class này đóng gói hệ thống tìm kiếm, có khả năng sử dụng nhiều collection Milvus.
+    Kết nối tới Milvus đúng 1 lần cho cả process.
+    Mọi retriever dùng chung connection alias "default".
     """
-    def __init__(self, model_name: str, pretrained: str, milvus_host: str, milvus_port: str, 
-                 collection_name_hnsw: str):
-        """
-        Khởi tạo hệ thống.
-        - Tải model CLIP.
-        - Kết nối tới Milvus và tải CẢ HAI collection HNSW và IVF_FLAT.
-        """
-        print("Initializing Flexible Retrieval System...")
-        
-        # 1. Tải model CLIP (chỉ tải 1 lần, tiết kiệm tài nguyên)
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        print(f"✅ Using device: {self.device}")
-        self.model, _, _ = open_clip.create_model_and_transforms(
-            model_name, pretrained=pretrained, device=self.device
-        )
-        self.tokenizer = open_clip.get_tokenizer(model_name)
-        self.model.eval()
-        print("✅ CLIP Model loaded.")
+    with _milvus_lock:
+        if connections.has_connection(alias):
+            return
+        print(f"Connecting to Milvus at {milvus_host}:{milvus_port}...")
+        connections.connect(alias, host=milvus_host, port=milvus_port)
+        print("✅ Connected to Milvus.")
 
-        # 2. Kết nối tới Milvus và tải cả hai collection
-        try:
-            print(f"Connecting to Milvus at {milvus_host}:{milvus_port}...")
-            connections.connect("default", host=milvus_host, port=milvus_port)
-            print("✅ Connected to Milvus.")
-            
-            print(f"Loading HNSW collection: '{collection_name_hnsw}'...")
-            self.collection_hnsw = Collection(collection_name_hnsw)
-            self.collection_hnsw.load()
-        
-            print("Loaded Collection")
 
-        except Exception as e:
-            print(f"❌ Failed to connect to Milvus or load collections: {e}")
-            raise
+def reconnect_milvus(milvus_host: str, milvus_port: str, alias: str = "default"):
+    """
+    Mở lại connection Milvus (gọi trong worker sau khi fork: gRPC channel của process cha
+    không dùng được ở process con). Collection đã load dùng alias nên không cần tạo lại.
+    """
+    with _milvus_lock:
+        if connections.has_connection(alias):
+            connections.remove_connection(alias)
+        connections.connect(alias, host=milvus_host, port=milvus_port)
+        print(f"✅ Reconnected to Milvus ({alias}).")
 
-    @torch.no_grad()
-    def _encode_text(self, query: str) -> List[float]:
-        """Mã hóa một câu truy vấn văn bản thành vector."""
-        tokens = self.tokenizer([query]).to(self.device)
-        text_features = self.model.encode_text(tokens)
-        text_features /= text_features.norm(dim=-1, keepdim=True)
-        return text_features[0].cpu().tolist()
 
-    def search(self, query: str, k: int, search_params: dict) -> List[Tuple[str, float, str]]:
-        """
-        Thực hiện tìm kiếm trên collection được chỉ định.
-        
-        Args:
-            query (str): Câu truy vấn.
-            k (int): Số lượng kết quả.
-            index_type (str): Loại index cần dùng ('hnsw' hoặc 'ivf').
-            search_params (dict): Tham số tìm kiếm cho Milvus.
-        """
-        # 1. Mã hóa query
-        query_vector = self._encode_text(query)
+def set_encode_workers(max_workers):
+    """Bật executor encode với tối đa max_workers thread (None / 0 = tắt). Gọi lại sau fork."""
+    global _encode_executor
+    _encode_executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="encode") \
+        if max_workers else None
 
 
-        # 3. Tìm kiếm trên collection đã chọn
-        results = self.collection_hnsw.search(
-            data=[query_vector],
-            anns_field="embedding",
-            param=search_params,  # {"metric_type": "IP", "params": {"ef": 800}}
-            limit=k,
-            output_fields=["path", "caption"]
-        )
-
-        hits = results[0]
-        formatted_results = []
-        for hit in hits:
-            path = hit.entity.get('path')
-            caption = hit.entity.get('caption')
-            score = hit.score   # Milvus trả thẳng về similarity
-            formatted_results.append((path, score, caption))
-        return formatted_results
-    
-class RetrievalSystemApple:
+class BaseRetrievalSystem:
     """
-    RetrievalSystemApple: chuyên dùng cho model Apple CLIP.
-    - Load model từ HuggingFace Hub.
-    - Kết nối Milvus và search.
+    Phần chung của các retriever: load model (lớp con tự định nghĩa),
+    load collection HNSW, encode text (có cache) và search / search_batch trên Milvus.
+
+    output_fields: field lấy về từ Milvus, field đầu tiên luôn là "path".
+    Kết quả search là tuple (path, score, *các field còn lại).
     """
-    def __init__(self, model_name: str, milvus_host: str, milvus_port: str, collection_name_hnsw: str):
-        print("Initializing Apple Retrieval System...")
+    output_fields = ["path", "caption"]
+    display_name = "Retrieval System"
 
-        # 1. Device
+    def __init__(self, model_name: str, milvus_host: str, milvus_port: str,
+                 collection_name_hnsw: str, pretrained: Optional[str] = None,
+                 embedding_cache: Optional[EmbeddingCache] = None, collection=None,
+                 text_encoder_mode: str = "fp32", onnx_path: Optional[str] = None):
+        """
+        collection: truyền sẵn 1 collection (vd NumpyCollection) thay cho Milvus.
+        Khi đó bỏ qua bước kết nối Milvus.
+        text_encoder_mode: "fp32" | "int8" | "onnx" - encoder nhanh cho text tower khi chạy CPU.
+        """
+        print(f"Initializing {self.display_name}...")
+        self.model_name = model_name
+        self.pretrained = pretrained
+        self.model_key = f"{model_name}:{pretrained}" if pretrained else model_name
+        self.embedding_cache = embedding_cache
+
+        # 1. Load model
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
         print(f"✅ Using device: {self.device}")
-
-        # 2. Load Apple model
-        self.model, self.preprocess = create_model_from_pretrained(model_name)
-        self.tokenizer = get_tokenizer("ViT-H-14")
-        self.model = self.model.to(self.device)
+        self._load_model()
         self.model.eval()
-        print("✅ Apple CLIP model loaded.")
+        print(f"✅ {self.model_key} loaded.")
+
+        self._fast_encoder = None
+        if text_encoder_mode != "fp32":
+            if self.device == "cpu":
+                self._fast_encoder = build_fast_encoder(
+                    self.model, self._tokenize, text_encoder_mode, onnx_path=onnx_path
+                )
+            else:
+                print(f"ℹ️  Bỏ qua text encoder '{text_encoder_mode}' vì đang chạy trên {self.device}")
+        if self._fast_encoder is not None:
+            # Vector int8 / onnx chỉ xấp xỉ fp32 => key cache riêng, đổi mode không dùng nhầm vector cũ
+            self.model_key = f"{self.model_key}:{text_encoder_mode}"
 
-        # 3. Kết nối Milvus
+        # 2. Connect Milvus (dùng chung) + load collection
+        self._partition_cache = {}
+        if collection is not None:
+            self.collection_hnsw = collection
+            return
         try:
-            print(f"Connecting to Milvus at {milvus_host}:{milvus_port}...")
-            connections.connect("default", host=milvus_host, port=milvus_port)
-            print("✅ Connected to Milvus.")
+            connect_milvus(milvus_host, milvus_port)
 
             print(f"Loading HNSW collection: '{collection_name_hnsw}'...")
             self.collection_hnsw = Collection(collection_name_hnsw)
             self.collection_hnsw.load()
 
             print("✅ Collection loaded.")
-
         except Exception as e:
             print(f"❌ Failed to connect to Milvus or load collection: {e}")
             raise
 
+    def _load_model(self):
+        """Gán self.model và self.tokenizer."""
+        raise NotImplementedError
+
+    def _tokenize(self, queries: List[str]):
+        return self.tokenizer(queries)
+
+    def _encode_text(self, query: str) -> List[float]:
+        """Mã hóa một câu truy vấn văn bản thành vector (qua cache nếu có)."""
+        return cached_encode(self.embedding_cache, self.model_key, query, self._forward_text)
+
+    def _encode_texts(self, queries: List[str]) -> List[List[float]]:
+        """Mã hóa nhiều câu truy vấn, các câu chưa có trong cache chạy chung 1 forward pass."""
+        return cached_encode_batch(self.embedding_cache, self.model_key, queries, self._forward_texts)
+
+    def _forward_text(self, query: str) -> List[float]:
+        return self._forward_texts([query])[0]
+
+    def _forward_texts(self, queries: List[str]) -> List[List[float]]:
+        """Chạy text encoder trên cả batch (qua executor encode nếu đã bật)."""
+        if _encode_executor is None:
+            return self._run_text_encoder(queries)
+        return _encode_executor.submit(self._run_text_encoder, queries).result()
+
     @torch.no_grad()
-    def _encode_text(self, query: str):
-        """Mã hóa query text bằng Apple CLIP model."""
-        tokens = self.tokenizer([query], context_length=self.model.context_length).to(self.device)
+    def _run_text_encoder(self, queries: List[str]) -> List[List[float]]:
+        tokens = self._tokenize(queries).to(self.device)
+        if self._fast_encoder is not None:
+            return self._fast_encoder(tokens).cpu().tolist()
         text_features = self.model.encode_text(tokens)
         text_features = F.normalize(text_features, dim=-1)
-        return text_features[0].cpu().tolist()
-
-    def search(self, query: str, k: int, search_params: dict):
-        """
-        Search ảnh trong collection Apple.
-        Args:
-            query (str): câu truy vấn
-            k (int): số lượng kết quả
-            search_params (dict): tham số search cho Milvus
-        """
-        query_vector = self._encode_text(query)
-
-        results = self.collection_hnsw.search(
-            data=[query_vector],
-            anns_field="embedding",
-            param=search_params,
-            limit=k,
-            output_fields=["path", "caption"]
-        )
+        return text_features.cpu().tolist()
 
-        hits = results[0]
+    def _format_hits(self, hits) -> List[Tuple]:
         formatted_results = []
         for hit in hits:
             path = hit.entity.get("path")
-            caption = hit.entity.get("caption")
-            score = hit.score
-            formatted_results.append((path, score, caption))
+            score = hit.score   # Milvus trả thẳng về similarity (IP)
+            extras = [hit.entity.get(field) for field in self.output_fields[1:]]
+            formatted_results.append((path, score, *extras))
         return formatted_results
-    
-class RetrievalSystemSiglipNoCap:
+
+    def _has_partition(self, pack: str) -> bool:
+        """Collection có partition cho pack không (cache lại, tránh gọi Milvus mỗi request)."""
+        if pack not in self._partition_cache:
+            self._partition_cache[pack] = self.collection_hnsw.has_partition(pack)
+        return self._partition_cache[pack]
+
+    def search(self, query: str, k: int, search_params: dict,
+               packs: Optional[List[str]] = None, videos: Optional[List[str]] = None) -> List[Tuple]:
+        """
+        Thực hiện tìm kiếm trên collection HNSW.
+
+        Args:
+            query (str): Câu truy vấn.
+            k (int): Số lượng kết quả.
+            search_params (dict): Tham số tìm kiếm cho Milvus, vd {"metric_type": "IP", "params": {"ef": 800}}.
+            packs (list): chỉ search trong các pack này (vd ["L21", "L22"]).
+            videos (list): chỉ search trong các video này (vd ["L21_V001"]).
+        """
+        return self.search_batch([query], k, search_params, packs=packs, videos=videos)[0]
+
+    def search_batch(self, queries: List[str], k: int, search_params: dict,
+                     packs: Optional[List[str]] = None, videos: Optional[List[str]] = None) -> List[List[Tuple]]:
+        """
+        Tìm kiếm nhiều query (paraphrase / multi-event) trong 1 lần:
+        tokenize + encode chung 1 forward pass, gửi tất cả vector trong 1 request Milvus.
+        Trả về list kết quả cho từng query, đúng thứ tự đầu vào.
+        packs / videos: giới hạn phạm vi (xem search_scope.build_scope).
+        """
+        if not queries:
+            return []
+        partition_names, expr = build_scope(packs, videos, self._has_partition)
+        if partition_names == []:
+            return [[] for _ in queries]
+        with stage("text_encode"):
+            query_vectors = self._encode_texts(queries)
+
+        with stage("vector_search"):
+            results = self.collection_hnsw.search(
+                data=query_vectors,
+                anns_field="embedding",
+                param=search_params,
+                limit=k,
+                expr=expr,
+                partition_names=partition_names,
+                output_fields=self.output_fields
+            )
+
+        return [self._format_hits(hits) for hits in results]
+
+
+class RetrievalSystem(BaseRetrievalSystem):
     """
-    Retrieval System cho SigLip nhưng KHÔNG có caption.
+    Retriever cho model OpenCLIP (vd ViT-L-14), collection có caption.
+    Trả về list (path, score, caption).
     """
+    display_name = "Flexible Retrieval System"
+
     def __init__(self, model_name: str, pretrained: str, milvus_host: str, milvus_port: str,
-                 collection_name_hnsw: str):
-        print("Initializing SigLip Retrieval System (no caption)...")
+                 collection_name_hnsw: str, embedding_cache: Optional[EmbeddingCache] = None,
+                 collection=None, text_encoder_mode: str = "fp32", onnx_path: Optional[str] = None):
+        super().__init__(model_name, milvus_host, milvus_port, collection_name_hnsw,
+                         pretrained=pretrained, embedding_cache=embedding_cache, collection=collection,
+                         text_encoder_mode=text_encoder_mode, onnx_path=onnx_path)
 
-        # 1. Load model
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        print(f"✅ Using device: {self.device}")
+    def _load_model(self):
         self.model, _, _ = open_clip.create_model_and_transforms(
-            model_name, pretrained=pretrained, device=self.device
+            self.model_name, pretrained=self.pretrained, device=self.device
         )
-        self.tokenizer = open_clip.get_tokenizer(model_name)
-        self.model.eval()
-        print("✅ SigLip model loaded.")
+        self.tokenizer = open_clip.get_tokenizer(self.model_name)
 
-        # 2. Connect Milvus + load collection
-        try:
-            print(f"Connecting to Milvus at {milvus_host}:{milvus_port}...")
-            connections.connect("default", host=milvus_host, port=milvus_port)
-            print("✅ Connected to Milvus.")
 
-            print(f"Loading HNSW collection: '{collection_name_hnsw}'...")
-            self.collection_hnsw = Collection(collection_name_hnsw)
-            self.collection_hnsw.load()
+class RetrievalSystemApple(BaseRetrievalSystem):
+    """
+    RetrievalSystemApple: chuyên dùng cho model Apple CLIP.
+    - Load model từ HuggingFace Hub.
+    - Trả về list (path, score, caption).
+    """
+    display_name = "Apple Retrieval System"
 
-            print("✅ Collection loaded.")
-        except Exception as e:
-            print(f"❌ Failed to connect/load collection: {e}")
-            raise
+    def __init__(self, model_name: str, milvus_host: str, milvus_port: str, collection_name_hnsw: str,
+                 embedding_cache: Optional[EmbeddingCache] = None, collection=None,
+                 text_encoder_mode: str = "fp32", onnx_path: Optional[str] = None):
+        super().__init__(model_name, milvus_host, milvus_port, collection_name_hnsw,
+                         embedding_cache=embedding_cache, collection=collection,
+                         text_encoder_mode=text_encoder_mode, onnx_path=onnx_path)
 
-    @torch.no_grad()
-    def _encode_text(self, query: str) -> List[float]:
-        """Encode query text thành vector."""
-        tokens = self.tokenizer([query]).to(self.device)
-        text_features = self.model.encode_text(tokens)
-        text_features /= text_features.norm(dim=-1, keepdim=True)
-        return text_features[0].cpu().tolist()
+    def _load_model(self):
+        self.model, self.preprocess = create_model_from_pretrained(self.model_name)
+        self.tokenizer = get_tokenizer("ViT-H-14")
+        self.model = self.model.to(self.device)
 
-    def search(self, query: str, k: int, search_params: dict) -> List[Tuple[str, float]]:
-        """
-        Tìm kiếm KHÔNG có caption.
-        Trả về list (path, score).
-        """
-        query_vector = self._encode_text(query)
-
-        results = self.collection_hnsw.search(
-            data=[query_vector],
-            anns_field="embedding",
-            param=search_params,
-            limit=k,
-            output_fields=["path"]  # ❌ bỏ caption
-        )
+    def _tokenize(self, queries: List[str]):
+        return self.tokenizer(queries, context_length=self.model.context_length)
 
-        hits = results[0]
-        formatted_results = []
-        for hit in hits:
-            path = hit.entity.get("path")
-            #base_path = "D:/Workplace/AIC_2025/Data/Keyframes"
-            #path = path.replace("D:/Workplace/AIC_2025/Data/Keyframes/", "")
-            score = hit.score
-            formatted_results.append((path, score))
-        return formatted_results
+
+class RetrievalSystemSiglipNoCap(RetrievalSystem):
+    """
+    Retrieval System cho SigLip nhưng KHÔNG có caption.
+    Trả về list (path, score).
+    """
+    output_fields = ["path"]  # ❌ bỏ caption
+    display_name = "SigLip Retrieval System (no caption)"
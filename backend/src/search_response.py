@@ -0,0 +1,119 @@
+"""
+Dựng body JSON cho kết quả /search từ ranked list (path tương đối, score).
+
+- build_search_response: format đầy đủ (frame_results + video_results kèm all_frames của từng video)
+- build_compact_response: format gọn (compact=1), không có all_frames, path frame dựng lại ở frontend
+
+Không phụ thuộc Flask / model => dùng được cả trong utils/benchmark_response_encoding.py.
+"""
+import os
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+def get_video_id_from_path(path: str) -> Optional[str]:
+    """
+    Trích xuất 'Lxx_Vyyy' (hoặc Kxx_Vyyy) ở bất kỳ đâu trong path.
+    Ví dụ: 'L21/L21_V001/000000.webp' -> 'L21_V001'
+    """
+    safe = path.replace("\\", "/")
+    # Mở rộng để bắt cả Lxx_Vyyy và Kxx_Vyyy
+    m = re.search(r"([LK]\d+_V\d+)", safe)
+    return m.group(1) if m else None
+
+
+def build_search_response(ranked: List[Tuple[str, Optional[float]]], frames_of: Callable[[str], List[str]]):
+    """
+    ranked: list (path tương đối, score hoặc None) đã sort.
+    frames_of: video_id -> tên file mọi keyframe của video (vd KeyframeManifest.all_frames).
+    Trả về (frame_results, video_results_list) theo format frontend đang dùng.
+    """
+    path_to_score_map = {path: score for path, score in ranked}
+    final_paths = [path for path, _ in ranked]
+    # 1) frame_results
+    frame_results = []
+    for path in final_paths:
+        frame_results.append({
+            "path": f"/images/Keyframes/{path}",
+            "score": path_to_score_map.get(path)
+        })
+
+    # 2) group theo video
+    videos_data = {}
+    for rank, path in enumerate(final_paths):
+        video_id = get_video_id_from_path(path)
+        if not video_id:
+            continue
+        if video_id not in videos_data:
+            videos_data[video_id] = {
+                "frames": [],
+                "best_rank": rank,
+                "video_score": path_to_score_map.get(path)
+            }
+        videos_data[video_id]["frames"].append(path)
+
+    # 3) build video_results + all_frames
+    video_results_list = []
+    for video_id, data in videos_data.items():
+        video_frames = []
+        for p in data["frames"]:
+            video_frames.append({
+                "path": f"/images/Keyframes/{p}",
+                "score": path_to_score_map.get(p)
+            })
+
+        level_dir = video_id.split("_")[0]
+        all_frames = [
+            f"/images/Keyframes/{level_dir}/{video_id}/{fname}"
+            for fname in frames_of(video_id)
+        ]
+
+        video_results_list.append({
+            "video_id": video_id,
+            "video_score": data["video_score"],
+            "best_rank": data["best_rank"],
+            "frames": video_frames,
+            "all_frames": all_frames
+        })
+
+    video_results_list.sort(key=lambda x: x["best_rank"])
+    return frame_results, video_results_list
+
+
+def build_compact_response(ranked: List[Tuple[str, Optional[float]]]) -> Dict:
+    """
+    Response gọn cho /search?compact=1: mỗi video chỉ gửi frame number + score, không có all_frames
+    (frontend gọi /video/<video_id>/frames khi cần) và không lặp lại prefix /images/Keyframes/.
+    Path frame = f"{base}{pack}/{video_id}/{frame:0{pad}d}{ext}".
+    frame_order: thứ tự rank theo frame, mỗi phần tử [chỉ số video, chỉ số frame trong video].
+    """
+    videos = {}
+    video_results_list = []
+    frame_order = []
+    for rank, (path, score) in enumerate(ranked):
+        video_id = get_video_id_from_path(path)
+        if not video_id:
+            continue
+        stem, ext = os.path.splitext(os.path.basename(path))
+        if video_id not in videos:
+            videos[video_id] = len(video_results_list)
+            video_results_list.append({
+                "video_id": video_id,
+                "video_score": score,
+                "best_rank": rank,
+                "ext": ext,
+                "pad": len(stem),
+                "frames": [],
+                "scores": []
+            })
+        video = video_results_list[videos[video_id]]
+        frame_order.append([videos[video_id], len(video["frames"])])
+        video["frames"].append(int(stem) if stem.isdigit() else stem)
+        video["scores"].append(score)
+
+    return {
+        "compact": True,
+        "base": "/images/Keyframes/",
+        "video_results": video_results_list,
+        "frame_order": frame_order
+    }
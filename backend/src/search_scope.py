@@ -0,0 +1,83 @@
+"""
+Giới hạn phạm vi search theo pack / video.
+
+Collection được chia 1 partition / pack (K01..K20, L21..L30 - xem utils/database_saving_new.py),
+nên search trong 1 pack chỉ quét HNSW của partition đó.
+Lọc theo video thêm expr tiền tố path: path like "L21/L21_V001/%".
+Collection cũ (không có partition) vẫn lọc được nhờ expr tiền tố pack: path like "L21/%".
+"""
+import re
+from typing import Callable, Iterable, List, Optional, Tuple
+
+_VIDEO_RE = re.compile(r"^([LK]\d+)_V\d+$")
+_PACK_RE = re.compile(r"^[LK]\d+$")
+_LIKE_RE = re.compile(r'^path like "([^"%]*)%"$')
+
+
+class ScopeError(ValueError):
+    """Phạm vi search (video / expr) không hợp lệ => lỗi của request (400), không phải lỗi server."""
+
+
+def is_valid_pack(pack: str) -> bool:
+    return bool(_PACK_RE.match(pack))
+
+
+def is_valid_video(video_id: str) -> bool:
+    return bool(_VIDEO_RE.match(video_id))
+
+
+def pack_of_video(video_id: str) -> str:
+    """'L21_V001' -> 'L21'"""
+    m = _VIDEO_RE.match(video_id)
+    if not m:
+        raise ScopeError(f"video_id không hợp lệ: {video_id}")
+    return m.group(1)
+
+
+def prefix_expr(prefixes: Iterable[str]) -> str:
+    """Expr Milvus: path bắt đầu bằng 1 trong các tiền tố."""
+    return " or ".join(f'path like "{p}%"' for p in prefixes)
+
+
+def parse_prefix_expr(expr: str) -> List[str]:
+    """Ngược lại với prefix_expr (cho NumpyCollection). Expr khác dạng -> ScopeError."""
+    prefixes = []
+    for part in expr.split(" or "):
+        m = _LIKE_RE.match(part.strip())
+        if not m:
+            raise ScopeError(f"Expr không hỗ trợ: {expr}")
+        prefixes.append(m.group(1))
+    return prefixes
+
+
+def build_scope(packs: Optional[List[str]], videos: Optional[List[str]],
+                has_partition: Callable[[str], bool]) -> Tuple[Optional[List[str]], Optional[str]]:
+    """
+    Trả về (partition_names, expr) cho Collection.search.
+
+    - chỉ packs: search đúng các partition đó
+    - có videos: partition = pack của các video (giao với packs nếu có) + expr tiền tố video
+    - pack nào chưa có partition (collection cũ): bỏ partition, lọc bằng expr tiền tố
+    Không lọc gì -> (None, None).
+    """
+    packs = sorted(set(packs or []))
+    videos = sorted(set(videos or []))
+    if not packs and not videos:
+        return None, None
+
+    if videos:
+        if packs:
+            videos = [v for v in videos if pack_of_video(v) in packs]
+        target_packs = sorted({pack_of_video(v) for v in videos})
+        prefixes = [f"{pack_of_video(v)}/{v}/" for v in videos]
+    else:
+        target_packs = packs
+        prefixes = None
+
+    if not target_packs:
+        # videos không thuộc packs nào được chọn => không có kết quả
+        return [], None
+
+    if all(has_partition(p) for p in target_packs):
+        return target_packs, prefix_expr(prefixes) if prefixes else None
+    return None, prefix_expr(prefixes or [f"{p}/" for p in target_packs])
@@ -0,0 +1,125 @@
+"""
+SEQUENCE (MULTI-EVENT) QUERY ENGINE
+Tìm video có "sự kiện A, sau đó B, sau đó C..." trong 1 request.
+
+1. Chạy tất cả sub-query bằng retriever.search_batch (1 forward pass + 1 lần gọi Milvus)
+2. Gom hit theo video, frame number lấy từ tên file keyframe
+   (giống extract_video_and_frame_from_path)
+3. Với mỗi video: dynamic programming (vector hóa numpy) trên frame index,
+   frame của event sau phải nằm SAU event trước và cách không quá max_gap frame
+4. Trả về các chuỗi (video, frame_A, frame_B, ...) xếp theo điểm
+"""
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .ocr_search_engine_main import extract_video_and_frame_from_path
+
+
+def _group_by_video(hits: Sequence[Tuple]) -> Dict[str, Tuple[np.ndarray, np.ndarray, List[str]]]:
+    """
+    hits: list (path, score, ...) của 1 event.
+    Trả về {video: (frames đã sort, điểm chuẩn hóa 0-1, paths)}.
+    """
+    if not hits:
+        return {}
+    scores = np.array([h[1] for h in hits], dtype=np.float32)
+    lo, hi = scores.min(), scores.max()
+    norm = np.ones_like(scores) if hi == lo else (scores - lo) / (hi - lo)
+
+    grouped: Dict[str, List[Tuple[int, float, str]]] = {}
+    for (path, *_), s in zip(hits, norm):
+        video, frame = extract_video_and_frame_from_path(path.replace("\\", "/"))
+        if video == "unknown":
+            continue
+        grouped.setdefault(video, []).append((frame, float(s), path))
+
+    out = {}
+    for video, items in grouped.items():
+        items.sort(key=lambda x: x[0])
+        out[video] = (
+            np.array([i[0] for i in items], dtype=np.int64),
+            np.array([i[1] for i in items], dtype=np.float32),
+            [i[2] for i in items],
+        )
+    return out
+
+
+def _best_chains(per_event, max_gap: int, min_gap: int, per_video: int):
+    """
+    DP trên 1 video. per_event: list (frames, scores, paths) theo thứ tự event.
+    best[j] = score_j + max_{i: min_gap < f_j - f_i <= max_gap} best_prev[i]
+    Trả về tối đa per_video chuỗi (tổng điểm, [index trong từng event]).
+    """
+    best = per_event[0][1].astype(np.float64)
+    backs = []
+    for frames_prev, frames_cur, scores_cur in (
+        (per_event[i - 1][0], per_event[i][0], per_event[i][1]) for i in range(1, len(per_event))
+    ):
+        gap = frames_cur[None, :] - frames_prev[:, None]          # (n_prev, n_cur)
+        valid = (gap > min_gap) & (gap <= max_gap)
+        candidates = np.where(valid, best[:, None], -np.inf)
+        arg = np.argmax(candidates, axis=0)
+        best = candidates[arg, np.arange(len(frames_cur))] + scores_cur
+        backs.append(arg)
+        if not np.isfinite(best).any():
+            return []
+
+    ends = np.argsort(-best)[:per_video]
+    chains = []
+    for end in ends:
+        if not np.isfinite(best[end]):
+            break
+        idx = [int(end)]
+        for arg in reversed(backs):
+            idx.append(int(arg[idx[-1]]))
+        chains.append((float(best[end]), idx[::-1]))
+    return chains
+
+
+def sequence_search(retriever, events: List[str], k: int, search_params: dict,
+                    max_gap: int, min_gap: int = 0, top_n: int = 100, per_video: int = 1,
+                    packs: Optional[List[str]] = None, videos: Optional[List[str]] = None) -> List[Dict]:
+    """
+    Args:
+        retriever: retriever có search_batch (vd RetrievalSystemSiglipNoCap)
+        events: các sub-query theo đúng thứ tự thời gian
+        k: số hit lấy cho MỖI event
+        max_gap / min_gap: khoảng cách frame tối đa / tối thiểu giữa 2 event liên tiếp
+        top_n: số chuỗi trả về
+        per_video: số chuỗi tối đa trên 1 video
+        packs / videos: giới hạn phạm vi search (xem search_scope.build_scope)
+
+    Returns:
+        list {"video_id", "score", "frames": [{"frame", "path", "score"}...]} sort giảm dần,
+        score = trung bình điểm chuẩn hóa của các event.
+    """
+    if not events:
+        return []
+    results = retriever.search_batch(events, k, search_params, packs=packs, videos=videos)
+    grouped = [_group_by_video(hits) for hits in results]
+
+    # Video có hit cho mọi event
+    common_videos = set(grouped[0])
+    for g in grouped[1:]:
+        common_videos &= set(g)
+
+    sequences = []
+    for video in common_videos:
+        per_event = [g[video] for g in grouped]
+        for total, idx in _best_chains(per_event, max_gap, min_gap, per_video):
+            sequences.append({
+                "video_id": video,
+                "score": total / len(events),
+                "frames": [
+                    {
+                        "frame": int(per_event[e][0][i]),
+                        "path": per_event[e][2][i],
+                        "score": float(per_event[e][1][i]),
+                    }
+                    for e, i in enumerate(idx)
+                ],
+            })
+
+    sequences.sort(key=lambda x: x["score"], reverse=True)
+    return sequences[:top_n]
@@ -0,0 +1,156 @@
+"""
+Text encoder nhanh cho CPU (chủ yếu cho text tower SigLIP SO400M).
+
+Các chế độ (config.TEXT_ENCODER_MODE):
+- "fp32": giữ nguyên model gốc
+- "int8": dynamic quantization (torch.ao) cho các lớp Linear của text tower
+- "onnx": export text tower sang ONNX rồi chạy bằng onnxruntime
+
+Mọi chế độ đều nhận token ids (output của tokenizer) và trả về embedding đã chuẩn hóa L2.
+check_parity() so sánh với fp32 (cosine >= 0.99) trước khi dùng.
+Chỉ có ý nghĩa khi model chạy trên CPU.
+"""
+import copy
+import os
+from typing import Callable, Dict, List, Optional
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+ENCODER_MODES = ("fp32", "int8", "onnx")
+
+
+class _TextTower(nn.Module):
+    """Bọc model.encode_text để export / quantize riêng phần text."""
+
+    def __init__(self, model: nn.Module):
+        super().__init__()
+        self.model = model
+
+    def forward(self, tokens: torch.Tensor) -> torch.Tensor:
+        return F.normalize(self.model.encode_text(tokens), dim=-1)
+
+
+def _strip_visual(model: nn.Module) -> nn.Module:
+    """
+    Bản copy nông không có image tower (chỉ cần text để encode query), để khi
+    quantize / export không phải copy cả visual. Copy riêng dict _modules để
+    không đụng vào model gốc.
+    """
+    text_only = copy.copy(model)
+    text_only._modules = dict(model._modules)
+    if "visual" in text_only._modules:
+        text_only._modules["visual"] = None
+    return text_only
+
+
+def build_int8_encoder(model: nn.Module) -> Callable[[torch.Tensor], torch.Tensor]:
+    """Dynamic int8 quantization cho các lớp Linear (chạy trên CPU)."""
+    tower = _TextTower(_strip_visual(model)).cpu().eval()
+    quantized = torch.ao.quantization.quantize_dynamic(tower, {nn.Linear}, dtype=torch.qint8)
+
+    @torch.no_grad()
+    def encode(tokens: torch.Tensor) -> torch.Tensor:
+        return quantized(tokens.cpu())
+
+    return encode
+
+
+def export_onnx(model: nn.Module, sample_tokens: torch.Tensor, onnx_path: str, opset: int = 17):
+    """Export text tower sang ONNX (batch size động)."""
+    tower = _TextTower(_strip_visual(model)).cpu().eval()
+    os.makedirs(os.path.dirname(os.path.abspath(onnx_path)), exist_ok=True)
+    with torch.no_grad():
+        torch.onnx.export(
+            tower, (sample_tokens.cpu(),), onnx_path,
+            input_names=["tokens"], output_names=["embedding"],
+            dynamic_axes={"tokens": {0: "batch"}, "embedding": {0: "batch"}},
+            opset_version=opset
+        )
+    print(f"✅ Exported ONNX text tower: {onnx_path}")
+
+
+def build_onnx_encoder(model: nn.Module, sample_tokens: torch.Tensor, onnx_path: str,
+                       num_threads: Optional[int] = None) -> Callable[[torch.Tensor], torch.Tensor]:
+    """Load (export nếu chưa có) ONNX text tower và trả về hàm encode chạy bằng onnxruntime."""
+    import onnxruntime as ort
+
+    if not os.path.isfile(onnx_path):
+        export_onnx(model, sample_tokens, onnx_path)
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if num_threads:
+        options.intra_op_num_threads = num_threads
+    session = ort.InferenceSession(onnx_path, sess_options=options, providers=["CPUExecutionProvider"])
+    input_type = session.get_inputs()[0].type
+
+    def encode(tokens: torch.Tensor) -> torch.Tensor:
+        ids = tokens.cpu().numpy()
+        ids = ids.astype("int64" if "int64" in input_type else "int32")
+        (embedding,) = session.run(["embedding"], {"tokens": ids})
+        return torch.from_numpy(embedding)
+
+    return encode
+
+
+def check_parity(reference: Callable[[torch.Tensor], torch.Tensor],
+                 candidate: Callable[[torch.Tensor], torch.Tensor],
+                 tokens: torch.Tensor, min_cosine: float = 0.99) -> Dict[str, float]:
+    """
+    So sánh embedding của encoder nhanh với fp32 trên cùng token.
+    Trả về cosine nhỏ nhất / trung bình; raise ValueError nếu dưới ngưỡng.
+    """
+    with torch.no_grad():
+        ref = F.normalize(reference(tokens).float().cpu(), dim=-1)
+        cand = F.normalize(candidate(tokens).float().cpu(), dim=-1)
+    cosine = (ref * cand).sum(dim=-1)
+    result = {"min_cosine": float(cosine.min()), "mean_cosine": float(cosine.mean())}
+    if result["min_cosine"] < min_cosine:
+        raise ValueError(
+            f"Encoder nhanh lệch quá nhiều so với fp32: min cosine {result['min_cosine']:.4f} < {min_cosine}"
+        )
+    return result
+
+
+# Câu mẫu để kiểm tra parity (đa dạng độ dài, đã dịch sang tiếng Anh như query thật)
+PARITY_QUERIES: List[str] = [
+    "a red car parked on the street",
+    "a news anchor reading the news in a studio",
+    "people wearing traditional ao dai at a festival",
+    "a firefighter spraying water on a burning house at night",
+    "close-up of a hand holding a smartphone",
+    "a football player celebrating after scoring a goal in a crowded stadium",
+    "aerial view of rice fields",
+    "a chart showing gasoline prices increasing",
+]
+
+
+def build_fast_encoder(model: nn.Module, tokenize: Callable[[List[str]], torch.Tensor], mode: str,
+                       onnx_path: Optional[str] = None, num_threads: Optional[int] = None,
+                       min_cosine: float = 0.99) -> Optional[Callable[[torch.Tensor], torch.Tensor]]:
+    """
+    Dựng encoder theo mode, kiểm tra parity với fp32.
+    Trả về None nếu mode = "fp32" hoặc encoder nhanh không đạt parity (khi đó dùng fp32).
+    """
+    if mode not in ENCODER_MODES:
+        raise ValueError(f"TEXT_ENCODER_MODE không hợp lệ: {mode} (chọn {ENCODER_MODES})")
+    if mode == "fp32":
+        return None
+
+    sample_tokens = tokenize(PARITY_QUERIES)
+    if mode == "int8":
+        encoder = build_int8_encoder(model)
+    else:
+        encoder = build_onnx_encoder(model, sample_tokens, onnx_path or "cache/text_tower.onnx", num_threads)
+
+    reference = _TextTower(model).eval()
+    try:
+        parity = check_parity(reference, encoder, sample_tokens.to(next(model.parameters()).device), min_cosine)
+    except ValueError as e:
+        print(f"⚠️  {e} - dùng lại encoder fp32")
+        return None
+    print(f"✅ Text encoder '{mode}' sẵn sàng (cosine min {parity['min_cosine']:.4f}, "
+          f"mean {parity['mean_cosine']:.4f})")
+    return encoder
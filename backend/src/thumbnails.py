@@ -0,0 +1,105 @@
+"""
+Thumbnail WebP cho keyframe (gallery chỉ cần ảnh nhỏ, modal mới cần ảnh gốc).
+
+- Tạo lúc truy cập lần đầu: ảnh gốc -> thu nhỏ (cạnh dài <= size) -> WebP
+- Cache trên đĩa: <cache_dir>/<size>/<path gốc>.webp, mtime của thumbnail = mtime ảnh gốc
+  => ảnh gốc bị ghi đè thì mtime lệch và thumbnail được tạo lại
+- Ghi file tạm rồi os.replace => request khác không bao giờ đọc phải file ghi dở
+- Tạo hàng loạt trước: utils/generate_thumbnails.py (nhiều process)
+"""
+import os
+import threading
+import zlib
+from typing import Iterator, Optional, Sequence
+
+from PIL import Image
+
+IMAGE_EXTS = (".webp", ".jpg", ".jpeg", ".png")
+
+
+class ThumbnailCache:
+    """
+    Args:
+        source_root: thư mục gốc của ảnh (giống /images, vd config.IMAGE_BASE_PATH)
+        cache_dir: nơi lưu thumbnail
+        sizes: các kích thước cho phép (chặn request tạo size tùy ý làm đầy đĩa)
+        quality: chất lượng WebP
+    """
+
+    def __init__(self, source_root: str, cache_dir: str, sizes: Sequence[int] = (320,), quality: int = 75):
+        self.source_root = os.path.abspath(source_root)
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.sizes = tuple(sizes)
+        self.quality = quality
+        # Lock theo path (chia 64 ngăn): 2 request cùng ảnh chưa có thumbnail chỉ tạo 1 lần
+        self._locks = [threading.Lock() for _ in range(64)]
+        self.generated = 0
+        self.hits = 0
+
+    def source_path(self, rel_path: str) -> Optional[str]:
+        """rel_path (vd 'Keyframes/L21/L21_V001/001.webp') -> path tuyệt đối, None nếu thoát khỏi source_root."""
+        path = os.path.abspath(os.path.join(self.source_root, rel_path))
+        if os.path.commonpath([path, self.source_root]) != self.source_root:
+            return None
+        return path
+
+    def thumb_path(self, size: int, rel_path: str) -> str:
+        return os.path.join(self.cache_dir, str(size), os.path.splitext(rel_path)[0] + ".webp")
+
+    def get(self, size: int, rel_path: str) -> Optional[str]:
+        """Path thumbnail (tạo nếu chưa có / đã cũ). None nếu size không cho phép hoặc không có ảnh gốc."""
+        if size not in self.sizes or not rel_path.lower().endswith(IMAGE_EXTS):
+            return None
+        source = self.source_path(rel_path)
+        if source is None:
+            return None
+        try:
+            source_mtime = os.stat(source).st_mtime_ns
+        except OSError:
+            return None
+
+        thumb = self.thumb_path(size, rel_path)
+        if self._is_fresh(thumb, source_mtime):
+            self.hits += 1
+            return thumb
+        with self._locks[zlib.crc32(thumb.encode("utf-8")) % len(self._locks)]:
+            if not self._is_fresh(thumb, source_mtime):
+                self._generate(source, thumb, size, source_mtime)
+                self.generated += 1
+        return thumb
+
+    @staticmethod
+    def _is_fresh(thumb: str, source_mtime: int) -> bool:
+        try:
+            return os.stat(thumb).st_mtime_ns == source_mtime
+        except OSError:
+            return False
+
+    def _generate(self, source: str, thumb: str, size: int, source_mtime: int):
+        os.makedirs(os.path.dirname(thumb), exist_ok=True)
+        tmp = f"{thumb}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with Image.open(source) as img:
+                img.draft("RGB", (size, size))   # JPEG: decode thẳng ở độ phân giải nhỏ (nhanh hơn nhiều)
+                img = img.convert("RGB")
+                img.thumbnail((size, size), Image.BILINEAR)
+                img.save(tmp, "WEBP", quality=self.quality, method=4)
+            os.utime(tmp, ns=(source_mtime, source_mtime))
+            os.replace(tmp, thumb)
+        except Exception:
+            # Lỗi giữa chừng (ảnh hỏng, đĩa đầy...) => không để lại file tạm trong cache
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+
+    def iter_sources(self, subdir: str = "Keyframes") -> Iterator[str]:
+        """Mọi ảnh gốc dưới source_root/subdir, trả về path tương đối so với source_root."""
+        for root, _, files in os.walk(os.path.join(self.source_root, subdir)):
+            for name in files:
+                if name.lower().endswith(IMAGE_EXTS):
+                    yield os.path.relpath(os.path.join(root, name), self.source_root).replace("\\", "/")
+
+    def stats(self):
+        return {"sizes": list(self.sizes), "generated": self.generated, "hits": self.hits}
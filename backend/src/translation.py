@@ -0,0 +1,165 @@
+"""
+TRANSLATION STAGE (vi -> en) cho câu truy vấn trước khi encode.
+
+- Cache LRU trong RAM + SQLite (dùng lại caching.LRUCache) => query lặp lại không gọi mạng
+- Query đã là tiếng Anh thì bỏ qua, không dịch
+- Timeout cứng: quá hạn / lỗi mạng => trả nguyên văn (pass-through), kết quả về muộn vẫn được cache
+- Backend thay được: "googletrans" (mặc định, cần mạng) hoặc "offline" (không gọi mạng, dùng khi dev / test)
+"""
+import re
+import threading
+import unicodedata
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Dict, Optional
+
+from .caching import LRUCache, normalize_query_text
+from .metrics import stage
+
+# Từ tiếng Việt không dấu hay gặp trong query (người gõ không bật bộ gõ)
+_VI_ASCII_WORDS = {
+    "cua", "nguoi", "mot", "nhung", "trong", "cac", "khong", "duoc", "voi", "dang", "dung",
+    "ngoi", "chay", "xe", "cai", "con", "dan", "ong", "ba", "co", "chiec", "tren", "duoi",
+    "va", "la", "cho", "nay", "do", "mau", "ao", "nha", "canh", "truoc", "sau", "hinh",
+}
+_WORD_RE = re.compile(r"[a-z]+")
+
+
+def looks_english(text: str) -> bool:
+    """
+    Đoán nhanh query đã là tiếng Anh chưa:
+    - có chữ cái ngoài ASCII (dấu tiếng Việt, đ...) => không phải
+    - toàn ASCII: coi là tiếng Việt không dấu nếu >= 1/3 số từ nằm trong _VI_ASCII_WORDS
+    """
+    decomposed = unicodedata.normalize("NFD", text)
+    if any(ord(ch) > 127 and (ch.isalpha() or unicodedata.combining(ch)) for ch in decomposed):
+        return False
+    words = _WORD_RE.findall(text.lower())
+    if not words:
+        return True
+    vi_words = sum(1 for w in words if w in _VI_ASCII_WORDS)
+    return vi_words * 3 < len(words)
+
+
+class TranslationBackend:
+    """Interface backend dịch: translate(text, src, dest) -> str (lỗi thì raise)."""
+    name = "base"
+
+    def translate(self, text: str, src: str, dest: str) -> str:
+        raise NotImplementedError
+
+
+class GoogleTransBackend(TranslationBackend):
+    """googletrans (gọi mạng) - giống TranslatorModule cũ."""
+    name = "googletrans"
+
+    def __init__(self):
+        from googletrans import Translator
+        self.translator = Translator()
+
+    def translate(self, text: str, src: str, dest: str) -> str:
+        return self.translator.translate(text, src=src, dest=dest).text
+
+
+class OfflineBackend(TranslationBackend):
+    """
+    Backend không gọi mạng: thay từng từ theo glossary (nếu có), còn lại giữ nguyên.
+    Dùng khi chạy không có internet hoặc để test pipeline mà không phụ thuộc googletrans.
+    """
+    name = "offline"
+
+    def __init__(self, glossary: Optional[Dict[str, str]] = None):
+        self.glossary = {normalize_query_text(k): v for k, v in (glossary or {}).items()}
+
+    def translate(self, text: str, src: str, dest: str) -> str:
+        key = normalize_query_text(text)
+        if key in self.glossary:
+            return self.glossary[key]
+        return " ".join(self.glossary.get(w, w) for w in key.split())
+
+
+TRANSLATION_BACKENDS = {
+    GoogleTransBackend.name: GoogleTransBackend,
+    OfflineBackend.name: OfflineBackend,
+}
+
+
+def build_backend(name: str, **kwargs) -> TranslationBackend:
+    if name not in TRANSLATION_BACKENDS:
+        raise ValueError(f"Translation backend không hợp lệ: {name} (chọn {list(TRANSLATION_BACKENDS)})")
+    return TRANSLATION_BACKENDS[name](**kwargs)
+
+
+class TranslatorModule:
+    """
+    Args:
+        backend: TranslationBackend
+        cache_size / cache_path: LRU trong RAM + file SQLite (None = chỉ RAM)
+        timeout_sec: chờ backend tối đa bao lâu, quá hạn thì trả nguyên văn
+        src / dest: ngôn ngữ nguồn / đích
+        skip_english: query đã là tiếng Anh thì không dịch
+    """
+
+    def __init__(self, backend: TranslationBackend, cache_size: int = 4096, cache_path: Optional[str] = None,
+                 timeout_sec: float = 1.5, src: str = "vi", dest: str = "en", skip_english: bool = True,
+                 max_workers: int = 4):
+        self.backend = backend
+        self.timeout_sec = timeout_sec
+        self.src = src
+        self.dest = dest
+        self.skip_english = skip_english
+        self.cache = LRUCache(max_size=cache_size, store_path=cache_path,
+                              namespace=f"translate:{backend.name}:{src}-{dest}")
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="translate")
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.skipped = 0
+        self.timeouts = 0
+        self.errors = 0
+
+    def _call_backend(self, key: str, text: str) -> str:
+        try:
+            result = self.backend.translate(text, self.src, self.dest)
+            self.cache.put(key, result)   # kể cả khi request đã timeout => lần sau có sẵn
+            return result
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def translate(self, text: str) -> str:
+        if not text or not text.strip():
+            return text
+        if self.skip_english and looks_english(text):
+            self.skipped += 1
+            return text
+
+        with stage("translate"):
+            key = normalize_query_text(text)
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+            # Nhiều request cùng query đang chờ dịch => dùng chung 1 lần gọi backend
+            with self._lock:
+                future = self._inflight.get(key)
+                if future is None:
+                    future = self._executor.submit(self._call_backend, key, text)
+                    self._inflight[key] = future
+            try:
+                return future.result(timeout=self.timeout_sec)
+            except FutureTimeoutError:
+                self.timeouts += 1
+                print(f"⚠️  Dịch quá {self.timeout_sec}s, dùng nguyên văn: {text!r}")
+            except Exception as e:
+                self.errors += 1
+                print(f"⚠️  Lỗi dịch ({self.backend.name}), dùng nguyên văn: {e}")
+            return text
+
+    def stats(self):
+        return {
+            "backend": self.backend.name,
+            "timeout_sec": self.timeout_sec,
+            "skipped_english": self.skipped,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            "cache": self.cache.stats(),
+        }
@@ -0,0 +1,50 @@
+"""
+Endpoint /video/<video_id>/frames: danh sách mọi keyframe của 1 video (cho modal xem frame lân cận),
+lấy từ keyframe manifest thay cho all_frames trong response /search (compact=1).
+
+Tách khỏi app.py thành Blueprint => test được route thật mà không phải load model / Milvus / ES.
+
+ETag theo mtime thư mục video => trình duyệt gửi If-None-Match và nhận 304 khi không đổi.
+ETag là weak (W/"..."): cùng 1 danh sách frame có thể được gửi dạng gzip / brotli / không nén,
+các body khác nhau từng byte nên không dùng chung được ETag mạnh.
+"""
+from flask import Blueprint, jsonify, request
+
+from .keyframe_manifest import KeyframeManifest
+from .metrics import stage
+from .response_encoding import ResponseEncoder, not_modified
+from .search_scope import is_valid_video
+
+
+def video_frames_blueprint(manifest: KeyframeManifest, encoder: ResponseEncoder, max_age: int = 3600) -> Blueprint:
+    """
+    Args:
+        manifest: KeyframeManifest dùng chung của app
+        encoder: ResponseEncoder dùng chung (orjson + nén theo Accept-Encoding)
+        max_age: Cache-Control max-age (giây) của danh sách frame
+    """
+    blueprint = Blueprint("video_frames", __name__)
+
+    @blueprint.route("/video/<video_id>/frames", methods=["GET"])
+    def video_frames_endpoint(video_id):
+        if not is_valid_video(video_id):
+            return jsonify({"error": f"video_id không hợp lệ: {video_id}"}), 400
+        etag = manifest.etag(video_id)
+        if etag is None:
+            return jsonify({"error": f"Không tìm thấy video {video_id}"}), 404
+
+        headers = {"Cache-Control": f"public, max-age={max_age}"}
+        cached = not_modified(etag, request.if_none_match, headers, weak=True)
+        if cached is not None:
+            return cached
+
+        level_dir = video_id.split("_")[0]
+        with stage("response_encode"):
+            return encoder.json({
+                "video_id": video_id,
+                "base": f"/images/Keyframes/{level_dir}/{video_id}/",
+                "files": manifest.all_frames(video_id)
+            }, headers=headers, accept_encoding=request.headers.get("Accept-Encoding"),
+                etag=etag, weak_etag=True)
+
+    return blueprint
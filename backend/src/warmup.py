@@ -0,0 +1,91 @@
+"""
+Warmup lúc khởi động + trạng thái cho /healthz, /readyz.
+
+Request đầu tiên sau khi restart chậm hơn hẳn: forward pass đầu của text encoder,
+lần search đầu trên Milvus / Elasticsearch (mở connection, nạp cache). Warmup chạy sẵn vài
+query mẫu qua từng thành phần rồi mới báo ready => load balancer / operator không gửi
+request vào process còn "lạnh".
+
+Mỗi thành phần: pending -> warming -> ready | failed, kèm thời gian warmup (ms) và lỗi (nếu có).
+Thành phần required=True mà failed thì process không ready; thành phần phụ (ES, dịch...)
+failed chỉ làm trạng thái thành "degraded".
+"""
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+
+class WarmupRunner:
+    def __init__(self):
+        self._components: Dict[str, Dict[str, Any]] = {}
+        self._fns: Dict[str, Callable[[], Any]] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def add(self, name: str, fn: Callable[[], Any], required: bool = True):
+        """Đăng ký 1 thành phần: fn chạy query mẫu, raise nếu lỗi."""
+        with self._lock:
+            self._fns[name] = fn
+            self._components[name] = {"state": "pending", "required": required, "warmup_ms": None, "error": None}
+
+    def _set(self, name: str, **fields):
+        with self._lock:
+            self._components[name].update(fields)
+
+    def run(self):
+        """Chạy warmup lần lượt từng thành phần (chặn tới khi xong)."""
+        self.started_at = time.time()
+        for name, fn in list(self._fns.items()):
+            self._set(name, state="warming")
+            start = time.perf_counter()
+            try:
+                fn()
+                self._set(name, state="ready", warmup_ms=round((time.perf_counter() - start) * 1000, 1))
+                print(f"🔥 Warmup '{name}': {self._components[name]['warmup_ms']:.0f} ms")
+            except Exception as e:
+                self._set(name, state="failed", error=str(e),
+                          warmup_ms=round((time.perf_counter() - start) * 1000, 1))
+                print(f"⚠️  Warmup '{name}' lỗi: {e}")
+        self.finished_at = time.time()
+
+    def start(self):
+        """Chạy warmup trên thread nền (request vẫn vào được, /readyz trả 503 tới khi xong)."""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self.run, name="warmup", daemon=True)
+        self._thread.start()
+
+    def skip(self):
+        """Không warmup (WARMUP_ENABLED = False): coi như đã xong."""
+        self.started_at = self.finished_at = time.time()
+        with self._lock:
+            for component in self._components.values():
+                component["state"] = "skipped"
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_at is not None
+
+    def ready(self) -> bool:
+        with self._lock:
+            return self.finished and not any(
+                c["required"] and c["state"] == "failed" for c in self._components.values()
+            )
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            components = {name: dict(c) for name, c in self._components.items()}
+        failed: List[str] = [name for name, c in components.items() if c["state"] == "failed"]
+        if not self.finished:
+            overall = "warming" if self.started_at else "pending"
+        elif any(components[name]["required"] for name in failed):
+            overall = "failed"
+        else:
+            overall = "degraded" if failed else "ready"
+        return {
+            "status": overall,
+            "warmup_sec": round(self.finished_at - self.started_at, 2) if self.finished else None,
+            "components": components,
+        }
@@ -0,0 +1,14 @@
+"""
+Cho test import từng module trong src (vd src.video_frames) mà không chạy src/__init__.py:
+__init__ import mọi retriever => kéo theo torch / open_clip / pymilvus / elasticsearch.
+"""
+import os
+import sys
+import types
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+if "src" not in sys.modules:
+    package = types.ModuleType("src")
+    package.__path__ = [SRC_DIR]
+    sys.modules["src"] = package
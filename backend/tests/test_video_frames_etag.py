@@ -0,0 +1,65 @@
+"""
+Conditional GET cho /video/<video_id>/frames (src/video_frames.py, blueprint app.py đang dùng):
+request lặp lại với If-None-Match phải nhận 304, ETag là weak vì body có thể nén hoặc không.
+"""
+import pytest
+from flask import Flask
+
+from src.keyframe_manifest import KeyframeManifest
+from src.response_encoding import ResponseEncoder
+from src.video_frames import video_frames_blueprint
+
+VIDEO_ID = "L21_V001"
+
+
+@pytest.fixture
+def client(tmp_path):
+    video_dir = tmp_path / "L21" / VIDEO_ID
+    video_dir.mkdir(parents=True)
+    for frame in (0, 25, 50):
+        (video_dir / f"{frame:03d}.webp").write_bytes(b"")
+
+    app = Flask(__name__)
+    app.register_blueprint(video_frames_blueprint(KeyframeManifest(str(tmp_path)),
+                                                  ResponseEncoder(min_compress_bytes=0), max_age=60))
+    return app.test_client()
+
+
+def test_first_request_returns_frames_with_weak_etag(client):
+    response = client.get(f"/video/{VIDEO_ID}/frames")
+    assert response.status_code == 200
+    assert response.get_json()["files"] == ["000.webp", "025.webp", "050.webp"]
+    assert response.headers["ETag"].startswith('W/"')
+    assert response.headers["Cache-Control"] == "public, max-age=60"
+
+
+def test_repeat_request_gets_304(client):
+    etag = client.get(f"/video/{VIDEO_ID}/frames").headers["ETag"]
+
+    response = client.get(f"/video/{VIDEO_ID}/frames", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert response.data == b""
+
+
+def test_etag_matches_across_content_encodings(client):
+    plain = client.get(f"/video/{VIDEO_ID}/frames")
+    gzipped = client.get(f"/video/{VIDEO_ID}/frames", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in plain.headers
+    assert gzipped.headers["Content-Encoding"] == "gzip"
+    # Cùng nội dung, khác encoding => cùng weak ETag, và ETag của bản này dùng được cho bản kia
+    assert plain.headers["ETag"] == gzipped.headers["ETag"]
+    plain = plain.headers["ETag"]
+
+    response = client.get(f"/video/{VIDEO_ID}/frames", headers={"If-None-Match": plain, "Accept-Encoding": "gzip"})
+    assert response.status_code == 304
+
+
+def test_stale_etag_gets_200(client):
+    response = client.get(f"/video/{VIDEO_ID}/frames", headers={"If-None-Match": 'W/"stale"'})
+    assert response.status_code == 200
+
+
+def test_unknown_and_invalid_video(client):
+    assert client.get("/video/L21_V999/frames").status_code == 404
+    assert client.get("/video/not-a-video/frames").status_code == 400
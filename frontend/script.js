@@ -9,6 +9,8 @@ document.addEventListener("DOMContentLoaded", () => {
   const gallery = document.getElementById("gallery");
   const viewModeToggle = document.getElementById("view-mode-toggle");
   const SubmitButton = document.getElementById("submit-btn");
+  const prevPageButton = document.getElementById("prev-page-btn");
+  const nextPageButton = document.getElementById("next-page-btn");
   let videoData = {};
 
   // Load JSON chứa thông tin video
@@ -42,6 +44,11 @@ document.addEventListener("DOMContentLoaded", () => {
   let fullData = null;
   let currentViewMode = "frame"; // mặc định xem theo frame
 
+  // --- Cursor phân trang (server giữ ranked list, đổi k / sang trang không search lại) ---
+  let lastSignature = null;
+  let lastCursor = null;
+  let currentOffset = 0;
+
   // --- Map ánh xạ ---
   const pathToVideoIdMap = new Map();
   const videoIdToAllFramesMap = new Map();
@@ -49,6 +56,10 @@ document.addEventListener("DOMContentLoaded", () => {
   // --- Hằng số host ---
   const HOST = "http://127.0.0.1:5000";
   const addHost = (p) => (p ? (p.startsWith("http") ? p : `${HOST}${p}`) : "");
+  // Gallery / thumb lân cận dùng thumbnail WebP (/thumbs/<size>/...), modal mới tải ảnh gốc
+  const THUMB_SIZE = 320;
+  const thumbUrl = (p) =>
+    addHost(p && p.startsWith("/images/") ? `/thumbs/${THUMB_SIZE}/${p.slice("/images/".length)}` : p);
   const normalizePathFromSrc = (src) => {
     try {
       return new URL(src, HOST).pathname;
@@ -58,7 +69,7 @@ document.addEventListener("DOMContentLoaded", () => {
   };
 
   // --- Hàm gọi API ---
-  async function performSearch() {
+  async function performSearch(offset = 0) {
     let query = queryInput.value.trim();
     const k = topkInput.value;
     let colors = colorInput.value.trim();
@@ -77,7 +88,12 @@ if(!colors){
     }
     gallery.innerHTML = '<p class="placeholder">Loading...</p>';
 
-    let apiUrl = `${HOST}/search?query=${encodeURIComponent(query)}&k=${k}&mode=${mode}&colors=${encodeURIComponent(colors)}&ocr=${encodeURIComponent(ocr)}`;
+    let apiUrl = `${HOST}/search?query=${encodeURIComponent(query)}&k=${k}&mode=${mode}&colors=${encodeURIComponent(colors)}&ocr=${encodeURIComponent(ocr)}&offset=${offset}&compact=1`;
+    // Cùng query / mode => gửi lại cursor để server cắt từ ranked list đã có
+    const signature = JSON.stringify([query, mode, colors, ocr]);
+    if (signature === lastSignature && lastCursor) {
+      apiUrl += `&cursor=${lastCursor}`;
+    }
 
 
     try {
@@ -85,17 +101,25 @@ if(!colors){
       if (!response.ok)
         throw new Error(`HTTP error! Status: ${response.status}`);
 
-      fullData = await response.json();
+      fullData = expandCompact(await response.json());
+      lastSignature = signature;
+      lastCursor = fullData.cursor || null;
+      currentOffset = fullData.offset || 0;
+      prevPageButton.disabled = !lastCursor || currentOffset === 0;
+      nextPageButton.disabled = !fullData.has_more;
 
       // build mapping
       pathToVideoIdMap.clear();
       videoIdToAllFramesMap.clear();
       if (fullData?.video_results?.length) {
         fullData.video_results.forEach((v) => {
-          videoIdToAllFramesMap.set(v.video_id, v.all_frames || []);
-          (v.all_frames || []).forEach((p) => {
-            pathToVideoIdMap.set(p, v.video_id);
-          });
+          // Response compact không có all_frames => để trống, getAllFrames sẽ gọi /video/<id>/frames
+          if (Array.isArray(v.all_frames) && v.all_frames.length) {
+            videoIdToAllFramesMap.set(v.video_id, v.all_frames);
+            v.all_frames.forEach((p) => {
+              pathToVideoIdMap.set(p, v.video_id);
+            });
+          }
           (v.frames || []).forEach((f) => {
             if (f?.path) pathToVideoIdMap.set(f.path, v.video_id);
           });
@@ -109,6 +133,41 @@ if(!colors){
     }
   }
 
+  // --- Response gọn (compact=1): dựng lại frame_results / video_results từ frame number ---
+  function expandCompact(data) {
+    if (!data?.compact) return data;
+    const framePath = (v, frame) => {
+      const pack = v.video_id.split("_")[0];
+      const name = typeof frame === "number" ? String(frame).padStart(v.pad, "0") : frame;
+      return `${data.base}${pack}/${v.video_id}/${name}${v.ext}`;
+    };
+    const videoResults = data.video_results.map((v) => ({
+      video_id: v.video_id,
+      video_score: v.video_score,
+      best_rank: v.best_rank,
+      frames: v.frames.map((f, i) => ({ path: framePath(v, f), score: v.scores[i] })),
+    }));
+    const frameResults = data.frame_order.map(([vi, fi]) => videoResults[vi].frames[fi]);
+    return { ...data, frame_results: frameResults, video_results: videoResults };
+  }
+
+  // --- Lấy toàn bộ frame của 1 video khi cần (modal), có cache + ETag phía server ---
+  async function getAllFrames(videoId) {
+    if (videoIdToAllFramesMap.has(videoId)) return videoIdToAllFramesMap.get(videoId);
+    try {
+      const res = await fetch(`${HOST}/video/${encodeURIComponent(videoId)}/frames`);
+      if (!res.ok) throw new Error(`HTTP error! Status: ${res.status}`);
+      const data = await res.json();
+      const list = data.files.map((f) => `${data.base}${f}`);
+      videoIdToAllFramesMap.set(videoId, list);
+      list.forEach((p) => pathToVideoIdMap.set(p, videoId));
+      return list;
+    } catch (err) {
+      console.error("❌ Lỗi lấy frame của video:", videoId, err);
+      return [];
+    }
+  }
+
   // --- Render gallery ---
   function renderGallery() {
     if (!fullData) return;
@@ -132,7 +191,7 @@ if(!colors){
 
     frameResults.forEach((item) => {
       const imgElement = document.createElement("img");
-      imgElement.src = addHost(item.path);
+      imgElement.src = thumbUrl(item.path);
       imgElement.alt = item.path;
       imgElement.loading = "lazy";
       imgElement.dataset.pathNormalized = item.path;
@@ -303,7 +362,7 @@ async function submit(session_id, evaluation_id, body) {
       // Hiển thị TẤT CẢ frames trong kết quả
       resultFrames.forEach((frame) => {
         const img = document.createElement("img");
-        img.src = addHost(frame.path);
+        img.src = thumbUrl(frame.path);
         img.className = "grid-frame";
         img.dataset.videoId = video.video_id;
         img.dataset.pathNormalized = frame.path;
@@ -401,9 +460,17 @@ alert(await submit(session_id,evaluation_id,body));
   });
 
   // --- Sự kiện ---
-  searchButton.addEventListener("click", performSearch);
+  searchButton.addEventListener("click", () => performSearch(0));
   queryInput.addEventListener("keypress", (event) => {
-    if (event.key === "Enter") performSearch();
+    if (event.key === "Enter") performSearch(0);
+  });
+  prevPageButton.addEventListener("click", () => {
+    const k = parseInt(topkInput.value) || 0;
+    performSearch(Math.max(0, currentOffset - k));
+  });
+  nextPageButton.addEventListener("click", () => {
+    const k = parseInt(topkInput.value) || 0;
+    performSearch(currentOffset + k);
   });
   viewModeToggle.addEventListener("click", () => {
     if (!fullData) return;
@@ -424,35 +491,35 @@ alert(await submit(session_id,evaluation_id,body));
   let currentIndex = 0;
 
   // Click ảnh trong gallery -> mở modal
-  gallery.addEventListener("click", (e) => {
+  gallery.addEventListener("click", async (e) => {
     if (e.target.tagName !== "IMG") return;
 
     const clickedRelPath =
       e.target.dataset.pathNormalized || normalizePathFromSrc(e.target.src);
     const clickedVideoId =
-      e.target.dataset.videoId || pathToVideoIdMap.get(clickedRelPath);
+      e.target.dataset.videoId ||
+      pathToVideoIdMap.get(clickedRelPath) ||
+      parseVideoAndFrame(clickedRelPath).videoId;
 
-    if (clickedVideoId && videoIdToAllFramesMap.has(clickedVideoId)) {
-      const listRel = videoIdToAllFramesMap.get(clickedVideoId) || [];
+    if (clickedVideoId) {
+      const listRel = await getAllFrames(clickedVideoId);
       if (listRel.length > 0) {
         allImages = listRel.map(addHost);
         let idx = listRel.indexOf(clickedRelPath);
         if (idx < 0) {
-          idx = listRel.findIndex(
-            (p) => addHost(p) === e.target.src || e.target.src.endsWith(p)
-          );
+          idx = listRel.findIndex((p) => clickedRelPath.endsWith(p));
         }
         currentIndex = Math.max(0, idx);
       } else {
-        allImages = [e.target.src];
+        allImages = [addHost(clickedRelPath)];
         currentIndex = 0;
       }
     } else {
-      allImages = Array.from(gallery.querySelectorAll("img")).map(
-        (img) => img.src
+      const galleryImgs = Array.from(gallery.querySelectorAll("img"));
+      allImages = galleryImgs.map((img) =>
+        addHost(img.dataset.pathNormalized || normalizePathFromSrc(img.src))
       );
-      currentIndex = allImages.indexOf(e.target.src);
-      if (currentIndex < 0) currentIndex = 0;
+      currentIndex = Math.max(0, galleryImgs.indexOf(e.target));
     }
 
     openModal(currentIndex);
@@ -491,7 +558,7 @@ alert(await submit(session_id,evaluation_id,body));
     for (let i = start; i <= end; i++) {
       if (i === currentIndex) continue;
       const thumb = document.createElement("img");
-      thumb.src = allImages[i];
+      thumb.src = thumbUrl(normalizePathFromSrc(allImages[i]));
       thumb.addEventListener("click", (e) => {
         e.stopPropagation();
         showImage(i);
@@ -0,0 +1,103 @@
+"""
+Benchmark encode response /search: json stdlib (như jsonify) vs orjson, chi phí print kết quả,
+và số byte gửi đi khi không nén / gzip / brotli.
+
+Payload dựng bằng đúng hàm của /search (src/search_response.py) trên ranked list giả lập:
+bản đầy đủ (frame_results + video_results kèm all_frames) và bản compact (compact=1),
+cộng các field cursor như response thật, với k = 100 / 500 / 1000.
+
+Chạy:
+    python utils/benchmark_response_encoding.py
+    python utils/benchmark_response_encoding.py --k 100 500 1000 --frames-per-video 300 --repeat 20
+    python utils/benchmark_response_encoding.py --gzip-level 5 --brotli-quality 4   # so với mức nén cao hơn
+"""
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import time
+
+# import thẳng module (không qua src/__init__) để khỏi load torch / pymilvus chỉ để benchmark
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "backend", "src"))
+
+from response_encoding import compress, dumps, orjson, brotli  # noqa: E402
+from search_response import build_compact_response, build_search_response  # noqa: E402
+
+
+def make_ranked(k, n_videos, seed=0):
+    rng = random.Random(seed)
+    ranked = []
+    for i in range(k):
+        pack = f"L{21 + rng.randrange(10)}"
+        video = f"{pack}_V{rng.randrange(1, n_videos + 1):03d}"
+        ranked.append((f"{pack}/{video}/{rng.randrange(1, 3000):03d}.jpg", 1.0 - i / k))
+    return ranked
+
+
+def cursor_fields(k):
+    """Các field cursor_info (app.py) trả kèm mọi response /search."""
+    return {"cursor": "c" * 32, "offset": 0, "k": k, "has_more": True}
+
+
+def full_payload(ranked, frames_per_video):
+    names = [f"{n:03d}.jpg" for n in range(1, frames_per_video + 1)]   # thay cho KeyframeManifest.all_frames
+    frame_results, video_results = build_search_response(ranked, lambda video_id: names)
+    return {"frame_results": frame_results, "video_results": video_results, **cursor_fields(len(ranked))}
+
+
+def compact_payload(ranked):
+    return {**build_compact_response(ranked), **cursor_fields(len(ranked))}
+
+
+def timeit(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark encode / nén response /search")
+    parser.add_argument("--k", nargs="+", type=int, default=[100, 500, 1000])
+    parser.add_argument("--videos", type=int, default=120, help="số video mỗi pack")
+    parser.add_argument("--frames-per-video", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--gzip-level", type=int, default=1)
+    parser.add_argument("--brotli-quality", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"orjson: {'có' if orjson else 'KHÔNG (fallback json stdlib)'}, brotli: {'có' if brotli else 'KHÔNG'}, "
+          f"gzip level {args.gzip_level}, brotli quality {args.brotli_quality}")
+    header = (f"{'payload':>8s} {'k':>5s} {'stdlib ms':>10s} {'fast ms':>8s} {'print ms':>9s} "
+              f"{'raw KB':>8s} {'gzip KB':>8s} {'gz ms':>6s} {'br KB':>7s} {'br ms':>6s}")
+    print("=" * len(header))
+    print(header)
+    print("-" * len(header))
+    for k in args.k:
+        ranked = make_ranked(k, args.videos)
+        for name, payload in (("full", full_payload(ranked, args.frames_per_video)),
+                              ("compact", compact_payload(ranked))):
+            # jsonify mặc định của Flask: sort_keys + ensure_ascii
+            stdlib_ms = timeit(lambda: json.dumps(payload, sort_keys=True, ensure_ascii=True).encode(), args.repeat)
+            fast_ms = timeit(lambda: dumps(payload), args.repeat)
+            # print toàn bộ kết quả như log cũ (ghi vào buffer, không ra terminal)
+            print_ms = timeit(lambda: print(payload, file=io.StringIO()), args.repeat)
+            body = dumps(payload)
+            gz_ms = timeit(lambda: compress(body, "gzip", gzip_level=args.gzip_level), args.repeat)
+            gz = compress(body, "gzip", gzip_level=args.gzip_level)
+            if brotli is not None:
+                br_ms = timeit(lambda: compress(body, "br", brotli_quality=args.brotli_quality), args.repeat)
+                br_kb = f"{len(compress(body, 'br', brotli_quality=args.brotli_quality)) / 1024:7.1f}"
+                br_ms = f"{br_ms:6.2f}"
+            else:
+                br_kb, br_ms = f"{'-':>7s}", f"{'-':>6s}"
+            print(f"{name:>8s} {k:5d} {stdlib_ms:10.2f} {fast_ms:8.2f} {print_ms:9.2f} "
+                  f"{len(body) / 1024:8.1f} {len(gz) / 1024:8.1f} {gz_ms:6.2f} {br_kb} {br_ms}")
+
+
+if __name__ == "__main__":
+    main()
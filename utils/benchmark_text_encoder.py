@@ -0,0 +1,92 @@
+"""
+Benchmark text encoder SigLIP trên CPU: fp32 vs int8 vs ONNX.
+
+In ra cho từng mode + số thread:
+- latency encode 1 query (median / p95, ms)
+- cosine so với fp32 (parity, yêu cầu >= 0.99)
+
+Chạy:
+    python utils/benchmark_text_encoder.py --modes fp32 int8 onnx --threads 1 2 4 8
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import open_clip
+import torch
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+import config  # noqa: E402
+from src.text_encoder import (  # noqa: E402
+    PARITY_QUERIES, _TextTower, build_int8_encoder, build_onnx_encoder, check_parity
+)
+
+
+def measure(encode, tokenizer, queries, repeats):
+    """Encode từng query một (giống /search), trả về list latency (ms)."""
+    latencies = []
+    with torch.no_grad():
+        for _ in range(repeats):
+            for q in queries:
+                tokens = tokenizer([q])
+                start = time.perf_counter()
+                encode(tokens)
+                latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark SigLIP text encoder trên CPU")
+    parser.add_argument("--modes", nargs="+", default=["fp32", "int8", "onnx"])
+    parser.add_argument("--threads", nargs="+", type=int, default=[1, 2, 4, 8])
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--onnx-path", default=os.path.join("cache", "siglip_text_tower.onnx"))
+    args = parser.parse_args()
+
+    print(f"Loading {config.MODEL_NAME_SIGLIP} ({config.PRETRAINED_SIGLIP}) on CPU...")
+    model, _, _ = open_clip.create_model_and_transforms(
+        config.MODEL_NAME_SIGLIP, pretrained=config.PRETRAINED_SIGLIP, device="cpu"
+    )
+    model.eval()
+    tokenizer = open_clip.get_tokenizer(config.MODEL_NAME_SIGLIP)
+    reference = _TextTower(model).eval()
+    parity_tokens = tokenizer(PARITY_QUERIES)
+
+    rows = []
+    for mode in args.modes:
+        if mode == "fp32":
+            encoder = reference
+        elif mode == "int8":
+            encoder = build_int8_encoder(model)
+        elif mode == "onnx":
+            encoder = None  # dựng lại theo từng số thread bên dưới
+        else:
+            print(f"⚠️  Bỏ qua mode không hợp lệ: {mode}")
+            continue
+
+        for n_threads in args.threads:
+            torch.set_num_threads(n_threads)
+            if mode == "onnx":
+                encoder = build_onnx_encoder(model, parity_tokens, args.onnx_path, num_threads=n_threads)
+
+            parity = check_parity(reference, encoder, parity_tokens, min_cosine=-1.0)
+            measure(encoder, tokenizer, PARITY_QUERIES[:args.warmup], 1)
+            latencies = measure(encoder, tokenizer, PARITY_QUERIES, args.repeats)
+            p95 = statistics.quantiles(latencies, n=20)[-1]
+            rows.append((mode, n_threads, statistics.median(latencies), p95, parity["min_cosine"]))
+            print(f"  {mode:5s} threads={n_threads:2d}  median={rows[-1][2]:8.2f} ms  "
+                  f"p95={p95:8.2f} ms  min_cos={parity['min_cosine']:.4f}")
+
+    print("\n" + "=" * 64)
+    print(f"{'mode':6s} {'threads':>7s} {'median ms':>10s} {'p95 ms':>10s} {'min cos':>8s}  parity")
+    print("-" * 64)
+    for mode, n_threads, median, p95, min_cos in rows:
+        ok = "✅" if min_cos >= 0.99 else "❌"
+        print(f"{mode:6s} {n_threads:7d} {median:10.2f} {p95:10.2f} {min_cos:8.4f}  {ok}")
+
+
+if __name__ == "__main__":
+    main()
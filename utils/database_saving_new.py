@@ -42,6 +42,9 @@ MAPPING_BASE_DIR  = "D:/Workplace/AIC_2025/Data/All_Features/SigLip"
 # Batch insert
 BATCH_SIZE = 5000
 
+# Mỗi pack 1 partition (tên partition = tên pack) => search theo pack / video chỉ quét partition đó
+_USE_PARTITIONS = True
+
 # ================= HELPER =================
 
 def normalize(vec):
@@ -86,6 +89,7 @@ def main():
 
             all_clean_data.append({
                 "id": global_id_counter,
+                "pack": l_pack,
                 "path": rel_path,
                 "embedding": features[local_id],
             })
@@ -123,16 +127,29 @@ def main():
     print(f"✅ Collection '{_COLLECTION_NAME}' created.")
 
     print("Step 3: Insert data...")
-    for i in tqdm(range(0, num_clean_data, BATCH_SIZE), desc="Inserting"):
-        end = min(i + BATCH_SIZE, num_clean_data)
-        batch = all_clean_data[i:end]
+    # Dữ liệu đã xếp theo pack (Step 1 duyệt từng pack) => mỗi batch chỉ thuộc 1 partition
+    batches = []
+    for i in range(0, num_clean_data, BATCH_SIZE):
+        batch = all_clean_data[i:min(i + BATCH_SIZE, num_clean_data)]
+        start = 0
+        for j in range(1, len(batch) + 1):
+            if j == len(batch) or batch[j]["pack"] != batch[start]["pack"]:
+                batches.append(batch[start:j])
+                start = j
+
+    for batch in tqdm(batches, desc="Inserting"):
+        partition_name = None
+        if _USE_PARTITIONS:
+            partition_name = batch[0]["pack"]
+            if not collection.has_partition(partition_name):
+                collection.create_partition(partition_name)
 
         entities = [
             [item['id'] for item in batch],
             [item['path'] for item in batch],
             [item['embedding'] for item in batch],
         ]
-        collection.insert(entities)
+        collection.insert(entities, partition_name=partition_name)
 
     print("✅ Insert finished. Flushing...")
     collection.flush()
@@ -146,6 +163,8 @@ def main():
 
     collection.load()
     print("✅ Collection loaded and ready.")
+    if _USE_PARTITIONS:
+        print(f"✅ Partitions: {[p.name for p in collection.partitions]}")
 
     connections.disconnect("default")
 
@@ -0,0 +1,89 @@
+"""
+Tạo trước thumbnail WebP cho toàn bộ cây Keyframes (để lần search đầu không phải chờ tạo thumbnail).
+
+Chạy song song nhiều process (resize ảnh là CPU-bound), thumbnail nào còn mới (mtime khớp ảnh gốc)
+thì bỏ qua => chạy lại sau khi thêm pack mới chỉ tạo phần còn thiếu.
+Cuối cùng in tổng dung lượng ảnh gốc vs thumbnail (= mức giảm băng thông của gallery).
+
+Chạy (trong thư mục gốc repo):
+    python utils/generate_thumbnails.py
+    python utils/generate_thumbnails.py --sizes 160 320 --workers 8 --subdir Keyframes/L21
+"""
+import argparse
+import os
+import sys
+import time
+from multiprocessing import Pool
+
+from tqdm import tqdm
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+sys.path.append(BACKEND_DIR)
+# import thẳng module (không qua src/__init__) để worker không phải load torch / pymilvus
+sys.path.append(os.path.join(BACKEND_DIR, "src"))
+
+import config  # noqa: E402
+from thumbnails import ThumbnailCache  # noqa: E402
+
+_cache = None
+
+
+def _init_worker(source_root, cache_dir, sizes, quality):
+    global _cache
+    _cache = ThumbnailCache(source_root, cache_dir, sizes=sizes, quality=quality)
+
+
+def _process(rel_path):
+    """Tạo thumbnail mọi size cho 1 ảnh -> (bytes ảnh gốc, {size: bytes thumbnail}, số thumbnail mới, lỗi)."""
+    thumb_bytes, generated = {}, 0
+    try:
+        for size in _cache.sizes:
+            before = _cache.generated
+            thumb = _cache.get(size, rel_path)
+            generated += _cache.generated - before
+            thumb_bytes[size] = os.path.getsize(thumb) if thumb else 0
+        return os.path.getsize(_cache.source_path(rel_path)), thumb_bytes, generated, None
+    except Exception as e:
+        return 0, thumb_bytes, generated, f"{rel_path}: {e}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tạo trước thumbnail WebP cho keyframe")
+    parser.add_argument("--source-root", default=config.IMAGE_BASE_PATH)
+    parser.add_argument("--subdir", default="Keyframes", help="chỉ xử lý thư mục con này của source-root")
+    parser.add_argument("--cache-dir", default=os.path.join(BACKEND_DIR, config.THUMBNAIL_CACHE_DIR))
+    parser.add_argument("--sizes", nargs="+", type=int, default=list(config.THUMBNAIL_SIZES))
+    parser.add_argument("--quality", type=int, default=config.THUMBNAIL_QUALITY)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    cache = ThumbnailCache(args.source_root, args.cache_dir, sizes=args.sizes, quality=args.quality)
+    print(f"🔍 Quét ảnh trong {os.path.join(args.source_root, args.subdir)}...")
+    sources = list(cache.iter_sources(args.subdir))
+    print(f"   {len(sources):,} ảnh, sizes={args.sizes}, {args.workers} process")
+
+    total_source, total_thumbs, generated, errors = 0, {s: 0 for s in args.sizes}, 0, []
+    start = time.perf_counter()
+    with Pool(args.workers, initializer=_init_worker,
+              initargs=(args.source_root, args.cache_dir, args.sizes, args.quality)) as pool:
+        for src_bytes, thumb_bytes, n_new, error in tqdm(pool.imap_unordered(_process, sources, chunksize=64),
+                                                        total=len(sources)):
+            total_source += src_bytes
+            for size, n in thumb_bytes.items():
+                total_thumbs[size] += n
+            generated += n_new
+            if error:
+                errors.append(error)
+    elapsed = time.perf_counter() - start
+
+    print(f"✅ Tạo mới {generated:,} thumbnail trong {elapsed:.1f}s ({len(sources) / max(elapsed, 1e-9):.0f} ảnh/s)")
+    print(f"   Ảnh gốc: {total_source / 1024 ** 2:,.1f} MB")
+    for size, n in total_thumbs.items():
+        ratio = total_source / n if n else float("nan")
+        print(f"   Thumbnail {size}px: {n / 1024 ** 2:,.1f} MB (nhỏ hơn {ratio:.1f} lần)")
+    if errors:
+        print(f"⚠️  {len(errors)} ảnh lỗi, vd: {errors[0]}")
+
+
+if __name__ == "__main__":
+    main()
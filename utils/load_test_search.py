@@ -0,0 +1,119 @@
+"""
+Load test /search: đo throughput + latency theo số operator (user) đồng thời.
+
+Mỗi user là 1 thread gửi request liên tục (query lấy vòng tròn trong danh sách) trong --duration giây.
+In bảng: users, req/s, p50 / p95 / p99 (ms), số lỗi. Throughput phải tăng theo số user
+khi chạy qua asgi.py (uvicorn / gunicorn), còn với server 1 thread thì gần như đứng yên.
+
+Chạy (backend đang chạy ở --host):
+    python utils/load_test_search.py --users 1 2 4 8 16 --duration 20
+    python utils/load_test_search.py --queries-file queries.txt --mode SIGLIP_COLLECTION --k 200
+"""
+import argparse
+import json
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+DEFAULT_QUERIES = [
+    "người đàn ông mặc áo đỏ đang chạy xe máy",
+    "a woman holding an umbrella in the rain",
+    "cảnh pháo hoa trên bầu trời đêm",
+    "a red car parked next to a tree",
+    "phóng viên đang phỏng vấn trên đường phố",
+    "a group of children playing football",
+    "bản đồ thời tiết trên bản tin",
+    "a dog running on the beach",
+]
+
+
+def percentile(values, q):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    idx = min(len(values) - 1, max(0, int(round(q / 100 * (len(values) - 1)))))
+    return values[idx]
+
+
+def run_level(args, queries, n_users):
+    latencies, errors = [], []
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + args.duration
+
+    def user(uid):
+        i = uid
+        while time.perf_counter() < stop_at:
+            params = {
+                "query": queries[i % len(queries)], "k": args.k, "mode": args.mode,
+                "colors": "a", "ocr": "a", "compact": 1,
+            }
+            if args.no_cache:
+                # thêm hậu tố để né cache embedding / cursor => đo đủ pipeline
+                params["query"] += f" {uid}-{i}"
+            url = f"{args.host}/search?{urllib.parse.urlencode(params)}"
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(url, timeout=args.timeout) as resp:
+                    json.loads(resp.read())
+                with lock:
+                    latencies.append((time.perf_counter() - start) * 1000)
+            except Exception as e:
+                with lock:
+                    errors.append(str(e))
+            i += n_users
+
+    threads = [threading.Thread(target=user, args=(u,)) for u in range(n_users)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return {
+        "users": n_users,
+        "rps": len(latencies) / elapsed,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "errors": len(errors),
+        "first_error": errors[0] if errors else "",
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test /search theo số user đồng thời")
+    parser.add_argument("--host", default="http://127.0.0.1:5000")
+    parser.add_argument("--users", nargs="+", type=int, default=[1, 2, 4, 8, 16])
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--k", type=int, default=100)
+    parser.add_argument("--mode", default="SIGLIP_COLLECTION")
+    parser.add_argument("--queries-file", default=None)
+    parser.add_argument("--no-cache", action="store_true", help="mỗi request 1 query khác nhau")
+    parser.add_argument("--timeout", type=float, default=60)
+    args = parser.parse_args()
+
+    queries = DEFAULT_QUERIES
+    if args.queries_file:
+        with open(args.queries_file, "r", encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+
+    rows = []
+    for n_users in args.users:
+        print(f"▶️  {n_users} user(s) trong {args.duration:.0f}s...")
+        row = run_level(args, queries, n_users)
+        rows.append(row)
+        if row["errors"]:
+            print(f"   ⚠️  {row['errors']} lỗi, vd: {row['first_error']}")
+
+    base = rows[0]["rps"] or float("nan")
+    print("\n" + "=" * 72)
+    print(f"{'users':>5s} {'req/s':>8s} {'scale':>6s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s} {'errors':>7s}")
+    print("-" * 72)
+    for r in rows:
+        print(f"{r['users']:5d} {r['rps']:8.2f} {r['rps'] / base:6.2f} "
+              f"{r['p50']:9.1f} {r['p95']:9.1f} {r['p99']:9.1f} {r['errors']:7d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Tune HNSW `ef` theo recall@k.
+
+Với mỗi k và mỗi ef trong lưới, đo recall@k của Milvus HNSW so với exact search
+(NumpyCollection trên chính các *_features.npy đã nạp vào Milvus), rồi ghi bảng
+collection -> k -> ef -> recall vào config.HNSW_EF_TABLE_PATH.
+Backend (EfSelector) đọc bảng này và chọn ef nhỏ nhất đạt config.HNSW_RECALL_TARGET.
+
+Query dùng để đo:
+- mặc định: lấy ngẫu nhiên --num-queries vector đã lưu
+- --queries-file: file text, mỗi dòng 1 query tiếng Anh (encode bằng model SigLIP)
+
+Chạy (trong thư mục backend):
+    python ../utils/tune_hnsw_ef.py --ks 100 500 1000 --ef-factors 1 1.25 1.5 2 3
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from pymilvus import Collection, connections
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+import config  # noqa: E402
+from src.ef_tuning import EfSelector, default_ef_grid, recall_at_k  # noqa: E402
+from src.fusion import keyframe_key  # noqa: E402
+from src.numpy_search import NumpyCollection  # noqa: E402
+
+SIGLIP_TAG = "ViT-SO400M-14-SigLIP-384"
+
+
+def encode_queries(path: str) -> np.ndarray:
+    import open_clip
+    import torch
+
+    with open(path, "r", encoding="utf-8") as f:
+        queries = [line.strip() for line in f if line.strip()]
+    model, _, _ = open_clip.create_model_and_transforms(
+        config.MODEL_NAME_SIGLIP, pretrained=config.PRETRAINED_SIGLIP, device="cpu"
+    )
+    model.eval()
+    tokenizer = open_clip.get_tokenizer(config.MODEL_NAME_SIGLIP)
+    with torch.no_grad():
+        feats = model.encode_text(tokenizer(queries))
+        feats = torch.nn.functional.normalize(feats, dim=-1)
+    return feats.numpy().astype(np.float32)
+
+
+def keys(hits):
+    return [keyframe_key(h.entity.get("path"))[0] for h in hits]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Đo recall@k của HNSW theo ef")
+    parser.add_argument("--collection", default=config.COLLECTION_HNSW_FINAL_FIRST_G)
+    parser.add_argument("--features-dir", default=os.path.join(config.FEATURES_BASE_DIR, "SigLip"))
+    parser.add_argument("--dim", type=int, default=1152)
+    parser.add_argument("--ks", nargs="+", type=int, default=[100, 200, 500, 1000])
+    parser.add_argument("--ef-factors", nargs="+", type=float, default=[1, 1.25, 1.5, 2, 2.5, 3])
+    parser.add_argument("--num-queries", type=int, default=200)
+    parser.add_argument("--queries-file", default=None)
+    parser.add_argument("--output", default=config.HNSW_EF_TABLE_PATH)
+    args = parser.parse_args()
+
+    exact = NumpyCollection(
+        features_dir=args.features_dir, packs=config.PACKS, dim=args.dim,
+        keyframes_base_dir=config.KEYFRAMES_BASE_DIR,
+        features_pattern=f"{{pack}}_{SIGLIP_TAG}_features.npy",
+        mapping_pattern=f"{{pack}}_{SIGLIP_TAG}_mapping.json",
+        name="exact"
+    )
+    queries = encode_queries(args.queries_file) if args.queries_file else exact.sample_vectors(args.num_queries)
+    print(f"📊 {len(queries)} queries")
+
+    connections.connect("default", host=config.MILVUS_HOST, port=config.MILVUS_PORT)
+    collection = Collection(args.collection)
+    collection.load()
+
+    max_k = max(args.ks)
+    start = time.perf_counter()
+    ground_truth = exact.search(queries, limit=max_k, output_fields=["path"])
+    ground_truth = [keys(hits) for hits in ground_truth]
+    print(f"✅ Exact top-{max_k} xong trong {time.perf_counter() - start:.1f}s")
+
+    results = {}
+    print(f"\n{'k':>6s} {'ef':>6s} {'recall@k':>9s} {'ms/query':>9s}")
+    for k in args.ks:
+        results[k] = {}
+        for ef in default_ef_grid(k, args.ef_factors):
+            start = time.perf_counter()
+            approx = collection.search(
+                data=queries.tolist(), anns_field="embedding",
+                param={"metric_type": "IP", "params": {"ef": ef}},
+                limit=k, output_fields=["path"]
+            )
+            ms = (time.perf_counter() - start) * 1000 / len(queries)
+            recall = float(np.mean([
+                recall_at_k(keys(hits), gt[:k]) for hits, gt in zip(approx, ground_truth)
+            ]))
+            results[k][ef] = recall
+            print(f"{k:6d} {ef:6d} {recall:9.4f} {ms:9.2f}")
+
+    EfSelector.save_table(args.output, args.collection, results)
+    print(f"\n💾 Đã ghi bảng vào {args.output}")
+
+    selector = EfSelector(args.output, recall_target=config.HNSW_RECALL_TARGET)
+    for k in args.ks:
+        print(f"   k={k:5d} -> ef={selector.select(k, args.collection)} (target {config.HNSW_RECALL_TARGET})")
+
+    connections.disconnect("default")
+
+
+if __name__ == "__main__":
+    main()